@@ -23,6 +23,9 @@ setup(name='mpd_ctrl',
           'aiompd',
           'zope.dottedname',
       ],  # 'quick2wire'],
+      # the pool tests talk to a fake server through aiompd internals
+      tests_require=['pytest', 'aiompd==0.2'],
+      extras_require={'test': ['pytest', 'aiompd==0.2']},
       entry_points={
           'console_scripts': [
               'zr = zr'
@@ -0,0 +1,16 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def loop(request):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def close():
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    request.addfinalizer(close)
+    return loop
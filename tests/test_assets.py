@@ -0,0 +1,253 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+import asyncio
+import gzip
+import os
+import socket
+
+import pytest
+
+from zr.web import assets
+
+
+class FakeTransport:
+    def __init__(self, buffered=0, ssl=False):
+        self.buffered = buffered
+        self.extra = {'socket': object(), 'sslcontext': object() if ssl else None}
+
+    def get_extra_info(self, name, default=None):
+        return self.extra.get(name, default)
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+needs_sendfile = pytest.mark.skipif(
+    not hasattr(os, 'sendfile'), reason='no os.sendfile')
+
+
+@needs_sendfile
+def test_sendfile_socket():
+    transport = FakeTransport()
+    assert assets._sendfile_socket(transport) is transport.extra['socket']
+
+
+def test_sendfile_socket_buffered():
+    # headers are still in the transport: sendfile would overtake them
+    assert assets._sendfile_socket(FakeTransport(buffered=120)) is None
+
+
+def test_sendfile_socket_tls():
+    assert assets._sendfile_socket(FakeTransport(ssl=True)) is None
+
+
+@needs_sendfile
+def test_sendfile(loop, tmpdir):
+    path = tmpdir.join('big.bin')
+    data = os.urandom(512 * 1024)
+    path.write_binary(data)
+
+    server, client = socket.socketpair()
+    server.setblocking(False)
+    received = bytearray()
+
+    def read():
+        received.extend(client.recv(1024 * 1024))
+
+    client.setblocking(False)
+    loop.add_reader(client.fileno(), read)
+
+    try:
+        with open(str(path), 'rb') as f:
+            loop.run_until_complete(
+                assets._sendfile(server, f, 1000, len(data) - 2000))
+
+        while len(received) < len(data) - 2000:
+            loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    finally:
+        loop.remove_reader(client.fileno())
+        server.close()
+        client.close()
+
+    assert bytes(received) == data[1000:-1000]
+
+
+TEXT = b'body { color: red; }\n' * 200
+
+
+def fake_br(data):
+    return b'BR' + gzip.compress(data)[:len(data) // 2]
+
+
+@pytest.fixture
+def root(tmpdir):
+    tmpdir.join('index.html').write_binary(b'<p>hello</p>\n' * 100)
+    tmpdir.join('app.css').write_binary(TEXT)
+    tmpdir.join('a.png').write_binary(os.urandom(1000))
+    tmpdir.join('b.png').write_binary(os.urandom(1000))
+    tmpdir.join('c.png').write_binary(os.urandom(1000))
+    return tmpdir
+
+
+@pytest.fixture
+def with_br(monkeypatch):
+    encoders = OrderedDict([('br', fake_br)])
+    encoders.update(assets.ENCODERS)
+    monkeypatch.setattr(assets, 'ENCODERS', encoders)
+
+
+def get(loop, cache, path, **headers):
+    request = SimpleNamespace(headers=headers)
+    return loop.run_until_complete(cache.response(request, path))
+
+
+def etags(cache, path):
+    return {e: etag for e, (_, etag) in cache.get(path).variants.items()}
+
+
+def test_negotiation(loop, root, with_br):
+    cache = assets.AssetCache(str(root))
+
+    response = get(loop, cache, 'app.css', **{'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.body == fake_br(TEXT)
+
+    response = get(loop, cache, 'app.css',
+                   **{'Accept-Encoding': 'br;q=0, GZIP'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.body) == TEXT
+
+    response = get(loop, cache, 'app.css')
+    assert 'Content-Encoding' not in response.headers
+    assert response.body == TEXT
+
+    # random bytes do not compress: only the identity variant
+    response = get(loop, cache, 'a.png', **{'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert list(cache.get('a.png').variants) == [None]
+
+
+def test_headers(loop, root):
+    cache = assets.AssetCache(str(root), max_age=60)
+
+    css = get(loop, cache, 'app.css', **{'Accept-Encoding': 'gzip'})
+    html = get(loop, cache, 'index.html')
+
+    assert css.headers['Vary'] == html.headers['Vary'] == 'Accept-Encoding'
+    assert css.headers['Content-Type'] == 'text/css'
+    assert css.headers['Cache-Control'] == 'public, max-age=60'
+    assert html.headers['Cache-Control'] == 'no-cache'  # revalidated
+
+
+def test_etags(loop, root, with_br):
+    cache = assets.AssetCache(str(root))
+    tags = etags(cache, 'app.css')
+
+    # strong and different for every encoding
+    assert set(tags) == {None, 'br', 'gzip'}
+    assert len(set(tags.values())) == 3
+    assert not any(t.startswith('W/') for t in tags.values())
+    assert tags['gzip'] == tags[None][:-1] + '-gzip"'
+
+    response = get(loop, cache, 'app.css', **{'Accept-Encoding': 'gzip'})
+    assert response.headers['ETag'] == tags['gzip']
+
+
+@pytest.mark.parametrize('header, status', [
+    ('{gzip}', 304),
+    ('"x", {gzip}', 304),
+    ('W/{gzip}', 304),
+    ('*', 304),
+    ('{identity}', 200),  # etag of another encoding
+    ('"0123456789abcdef"', 200),
+])
+def test_not_modified(loop, root, header, status):
+    cache = assets.AssetCache(str(root))
+    tags = etags(cache, 'app.css')
+    header = header.format(gzip=tags['gzip'], identity=tags[None])
+
+    response = get(loop, cache, 'app.css', **{
+        'Accept-Encoding': 'gzip', 'If-None-Match': header})
+
+    assert response.status == status
+    assert response.headers['ETag'] == tags['gzip']
+    assert cache.not_modified == (status == 304)
+
+
+def test_lru(root):
+    cache = assets.AssetCache(str(root), max_size=2500)
+
+    cache.get('a.png')
+    cache.get('b.png')
+    cache.get('a.png')  # b.png is the oldest now
+    cache.get('c.png')
+
+    assert list(cache._assets) == ['a.png', 'c.png']
+    assert cache.size == 2000
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.get('b.png')
+    assert list(cache._assets) == ['c.png', 'b.png']
+
+
+def test_rebuild(loop, root):
+    cache = assets.AssetCache(str(root))
+    etag = get(loop, cache, 'app.css').headers['ETag']
+
+    root.join('app.css').write_binary(b'p { margin: 0 }\n')
+
+    # the manifest holds until rebuild
+    assert get(loop, cache, 'app.css').headers['ETag'] == etag
+
+    cache.rebuild()
+    response = get(loop, cache, 'app.css', **{'If-None-Match': etag})
+
+    assert response.status == 200
+    assert response.headers['ETag'] != etag
+    assert response.body == b'p { margin: 0 }\n'
+    assert cache.size == len(response.body)
+
+
+def test_not_found(root):
+    cache = assets.AssetCache(str(root))
+
+    with pytest.raises(assets.HTTPNotFound):
+        cache.get('nope.css')
+
+
+@pytest.fixture
+def counting(monkeypatch):
+    calls = []
+
+    def encode(data):
+        calls.append(len(data))
+        return data[:len(data) * 8 // 10]
+
+    monkeypatch.setattr(
+        assets, 'ENCODERS', OrderedDict([('br', encode), ('gzip', encode)]))
+    return calls
+
+
+def test_large_over_max_size(root, counting):
+    root.join('big.css').write_binary(TEXT * 10)
+    cache = assets.AssetCache(str(root), max_size=len(TEXT) * 5,
+                              sendfile_threshold=1024)
+
+    for _ in range(3):
+        asset = cache.get('big.css')
+        assert asset.select('gzip, br') == (None, None, asset.entry.etag)
+
+    assert counting == []
+    assert (cache.hits, cache.misses, cache.size) == (2, 1, 0)
+
+
+def test_large_variants_do_not_fit(root, counting):
+    cache = assets.AssetCache(str(root), max_size=len(TEXT) * 3 // 2,
+                              sendfile_threshold=1024)
+
+    for _ in range(3):
+        assert cache.get('app.css').variants == {}
+
+    # both variants were made once (1.6 of the file) and thrown away
+    assert counting == [len(TEXT)] * 2
+    assert (cache.hits, cache.misses) == (2, 1)
@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from zr.mpd_ctrl.cache import MPDCache
+
+
+class FakeMPD:
+    """ Playlist of MPD: songs get new ids, positions follow the order
+    """
+    def __init__(self):
+        self.songs = []
+        self.next_id = 1
+        self.calls = 0
+
+    def add(self, file):
+        self.songs.append((self.next_id, file))
+        self.next_id += 1
+
+    def delete(self, pos):
+        del self.songs[pos]
+
+    def move(self, pos, to):
+        self.songs.insert(to, self.songs.pop(pos))
+
+    def clear(self):
+        self.songs = []
+
+    @asyncio.coroutine
+    def playlist(self):
+        self.calls += 1
+        return [{'file': file, 'id': id, 'pos': pos}
+                for pos, (id, file) in enumerate(self.songs)]
+
+
+@pytest.fixture
+def mpd():
+    mpd = FakeMPD()
+
+    for file in ['a.mp3', 'b.mp3', 'c.mp3']:
+        mpd.add(file)
+
+    return mpd
+
+
+def song(loop, cache, id=None, pos=None):
+    if id is not None:
+        found = loop.run_until_complete(cache.get_song(id))
+    else:
+        found = loop.run_until_complete(cache.get_song_at(pos))
+
+    return found and (found['file'], found['id'], found['pos'])
+
+
+def test_lookup(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+
+    assert song(loop, cache, id=2) == ('b.mp3', 2, 1)
+    assert song(loop, cache, pos=2) == ('c.mp3', 3, 2)
+    assert song(loop, cache, id=7) is None
+    assert song(loop, cache, pos=3) is None
+
+
+def test_add(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    song(loop, cache, id=1)
+    mpd.add('d.mp3')
+
+    assert song(loop, cache, id=4) == ('d.mp3', 4, 3)
+    assert song(loop, cache, pos=3) == ('d.mp3', 4, 3)
+
+
+def test_delete(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    song(loop, cache, id=1)
+    mpd.delete(0)
+
+    assert song(loop, cache, id=1) is None
+    assert song(loop, cache, pos=0) == ('b.mp3', 2, 0)
+    assert song(loop, cache, pos=2) is None
+
+
+def test_move(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    song(loop, cache, id=1)
+    mpd.move(2, 0)
+
+    assert song(loop, cache, id=3) == ('c.mp3', 3, 0)
+    assert song(loop, cache, pos=1) == ('a.mp3', 1, 1)
+
+
+def test_clear(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    song(loop, cache, id=1)
+    mpd.clear()
+
+    assert song(loop, cache, id=1) is None
+    assert song(loop, cache, pos=0) is None
+
+
+def test_rebuild_on_version(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    song(loop, cache, id=1)
+    index = cache._index
+
+    # same playlist from MPD: the version and the index are kept
+    song(loop, cache, id=2)
+    assert cache._index is index
+    assert index.version == cache.playlist_version == 1
+
+    mpd.add('d.mp3')
+    song(loop, cache, id=2)
+    assert cache._index is not index
+    assert cache._index.version == cache.playlist_version == 2
+
+
+def test_live(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    cache._set_playlist(loop.run_until_complete(mpd.playlist()))
+    cache._live = True
+    cache._slot.client = SimpleNamespace(_transport=object())
+    calls = mpd.calls
+
+    assert song(loop, cache, id=3) == ('c.mp3', 3, 2)
+
+    # the watcher brings the new playlist
+    mpd.move(0, 2)
+    cache._set_playlist(loop.run_until_complete(mpd.playlist()))
+
+    assert song(loop, cache, id=1) == ('a.mp3', 1, 2)
+    assert mpd.calls == calls + 1
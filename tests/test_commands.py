@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from zr.mpd_ctrl.commands import CommandError, add_many, command_list, idle
+
+
+class FakeClient:
+    """ aiompd.Client internals with scripted replies, one per write
+
+    A reply is bytes, list of chunks or None for no answer.
+    """
+    def __init__(self, loop, *replies):
+        self._lock = asyncio.Lock(loop=loop)
+        self._received_data = asyncio.Queue(loop=loop)
+        self._transport = self
+        self.replies = list(replies)
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(data.decode('utf8'))
+        reply = self.replies.pop(0)
+
+        if isinstance(reply, bytes):
+            reply = [reply]
+
+        for chunk in reply or []:
+            self._received_data.put_nowait(chunk)
+
+
+def run(loop, coro):
+    return loop.run_until_complete(coro)
+
+
+def test_command_list(loop):
+    mpd = FakeClient(loop, [b'Id: 1\nlist_OK\nlist_OK\nvolume: 5\n',
+                            b'state: play\nlist_OK\nOK\n'])
+
+    replies = run(loop, command_list(
+        mpd, [('addid', 'say "hi"\\'), ('clear',), ('status',)]))
+
+    assert replies == [['Id: 1'], [], ['volume: 5', 'state: play']]
+    assert mpd.sent == [
+        'command_list_ok_begin\n'
+        'addid "say \\"hi\\"\\\\"\n'
+        'clear\n'
+        'status\n'
+        'command_list_end\n'
+    ]
+
+
+def test_command_list_empty(loop):
+    mpd = FakeClient(loop)
+
+    assert run(loop, command_list(mpd, [])) == []
+    assert mpd.sent == []
+
+
+def test_command_list_error(loop):
+    mpd = FakeClient(
+        loop, b'list_OK\nACK [50@1] {addid} No such directory\n')
+
+    first, error, last = run(loop, command_list(
+        mpd, [('clear',), ('addid', 'nope'), ('play',)]))
+
+    assert first == []
+    assert isinstance(error, CommandError)
+    assert (error.code, error.index, error.command, error.message) == \
+        (50, 1, 'addid', 'No such directory')
+    assert last is None  # the server stops at the failed command
+
+
+def test_command_list_closed(loop):
+    mpd = FakeClient(loop)
+    mpd._transport = None
+
+    with pytest.raises(RuntimeError):
+        run(loop, command_list(mpd, [('clear',)]))
+
+
+def test_add_many_resend(loop):
+    mpd = FakeClient(
+        loop,
+        b'list_OK\nId: 1\nlist_OK\nACK [50@2] {addid} No such\n',
+        b'Id: 3\nlist_OK\nlist_OK\nOK\n',
+    )
+
+    results = run(loop, add_many(
+        mpd, ['a', 'b', 'c'], before=[('clear',)], after=[('play',)]))
+
+    assert results == [
+        {'file': 'a', 'id': 1},
+        {'file': 'b', 'error': 'No such'},
+        {'file': 'c', 'id': 3},
+    ]
+    # `clear` is not repeated, the list goes on after the failed url
+    assert mpd.sent[1] == \
+        'command_list_ok_begin\naddid "c"\nplay\ncommand_list_end\n'
+
+
+def test_add_many_last_fails(loop):
+    mpd = FakeClient(loop, b'Id: 1\nlist_OK\nACK [50@1] {addid} No such\n')
+
+    results = run(loop, add_many(mpd, ['a', 'b']))
+
+    assert results == [{'file': 'a', 'id': 1}, {'file': 'b', 'error': 'No such'}]
+    assert len(mpd.sent) == 1
+
+
+def test_add_many_before_fails(loop):
+    mpd = FakeClient(loop, b'ACK [5@0] {clear} denied\n')
+
+    with pytest.raises(CommandError) as info:
+        run(loop, add_many(mpd, ['a'], before=[('clear',)]))
+
+    assert info.value.command == 'clear'
+
+
+def test_idle(loop):
+    mpd = FakeClient(loop, b'changed: player\nchanged: mixer\nOK\n')
+
+    changed = run(loop, idle(mpd, ['player', 'mixer'], timeout=1))
+
+    assert changed == {'player', 'mixer'}
+    assert mpd.sent == ['idle player mixer\n']
+
+
+def test_idle_timeout(loop):
+    mpd = FakeClient(loop, None, b'OK\n')
+    start = loop.time()
+
+    changed = run(loop, idle(mpd, timeout=0.05))
+
+    assert changed == set()
+    assert mpd.sent == ['idle\n', 'noidle\n']
+    assert 0.04 < loop.time() - start < 0.5
+
+
+def test_idle_noidle_timeout(loop):
+    mpd = FakeClient(loop, None, None)
+
+    with pytest.raises(asyncio.TimeoutError):
+        run(loop, idle(mpd, timeout=0.02))
+
+    assert mpd.sent == ['idle\n', 'noidle\n']
+
+
+def test_idle_error(loop):
+    mpd = FakeClient(loop, b'ACK [2@0] {idle} Unrecognized idle event\n')
+
+    with pytest.raises(CommandError):
+        run(loop, idle(mpd, ['nope']))
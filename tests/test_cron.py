@@ -0,0 +1,203 @@
+import asyncio
+import calendar
+from datetime import date, datetime, timezone
+import os
+import time
+
+import pytest
+
+from zr.lib.cron import Rule, Scheduler, SimClock, parse_weekdays
+
+
+def ts(*args):
+    """ UTC epoch seconds of the date and time
+    """
+    return calendar.timegm(datetime(*args).timetuple())
+
+
+def utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+@pytest.fixture
+def berlin(request):
+    old = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Berlin'
+    time.tzset()
+
+    def restore():
+        if old is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = old
+
+        time.tzset()
+
+    request.addfinalizer(restore)
+
+
+def test_parse_weekdays():
+    assert parse_weekdays(None) == set(range(7))
+    assert parse_weekdays('mon-fri') == {0, 1, 2, 3, 4}
+    assert parse_weekdays('Sat, sun') == {5, 6}
+    assert parse_weekdays(['mon', 'wed-thu']) == {0, 2, 3}
+
+
+def test_weekdays():
+    rule = Rule('07:00', weekdays='mon-fri')
+
+    # friday 2015-01-02 after the start -> monday
+    assert rule.next_after(ts(2015, 1, 2, 8)) == ts(2015, 1, 5, 7)
+    assert rule.next_after(ts(2015, 1, 5, 6, 59)) == ts(2015, 1, 5, 7)
+    assert rule.next_after(ts(2015, 1, 5, 7)) == ts(2015, 1, 6, 7)
+
+
+def test_overrides():
+    rule = Rule('07:00', weekdays='mon-fri', overrides={
+        'sat': '09:30',
+        'mon': None,
+        '2015-01-06': '08:15:30',
+        '2015-01-07': None,
+    })
+
+    assert rule.next_after(ts(2015, 1, 2, 8)) == ts(2015, 1, 3, 9, 30)
+    assert rule.next_after(ts(2015, 1, 3, 10)) == ts(2015, 1, 6, 8, 15, 30)
+    assert rule.next_after(ts(2015, 1, 6, 9)) == ts(2015, 1, 8, 7)
+    assert rule.time_for(date(2015, 1, 4)) is None
+
+
+def test_bad_timezone():
+    with pytest.raises(ValueError):
+        Rule('07:00', timezone='Europe/Berlin')
+
+
+def test_local_timezone(berlin):
+    rule = Rule('07:00', timezone='local')
+
+    assert rule.next_after(ts(2015, 1, 1)) == ts(2015, 1, 1, 6)  # CET
+    assert rule.next_after(ts(2015, 7, 1)) == ts(2015, 7, 1, 5)  # CEST
+    assert Rule('07:00').next_after(ts(2015, 7, 1)) == ts(2015, 7, 1, 7)
+
+
+@pytest.mark.parametrize('day, hours', [
+    ((2015, 3, 28), 23),  # spring forward
+    ((2015, 10, 24), 25),  # fall back
+])
+def test_dst(berlin, day, hours):
+    rule = Rule('07:00', timezone='local')
+    first = rule.next_after(ts(*day))
+    second = rule.next_after(first)
+
+    assert second - first == hours * 3600
+    assert time.localtime(first).tm_hour == 7
+    assert time.localtime(second).tm_hour == 7
+
+
+def test_dst_missing_hour(berlin):
+    # 02:30 does not exist on 2015-03-29, it fires once that day anyway
+    rule = Rule('02:30', timezone='local')
+    fires = [rule.next_after(ts(2015, 3, 28))]
+
+    for _ in range(2):
+        fires.append(rule.next_after(fires[-1]))
+
+    assert [time.localtime(f).tm_mday for f in fires] == [28, 29, 30]
+
+
+def test_year(berlin):
+    start = ts(2015, 1, 1)
+    clock = SimClock(start)
+    scheduler = Scheduler(clock=clock)
+    calls = []
+    scheduler.add('wakeup', Rule('07:00', weekdays='mon-fri',
+                                 timezone='local'),
+                  lambda name, when: calls.append((clock.time(), when)))
+
+    fired = scheduler.run_until(ts(2016, 1, 1))
+
+    assert len(fired) == len(calls) == 261  # weekdays of 2015
+    assert scheduler.missed == 0
+    assert clock.time() == ts(2016, 1, 1)
+    assert all(now == when for now, when in calls)
+    assert {time.localtime(when).tm_hour for when, _ in fired} == {7}
+    assert {time.localtime(when).tm_wday for when, _ in fired} == set(range(5))
+
+
+def test_lead():
+    clock = SimClock(ts(2015, 1, 1))
+    scheduler = Scheduler(clock=clock)
+    calls = []
+    scheduler.add('wakeup', Rule('07:00'),
+                  lambda name, when: calls.append((clock.time(), when)),
+                  lead=15)
+
+    assert scheduler.next_runs(1) == [(utc(ts(2015, 1, 1, 7)), 'wakeup')]
+
+    scheduler.run_until(ts(2015, 1, 2))
+
+    assert calls == [(ts(2015, 1, 1, 6, 59, 45), ts(2015, 1, 1, 7))]
+
+
+def test_misfire_grace():
+    clock = SimClock(ts(2015, 1, 1))
+    scheduler = Scheduler(clock=clock, misfire_grace=300)
+    scheduler.add('wakeup', Rule('07:00'), lambda name, when: None)
+
+    clock.jump(7 * 3600 + 200)  # late, but within the grace
+    assert scheduler.advance() == [(ts(2015, 1, 1, 7), 'wakeup')]
+
+    clock.jump(86400 + 3600)  # NTP moved the clock a day forward
+    assert scheduler.advance() == []
+    assert scheduler.missed == 1
+    assert scheduler.next_runs(1) == [(utc(ts(2015, 1, 3, 7)), 'wakeup')]
+
+
+def test_run_until_overdue():
+    clock = SimClock(ts(2015, 1, 1))
+    scheduler = Scheduler(clock=clock)
+    scheduler.add('wakeup', Rule('07:00'), lambda name, when: None)
+
+    clock.jump(8 * 3600)
+    scheduler.run_until(ts(2015, 1, 1, 9))
+
+    # the overdue start is missed, the clock is not turned back to it
+    assert clock.time() == ts(2015, 1, 1, 9)
+    assert scheduler.missed == 1
+    assert scheduler.fired == 0
+
+
+def test_next_runs():
+    clock = SimClock(ts(2015, 1, 1))
+    scheduler = Scheduler(clock=clock)
+    scheduler.add('a', Rule('07:00'), lambda name, when: None)
+    scheduler.add('b', Rule('08:00', weekdays='sat'), lambda name, when: None)
+
+    assert scheduler.next_runs(4) == [
+        (utc(ts(2015, 1, 1, 7)), 'a'),
+        (utc(ts(2015, 1, 2, 7)), 'a'),
+        (utc(ts(2015, 1, 3, 7)), 'a'),
+        (utc(ts(2015, 1, 3, 8)), 'b'),
+    ]
+    assert scheduler.next_runs(10, until=ts(2015, 1, 2, 7)) == [
+        (utc(ts(2015, 1, 1, 7)), 'a'),
+        (utc(ts(2015, 1, 2, 7)), 'a'),
+    ]
+    assert scheduler.fired == 0
+
+
+def test_jump_back_rearms(loop):
+    clock = SimClock(ts(2015, 1, 1, 12))
+    scheduler = Scheduler(clock=clock, loop=loop, max_sleep=0.01)
+    scheduler.add('wakeup', Rule('07:00'), lambda name, when: None)
+    assert scheduler.next_runs(1) == [(utc(ts(2015, 1, 2, 7)), 'wakeup')]
+
+    scheduler.start()
+    loop.run_until_complete(asyncio.sleep(0.02, loop=loop))
+
+    clock.jump(-6 * 3600)  # RTC-less boot, then NTP
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    scheduler.stop()
+    loop.run_until_complete(asyncio.sleep(0, loop=loop))
+
+    assert scheduler.jumps == 1
+    assert scheduler.next_runs(1) == [(utc(ts(2015, 1, 1, 7)), 'wakeup')]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from zr.lib import loopmon
+from zr.lib.loopmon import LoopMonitor
+
+
+@pytest.fixture
+def monitor(request, loop):
+    def make(**kwargs):
+        monitor = LoopMonitor(loop, **kwargs)
+        monitor.start()
+        request.addfinalizer(monitor.stop)
+        return monitor
+
+    return make
+
+
+def blocking():
+    time.sleep(0.15)
+
+
+def test_profile_off_by_default(loop, monitor):
+    monitor(interval=0.01)
+
+    assert asyncio.events.Handle._run is loopmon._handle_run
+
+
+def test_lag(loop, monitor):
+    m = monitor(interval=0.01, threshold=1)
+    loop.call_later(0.005, blocking)
+    loop.run_until_complete(asyncio.sleep(0.2, loop=loop))
+
+    assert m.lag_max >= 0.1
+    assert m.stats()['stalls'] == []
+
+
+def test_stall_stack(loop, monitor):
+    m = monitor(interval=0.01, threshold=0.05)
+    loop.call_later(0.005, blocking)
+    loop.run_until_complete(asyncio.sleep(0.2, loop=loop))
+
+    assert len(m.stalls) == 1
+    assert any('blocking' in line for line in m.stalls[0]['stack'])
+
+
+def test_profile(loop, monitor):
+    m = monitor(interval=0.01, threshold=1, slow=0.1, profile=True)
+    assert asyncio.events.Handle._run is loopmon._timed_run
+
+    loop.call_soon(blocking)
+    loop.call_soon(lambda: None)
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+
+    slowest = m.slowest()
+    assert len(slowest) == 1
+    assert slowest[0]['duration'] >= 0.1
+    assert 'blocking' in slowest[0]['callback']
+
+    m.stop()
+    assert asyncio.events.Handle._run is loopmon._handle_run
+
+
+def test_stalls_reported_once(loop, monitor):
+    m = monitor(interval=0.01, threshold=0.05)
+    loop.call_later(0.005, blocking)
+    loop.call_later(0.1, blocking)
+    loop.run_until_complete(asyncio.sleep(0.4, loop=loop))
+
+    assert len(m.stalls) == 2
+
+
+def test_profile_wraps_current(loop, monitor, monkeypatch):
+    calls = []
+    wrapped = asyncio.events.Handle._run
+
+    def other(handle):
+        calls.append(handle)
+        return wrapped(handle)
+
+    monkeypatch.setattr(loopmon, '_handle_run', loopmon._handle_run)
+    monkeypatch.setattr(asyncio.events.Handle, '_run', other)
+
+    m = monitor(interval=0.01, threshold=1, profile=True)
+    loop.run_until_complete(asyncio.sleep(0.02, loop=loop))
+
+    assert asyncio.events.Handle._run is loopmon._timed_run
+    assert calls  # the wrapper found in place is still called
+
+    m.stop()
+    assert asyncio.events.Handle._run is other
+
+
+def test_profile_wrapped_again(loop, monitor, monkeypatch):
+    monkeypatch.setattr(loopmon, '_handle_run', loopmon._handle_run)
+    m = monitor(interval=0.01, threshold=1, slow=0.1, profile=True)
+    timed = asyncio.events.Handle._run
+
+    def other(handle):
+        return timed(handle)
+
+    monkeypatch.setattr(asyncio.events.Handle, '_run', other)
+    m.stop()
+
+    # stop() does not cut out the wrapper installed over ours
+    assert asyncio.events.Handle._run is other
+
+    loop.call_soon(blocking)
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    assert m.slowest() == []
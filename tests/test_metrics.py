@@ -0,0 +1,91 @@
+import pytest
+
+from zr.lib import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+
+def test_counter(registry):
+    counter = metrics.counter(
+        'zr_test_total', 'Requests\nby "view" \\ path', ['view'],
+        registry=registry)
+    counter.labels('root').inc()
+    counter.labels('a "b"\\c\nd').inc(2)
+
+    assert registry.exposition() == (
+        '# HELP zr_test_total Requests\\nby "view" \\\\ path\n'
+        '# TYPE zr_test_total counter\n'
+        'zr_test_total{view="a \\"b\\"\\\\c\\nd"} 2\n'
+        'zr_test_total{view="root"} 1\n'
+    )
+
+
+def test_gauge(registry):
+    metrics.gauge('zr_test_depth', 'Depth', registry=registry).set(3)
+    metrics.gauge('zr_test_load', 'Load', func=lambda: 0.25,
+                  registry=registry)
+    metrics.gauge('zr_test_inf', 'Inf', func=lambda: metrics.INF,
+                  registry=registry)
+
+    assert registry.exposition().split('\n')[2::3] == [
+        'zr_test_depth 3',
+        'zr_test_inf +Inf',
+        'zr_test_load 0.25',
+    ]
+
+
+def test_histogram(registry):
+    histogram = metrics.histogram(
+        'zr_test_seconds', 'Latency', ['lane'], buckets=(0.1, 1, 0.5),
+        registry=registry)
+    child = histogram.labels('idle')
+
+    for value in [0.05, 0.1, 0.3, 0.7, 2]:
+        child.observe(value)
+
+    # buckets are cumulative, a value on a bound is counted in it
+    assert registry.exposition() == (
+        '# HELP zr_test_seconds Latency\n'
+        '# TYPE zr_test_seconds histogram\n'
+        'zr_test_seconds_bucket{lane="idle",le="0.1"} 2\n'
+        'zr_test_seconds_bucket{lane="idle",le="0.5"} 3\n'
+        'zr_test_seconds_bucket{lane="idle",le="1.0"} 4\n'
+        'zr_test_seconds_bucket{lane="idle",le="+Inf"} 5\n'
+        'zr_test_seconds_sum{lane="idle"} 3.15\n'
+        'zr_test_seconds_count{lane="idle"} 5\n'
+    )
+
+
+def test_histogram_empty(registry):
+    metrics.histogram('zr_test_depth', 'Depth', buckets=(0, 1),
+                      registry=registry)
+
+    assert registry.exposition().split('\n')[2:-1] == [
+        'zr_test_depth_bucket{le="0.0"} 0',
+        'zr_test_depth_bucket{le="1.0"} 0',
+        'zr_test_depth_bucket{le="+Inf"} 0',
+        'zr_test_depth_sum 0',
+        'zr_test_depth_count 0',
+    ]
+
+
+def test_register(registry):
+    first = metrics.counter('zr_test_total', 'Test', registry=registry)
+
+    assert metrics.counter('zr_test_total', 'Test', registry=registry) is first
+
+    with pytest.raises(ValueError):
+        metrics.gauge('zr_test_total', 'Test', registry=registry)
+
+
+def test_labels_count(registry):
+    counter = metrics.counter(
+        'zr_test_total', 'Test', ['a', 'b'], registry=registry)
+
+    assert counter.labels('x', 'y') is counter.labels('x', 'y')
+
+    with pytest.raises(ValueError):
+        counter.labels('x')
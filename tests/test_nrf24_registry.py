@@ -0,0 +1,172 @@
+import pytest
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.mnemonic import EN_RXADDR, RF_CH, SETUP_RETR
+from zr.lib.nrf24.registry import (
+    CONFIG_R, EN_AA_R, EN_RXADDR_R, FIFO_STATUS_R, RF_SETUP_R, SETUP_AW_R,
+    SETUP_RETR_R)
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+
+@pytest.fixture
+def sim():
+    return SimulatedNRF24()
+
+
+@pytest.fixture
+def radio(sim):
+    radio = NRF24(backend=sim)
+    radio.__enter__()
+    return radio
+
+
+def xfers(sim, call):
+    """ Result of call and count of SPI transactions it made
+    """
+    before = sim.xfers
+    result = call()
+    return result, sim.xfers - before
+
+
+def test_repeat_reads_are_free(sim, radio):
+    registry = radio._registry
+    registry.invalidate()
+    hits, misses = registry.hits, registry.misses
+
+    assert xfers(sim, lambda: int(registry['RF_CH'])) == (2, 1)
+    assert xfers(sim, lambda: int(registry['RF_CH'])) == (2, 0)
+    assert xfers(sim, lambda: registry['RX_PW_P0']) == (32, 1)
+    assert xfers(sim, lambda: registry['RX_PW_P0']) == (32, 0)
+    assert xfers(sim, lambda: registry.read_bits('EN_AA', 1)) == (False, 1)
+    assert xfers(sim, lambda: registry.read_bits('EN_AA', 1)) == (False, 0)
+    assert registry.misses - misses == 3
+    assert registry.hits - hits == 3
+
+
+def test_writes_go_through(sim, radio):
+    registry = radio._registry
+
+    assert xfers(sim, lambda: registry.__setitem__('RF_CH', 40)) == (None, 1)
+    assert sim.registers[RF_CH] == [40]
+    assert xfers(sim, lambda: int(registry['RF_CH'])) == (40, 0)
+
+    _, count = xfers(sim, lambda: registry.write_bits('EN_AA', 0b10, True))
+    assert count == 1  # the byte comes from the shadow
+    assert xfers(sim, lambda: int(registry['EN_AA'])) == (0b10, 0)
+
+
+@pytest.mark.parametrize('name', ['STATUS', 'FIFO_STATUS', 'OBSERVE_TX', 'CD'])
+def test_volatile_always_read(sim, radio, name):
+    registry = radio._registry
+
+    for _ in range(3):
+        assert xfers(sim, lambda: registry[name])[1] == 1
+
+
+def test_volatile_sees_chip_changes(sim, radio):
+    pipe = radio.pipes[1]
+    pipe.address = 0xc2c2c2c2c2
+    pipe.payload_length = 2
+    pipe.enabled = True
+    radio.status = NRF24.STATUS.rx
+
+    assert not radio.rx_ready
+    assert not radio._registry['FIFO_STATUS']['RX_FULL']
+
+    sim.transmit(0xc2c2c2c2c2, b'ab')
+
+    assert radio.rx_ready
+    assert not radio._registry['FIFO_STATUS']['RX_EMPTY']
+
+
+def test_invalidate(sim, radio):
+    registry = radio._registry
+    int(registry['RF_CH'])
+    int(registry['RF_SETUP'])
+
+    sim.registers[RF_CH] = [70]  # changed behind our back
+    assert int(registry['RF_CH']) == 2
+
+    registry.invalidate('RF_CH')
+    assert xfers(sim, lambda: int(registry['RF_CH'])) == (70, 1)
+    assert xfers(sim, lambda: int(registry['RF_SETUP']))[1] == 0
+
+    registry.invalidate()
+    assert xfers(sim, lambda: int(registry['RF_SETUP']))[1] == 1
+
+
+def test_sync(sim, radio):
+    registry = radio._registry
+    sim.registers[RF_CH] = [70]
+
+    _, count = xfers(sim, registry.sync)
+
+    assert count == len(registry.names()) - len(registry.VOLATILE)
+    assert xfers(sim, lambda: int(registry['RF_CH'])) == (70, 0)
+
+
+def test_shadow_off(sim):
+    radio = NRF24(backend=sim, shadow_registers=False)
+    radio.__enter__()
+    registry = radio._registry
+
+    for _ in range(2):
+        assert xfers(sim, lambda: int(registry['RF_CH'])) == (2, 1)
+
+    assert registry.hits == registry.misses == 0
+
+
+def test_defaults():
+    assert CONFIG_R._DATA == 0b00001000
+    assert SETUP_AW_R._DATA == 0b11
+    assert SETUP_RETR_R._DATA == 0b00000011
+    assert RF_SETUP_R._DATA == 0b00001111
+    assert FIFO_STATUS_R._DATA == 0b00010001
+    assert EN_AA_R._DATA == 0b00111111  # explicit _DATA is kept
+
+
+def test_fields():
+    field = SETUP_RETR_R._FIELDS['ARD']
+    assert (field.shift, field.mask, field.flag) == (4, 0b1111, False)
+
+    field = CONFIG_R._FIELDS['PWR_UP']
+    assert (field.shift, field.mask, field.flag) == (1, 1, True)
+
+
+def test_keys():
+    assert EN_AA_R._KEYS[3] == EN_AA_R._KEYS['ENAA_P3'] == 0b1000
+    assert 'ERX_P5' in EN_RXADDR_R._KEYS
+    assert 'ENAA_P5' not in EN_RXADDR_R._KEYS
+
+
+def test_get_set_fields(sim, radio):
+    registry = radio._registry
+    registry['SETUP_RETR']['ARD'] = 0b0101
+
+    assert registry['SETUP_RETR']['ARD'] == 0b0101
+    assert registry['SETUP_RETR']['ARC'] == 0b0011  # untouched
+    assert sim.registers[SETUP_RETR] == [0b01010011]
+
+    registry['CONFIG']['CRCO'] = 1
+    assert registry['CONFIG']['CRCO'] is True
+    assert registry['CONFIG']['EN_CRC'] is True
+    assert registry['CONFIG']['PRIM_RX'] is False
+
+    with pytest.raises(AttributeError):
+        registry['CONFIG']['NOPE']
+
+    with pytest.raises(KeyError):
+        registry['EN_AA']['ERX_P1']
+
+
+def test_bits_match_registers(sim, radio):
+    registry = radio._registry
+    registry['EN_RXADDR']['ERX_P4'] = True
+    registry.write_bits('EN_RXADDR', 0b11, True)
+    registry.write_bits('EN_RXADDR', 0b01, False)
+
+    assert int(registry['EN_RXADDR']) == 0b00010010
+    assert registry['EN_RXADDR']['ERX_P1']
+    assert registry.read_bits('EN_RXADDR', 0b10000)
+    assert not registry.read_bits('EN_RXADDR', 0b1)
+    assert sim.registers[EN_RXADDR] == [0b00010010]
@@ -0,0 +1,166 @@
+import pytest
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.mnemonic import R_RX_PL_WID, STATUS, W_REGISTER
+from zr.lib.nrf24.pipe import Pipe
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+ADDRESS = 0xc2c2c2c2c2
+
+
+class LateSim(SimulatedNRF24):
+    """ A payload arrives right after RX_DR is cleared
+    """
+    late = None
+
+    def _end(self):
+        cmd = self._frame['cmd'] if self._frame is not None else None
+        super()._end()
+
+        if cmd == W_REGISTER | STATUS and self.late is not None:
+            late, self.late = self.late, None
+            self.transmit(ADDRESS, late)
+
+
+class BlockedPipe(Pipe):
+    blocked = True
+
+
+def open_radio(sim, dynamic=False, pipe_class=Pipe):
+    radio = NRF24(backend=sim)
+    radio.__enter__()
+
+    pipe = radio.pipes[1] = pipe_class(radio, 1)
+    pipe.address = ADDRESS
+    pipe.payload_length = 2
+    pipe.enabled = True
+
+    if dynamic:
+        radio._registry['FEATURE']['EN_DPL'] = True
+        pipe.dynamic_payload = True
+
+    radio.status = NRF24.STATUS.rx
+    return radio, pipe
+
+
+def commands(sim, radio, call):
+    """ Result of call and list of SPI commands it sent
+    """
+    sent = []
+    xfer = sim.xfer
+
+    def spy(buf):
+        if sim._frame is None or sim._frame['cmd'] is None:
+            sent.append(buf[0])
+
+        return xfer(buf)
+
+    sim.xfer = spy
+
+    try:
+        return call(), sent
+    finally:
+        sim.xfer = xfer
+
+
+def drain(pipe):
+    items = []
+
+    while pipe.has_data():
+        items.append(pipe.receive())
+
+    return items
+
+
+@pytest.fixture
+def sim():
+    return SimulatedNRF24()
+
+
+def test_drain(sim):
+    radio, pipe = open_radio(sim)
+
+    for n in range(3):
+        assert sim.transmit(ADDRESS, bytes([n, n]))
+
+    assert radio.rx_ready
+    assert radio.read_rx_fifo() == {1: 3}
+    assert drain(pipe) == [b'\0\0', b'\1\1', b'\2\2']
+    assert not sim.rx_fifo
+    assert not radio.rx_ready
+
+
+def test_count(sim):
+    radio, pipe = open_radio(sim)
+
+    for n in range(3):
+        sim.transmit(ADDRESS, bytes([n, n]))
+
+    assert radio.read_rx_fifo(2) == {1: 2}
+    assert len(sim.rx_fifo) == 1
+    assert radio.rx_ready  # not drained: RX_DR stays
+
+
+def test_empty(sim):
+    radio, pipe = open_radio(sim)
+
+    assert radio.read_rx_fifo() == {}
+    assert not radio.rx_ready
+
+
+def test_late_payload(sim):
+    sim = LateSim()
+    radio, pipe = open_radio(sim)
+    sim.transmit(ADDRESS, b'ab')
+    sim.late = b'cd'
+
+    # RX_DR is cleared first, then RX_EMPTY shows the late payload
+    assert radio.read_rx_fifo() == {1: 2}
+    assert drain(pipe) == [b'ab', b'cd']
+    assert not radio.rx_ready
+    assert not sim.rx_fifo
+
+
+def test_dynamic_widths(sim):
+    radio, pipe = open_radio(sim, dynamic=True)
+
+    for payload in [b'a', b'abcdefg', b'x' * 32]:
+        assert sim.transmit(ADDRESS, payload)
+
+    received, sent = commands(sim, radio, radio.read_rx_fifo)
+
+    assert received == {1: 3}
+    assert drain(pipe) == [b'a', b'abcdefg', b'x' * 32]
+    assert sent.count(R_RX_PL_WID) == 4  # and one on the empty fifo
+
+
+def test_fixed_width_pipe_with_dpl(sim):
+    radio, pipe = open_radio(sim, dynamic=True)
+    pipe.dynamic_payload = False
+    sim.transmit(ADDRESS, b'ab')
+
+    assert radio.read_rx_fifo() == {1: 1}
+    assert drain(pipe) == [b'ab']
+
+
+def test_bad_width_flushes(sim):
+    radio, pipe = open_radio(sim, dynamic=True)
+    sim.rx_fifo.append((1, b'x' * 33))  # corrupted on the air
+    sim.rx_fifo.append((1, b'ab'))
+
+    assert radio.read_rx_fifo() == {}
+    assert not sim.rx_fifo
+    assert drain(pipe) == []
+
+
+def test_blocked(sim):
+    radio, pipe = open_radio(sim, pipe_class=BlockedPipe)
+    sim.transmit(ADDRESS, b'ab')
+
+    received, sent = commands(sim, radio, radio.read_rx_fifo)
+
+    # nothing is read: the payload waits in the fifo, RX_DR stays
+    assert received == {}
+    assert sent == []
+    assert len(sim.rx_fifo) == 1
+    assert radio.rx_ready
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+from zr.lib.nrf24 import NRF24, timing
+from zr.lib.nrf24.mnemonic import NOP, R_REGISTER, RF_CH, W_REGISTER
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(timing, 'time', SimpleNamespace(sleep=sleeps.append))
+    return sleeps
+
+
+def test_get_profile():
+    assert timing.get_profile('nrf24l01') is timing.NRF24L01
+    assert timing.get_profile('rpi') is timing.NRF24L01
+    assert timing.get_profile('slow') is timing.SLOW
+
+    custom = timing.NRF24L01._replace(tx_poll=0.01)
+    assert timing.get_profile(custom) is custom
+
+    with pytest.raises(KeyError):
+        timing.get_profile('fast')
+
+
+def test_delay(sleeps):
+    timing.delay(0)
+    timing.delay(timing.NRF24L01.csn_hold)
+    timing.delay(timing.MIN_SLEEP / 2)
+    timing.delay(timing.MIN_SLEEP)
+    timing.delay(0.001)
+
+    assert sleeps == [timing.MIN_SLEEP, 0.001]
+
+
+def test_spi_without_sleeps(sleeps):
+    radio = NRF24(backend=SimulatedNRF24())
+    radio.__enter__()
+    del sleeps[:]
+
+    for _ in range(10):
+        radio._read_register(RF_CH)
+
+    # csn setup and hold are nanoseconds: no sleep in the SPI frame
+    assert sleeps == []
+
+
+def test_slow_profile(sleeps):
+    radio = NRF24(backend=SimulatedNRF24(), timing='slow')
+    radio.__enter__()
+    del sleeps[:]
+
+    radio._read_register(RF_CH)
+
+    assert sleeps == [timing.SLOW.csn_setup, timing.SLOW.csn_hold]
+
+
+def test_power_up(sleeps):
+    radio = NRF24(backend=SimulatedNRF24())
+    radio.__enter__()
+    del sleeps[:]
+
+    radio.status = NRF24.STATUS.stand_by
+    radio.status = NRF24.STATUS.rx
+    radio.status = NRF24.STATUS.stand_by
+
+    assert sleeps == [timing.NRF24L01.power_up, timing.NRF24L01.stand_by]
+
+
+def test_batch():
+    sim = SimulatedNRF24()
+    radio = NRF24(backend=sim)
+    radio.__enter__()
+    status = radio._get_status()
+    transactions = radio.transactions
+
+    replies = radio.batch([
+        [R_REGISTER | RF_CH, NOP],
+        (W_REGISTER | RF_CH, 40),
+        [R_REGISTER | RF_CH, NOP],
+        [NOP],
+    ])
+
+    # in order, every command in its own CSN frame
+    assert replies == [[status, 2], [status, 0], [status, 40], [status]]
+    assert radio.transactions - transactions == 4
+    assert sim.registers[RF_CH] == [40]
+    assert sim.csn.value == 1
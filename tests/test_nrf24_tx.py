@@ -0,0 +1,114 @@
+import pytest
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.mnemonic import *
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+ADDRESS = 0xd1d2d3d2d1
+
+
+@pytest.fixture
+def sim():
+    return SimulatedNRF24()
+
+
+@pytest.fixture
+def radio(request, sim):
+    radio = NRF24(backend=sim)
+    radio.__enter__()
+    radio.status = NRF24.STATUS.stand_by
+    radio.pipes[0].address = ADDRESS
+    radio.pipes[0].payload_length = 4
+    request.addfinalizer(lambda: radio.__exit__(None, None, None))
+    return radio
+
+
+def test_send_ack(sim, radio):
+    result = radio.send(0, b'abcdefgh')
+
+    assert result.ok
+    assert result.payloads == 2
+    assert sim.sent == [(ADDRESS, b'abcd', False), (ADDRESS, b'efgh', False)]
+
+
+def test_send_retransmits(sim, radio):
+    sim.retransmits = 2
+    result = radio.send(0, b'abcd')
+
+    assert result.ok
+    assert result.retransmits == 2
+
+
+def test_send_no_receiver(sim, radio):
+    sim.ack = False
+    result = radio.send(0, b'abcd')
+
+    assert not result.ok
+    assert sim.sent == []
+    assert radio._registry['FIFO_STATUS']['TX_EMPTY']
+
+
+def test_send_no_ack(sim, radio):
+    sim.ack = False
+    result = radio.send(0, b'abcd', no_ack=True)
+
+    assert result.ok
+    assert sim.ignored == 0
+    assert sim.sent == [(ADDRESS, b'abcd', True)]
+
+
+def test_send_dynamic(sim, radio):
+    radio._registry['FEATURE']['EN_DPL'] = True
+    radio.pipes[0].dynamic_payload = True
+
+    with radio.tx(0):
+        assert radio._registry['DYNPD']['DPL_P0']
+
+    result = radio.send(0, b'abcdef')
+
+    assert result.ok
+    assert sim.sent == [(ADDRESS, b'abcdef', False)]
+
+
+def test_tx_restores_registers(sim, radio):
+    registry = radio._registry
+    pipe = radio.pipes[1]
+    pipe.address = 0xc2c2c2c2c2
+    pipe.payload_length = 4
+
+    before = {name: int(registry[name])
+              for name in ['EN_RXADDR', 'EN_AA', 'DYNPD', 'FEATURE']}
+    rx_addr_p0 = registry['RX_ADDR_P0']
+
+    with radio.tx(1):
+        assert registry['EN_AA']['ENAA_P0']
+        assert registry['EN_RXADDR']['ERX_P0']
+        assert registry['FEATURE']['EN_DYN_ACK']
+        assert registry['RX_ADDR_P0'] == [0xc2] * 5
+
+    after = {name: int(registry[name]) for name in before}
+
+    assert after == before
+    assert registry['RX_ADDR_P0'] == rx_addr_p0
+
+
+def test_sim_ignores_no_ack_without_dyn_ack(sim, radio):
+    radio._registry['FEATURE'] = 0
+    radio._transfer([W_TX_PAYLOAD_NO_ACK, 1, 2, 3, 4])
+
+    assert sim.ignored == 1
+    assert not sim.tx_fifo
+
+
+def test_sim_no_ack_wait_without_auto_ack(sim, radio):
+    sim.ack = False
+    sim.retransmits = 5
+    registry = radio._registry
+    registry['EN_AA'] = 0
+    radio._transfer([W_TX_PAYLOAD, 1, 2, 3, 4])
+    radio._ce.value = True
+
+    assert registry['STATUS']['TX_DS']
+    assert not registry['STATUS']['MAX_RT']
+    assert registry['OBSERVE_TX']['ARC_CNT'] == 0
+    assert sim.sent == [(0xe7e7e7e7e7, bytes([1, 2, 3, 4]), True)]
@@ -0,0 +1,146 @@
+import asyncio
+import sys
+
+import pytest
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.pipe import (
+    AsyncPipe, PipeClosed, BLOCK, DROP_NEWEST, DROP_OLDEST)
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+
+@pytest.fixture
+def radio(request):
+    radio = NRF24(backend=SimulatedNRF24())
+    radio.__enter__()
+    request.addfinalizer(radio.close)
+    return radio
+
+
+def make_pipe(radio, loop, **kwargs):
+    return AsyncPipe(radio, 1, loop=loop, **kwargs)
+
+
+def test_get_waits(radio, loop):
+    pipe = make_pipe(radio, loop)
+    task = asyncio.async(pipe.get(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0, loop=loop))
+    assert not task.done()
+
+    pipe.receive_from_fifo(b'ab')
+
+    assert loop.run_until_complete(task) == b'ab'
+    assert pipe.received == 1
+
+
+def test_get_many(radio, loop):
+    pipe = make_pipe(radio, loop)
+
+    for n in range(5):
+        pipe.receive_from_fifo(bytes([n]))
+
+    assert loop.run_until_complete(pipe.get_many(3)) == [b'\0', b'\1', b'\2']
+    assert loop.run_until_complete(pipe.get_many(3)) == [b'\3', b'\4']
+    assert loop.run_until_complete(pipe.get_many(3, timeout=0.01)) == []
+
+
+def test_get_many_waits(radio, loop):
+    pipe = make_pipe(radio, loop)
+    loop.call_later(0.01, pipe.receive_from_fifo, b'ab')
+    loop.call_later(0.01, pipe.receive_from_fifo, b'cd')
+
+    assert loop.run_until_complete(pipe.get_many(3, timeout=1)) == [b'ab', b'cd']
+
+
+def test_wakeup_of_cancelled_reader_passed_on(radio, loop):
+    pipe = make_pipe(radio, loop)
+    first = asyncio.async(pipe.get(), loop=loop)
+    second = asyncio.async(pipe.get(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0, loop=loop))
+
+    # the payload wakes up the first reader, which is cancelled at once
+    pipe.receive_from_fifo(b'ab')
+    first.cancel()
+
+    assert loop.run_until_complete(
+        asyncio.wait_for(second, 1, loop=loop)) == b'ab'
+    assert first.cancelled()
+
+
+def test_close(radio, loop):
+    pipe = make_pipe(radio, loop)
+    pipe.receive_from_fifo(b'ab')
+    waiting = asyncio.async(pipe.get_many(3, timeout=1), loop=loop)
+    pipe.close()
+
+    assert not pipe.receive_from_fifo(b'cd')
+    assert loop.run_until_complete(waiting) == [b'ab']
+
+    with pytest.raises(PipeClosed):
+        loop.run_until_complete(pipe.get())
+
+    with pytest.raises(PipeClosed):
+        loop.run_until_complete(pipe.get_many(3, timeout=1))
+
+
+def test_close_wakes_readers(radio, loop):
+    pipe = make_pipe(radio, loop)
+    task = asyncio.async(pipe.get(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0, loop=loop))
+    pipe.close()
+
+    with pytest.raises(PipeClosed):
+        loop.run_until_complete(task)
+
+
+def test_drop_oldest(radio, loop):
+    pipe = make_pipe(radio, loop, queue_size=2, overflow=DROP_OLDEST)
+
+    for data in [b'a', b'b', b'c']:
+        assert pipe.receive_from_fifo(data)
+
+    assert pipe.dropped == 1
+    assert loop.run_until_complete(pipe.get_many(3)) == [b'b', b'c']
+
+
+def test_drop_newest(radio, loop):
+    pipe = make_pipe(radio, loop, queue_size=2, overflow=DROP_NEWEST)
+
+    assert [pipe.receive_from_fifo(data) for data in [b'a', b'b', b'c']] == [
+        True, True, False]
+    assert pipe.dropped == 1
+    assert loop.run_until_complete(pipe.get_many(3)) == [b'a', b'b']
+
+
+def test_block(radio, loop):
+    pipe = make_pipe(radio, loop, queue_size=2, overflow=BLOCK)
+    spaces = []
+    pipe.on_space = lambda: spaces.append(pipe.blocked)
+
+    pipe.receive_from_fifo(b'a')
+    assert not pipe.blocked
+
+    pipe.reserve()  # on its way from the radio thread
+    assert pipe.blocked
+
+    pipe.receive_from_fifo(b'b', True)
+    pipe.receive_from_fifo(b'c')  # never dropped
+    assert pipe.dropped == 0
+
+    assert loop.run_until_complete(pipe.get()) == b'a'
+    assert spaces == [True]  # still 2 queued
+    assert loop.run_until_complete(pipe.get_many(3)) == [b'b', b'c']
+    assert not pipe.blocked
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='python 3.5+')
+def test_iteration(radio, loop):
+    pipe = make_pipe(radio, loop)
+    pipe.receive_from_fifo(b'ab')
+    pipe.close()
+
+    assert pipe.__aiter__() is pipe
+    assert loop.run_until_complete(pipe.__anext__()) == b'ab'
+
+    with pytest.raises(StopAsyncIteration):
+        loop.run_until_complete(pipe.__anext__())
@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+
+from zr.mpd_ctrl.pool import MPDPool
+
+
+class FakeMPD:
+    """ MPD server answering status and ping, with optional delays
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.port = 0
+        self.commands = []
+        self.delay = {}
+        self.connections = 0
+
+        self._server = None
+        self._writers = []
+        self._stopped = asyncio.Event(loop=loop)
+
+    @asyncio.coroutine
+    def start(self):
+        self._stopped.clear()
+        self._server = yield from asyncio.start_server(
+            self._handle, '127.0.0.1', self.port, loop=self.loop)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        self._stopped.set()
+        self._server.close()
+
+        for writer in self._writers:
+            writer.close()
+
+        self._writers = []
+
+    @asyncio.coroutine
+    def _handle(self, reader, writer):
+        self.connections += 1
+        self._writers.append(writer)
+        writer.write(b'OK MPD 0.19.0\n')
+
+        while True:
+            line = yield from reader.readline()
+
+            if not line:
+                break
+
+            command = line.decode('utf8').split()[0]
+            self.commands.append(command)
+
+            if command in self.delay:
+                try:
+                    yield from asyncio.wait_for(
+                        self._stopped.wait(), self.delay[command],
+                        loop=self.loop)
+                except asyncio.TimeoutError:
+                    pass
+
+            if command == 'status':
+                writer.write(b'volume: 50\nstate: play\nsong: 0\nOK\n')
+            else:
+                writer.write(b'OK\n')
+
+        writer.close()
+
+
+@pytest.fixture
+def server(request, loop):
+    server = FakeMPD(loop)
+    loop.run_until_complete(server.start())
+
+    def stop():
+        server.stop()
+        loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+    request.addfinalizer(stop)
+    return server
+
+
+@pytest.fixture
+def pool(request, loop, server):
+    pool = MPDPool(port=server.port, size=1, priority_size=1, keepalive=0,
+                   timeout=1, backoff=(0.05, 0.1), loop=loop)
+    loop.run_until_complete(pool.start())
+    request.addfinalizer(pool.close)
+    return pool
+
+
+def test_start(loop, server, pool):
+    assert server.connections == 2
+    assert pool.stats()['regular']['connected'] == 1
+    assert pool.stats()['priority']['connected'] == 1
+
+
+def test_call(loop, pool):
+    status = loop.run_until_complete(pool.get_status())
+    assert status['volume'] == 50
+
+
+def test_exhausted_lane_waits(loop, server, pool):
+    server.delay['status'] = 0.1
+
+    first = asyncio.async(pool.get_status(), loop=loop)
+    second = asyncio.async(pool.get_status(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+
+    # regular lane is busy, the priority one is not
+    assert pool.regular.stats()['idle'] == 0
+    loop.run_until_complete(asyncio.wait_for(
+        pool.priority.set_volume(10), 0.05, loop=loop))
+
+    loop.run_until_complete(asyncio.wait([first, second], loop=loop))
+
+    assert first.result()['volume'] == 50
+    assert second.result()['volume'] == 50
+    assert pool.regular.wait_max >= 0.05
+    assert pool.regular.stats()['idle'] == 1
+
+
+def test_timeout_breaks_connection(loop, server, pool):
+    server.delay['status'] = 2
+
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(pool.get_status())
+
+    assert pool.regular.errors == 1
+    assert pool.regular.stats()['connected'] == 0
+
+    server.delay.clear()
+    loop.run_until_complete(pool.get_status())
+    assert pool.regular.stats()['connected'] == 1
+
+
+def test_reconnect(loop, server, pool):
+    server.stop()
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    assert pool.regular.stats()['connected'] == 0
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(pool.get_status())
+
+    # backoff: fails fast without connecting
+    errors = pool.connect_errors
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(pool.get_status())
+
+    assert pool.connect_errors == errors
+
+    loop.run_until_complete(server.start())
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+
+    status = loop.run_until_complete(pool.get_status())
+    assert status['volume'] == 50
+    assert pool.regular.stats()['connected'] == 1
+
+
+def test_keepalive_pings_idle(loop, server, pool):
+    loop.run_until_complete(pool.regular._keepalive(0))
+
+    assert server.commands.count('ping') == 1
+    assert pool.pings == 1
+
+    # a slot used just now is not pinged
+    loop.run_until_complete(pool.get_status())
+    loop.run_until_complete(pool.regular._keepalive(10))
+    assert pool.pings == 1
+
+
+def test_keepalive_one_slot_at_a_time(loop, server):
+    pool = MPDPool(port=server.port, size=3, keepalive=0, timeout=1, loop=loop)
+
+    for _ in range(3):
+        loop.run_until_complete(pool.regular.run(
+            lambda client: asyncio.sleep(0, loop=loop)))
+
+    server.delay['ping'] = 0.02
+    task = asyncio.async(pool.regular._keepalive(0), loop=loop)
+    idle = []
+
+    while not task.done():
+        idle.append(pool.regular.stats()['idle'])
+        loop.run_until_complete(asyncio.sleep(0.005, loop=loop))
+
+    assert min(idle) == 2
+    assert pool.pings == 3
+    pool.close()
+
+
+def test_keepalive_yields_to_waiters(loop, server):
+    pool = MPDPool(port=server.port, size=2, keepalive=0, timeout=1, loop=loop)
+
+    for _ in range(2):
+        loop.run_until_complete(pool.regular.run(
+            lambda client: asyncio.sleep(0, loop=loop)))
+
+    server.delay['ping'] = 0.05
+    keepalive = asyncio.async(pool.regular._keepalive(0), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+    # one slot is pinged, so one is idle; take it and wait for another
+    first = asyncio.async(pool.regular.run(
+        lambda client: asyncio.sleep(0.1, loop=loop)), loop=loop)
+    second = asyncio.async(pool.get_status(), loop=loop)
+    loop.run_until_complete(asyncio.wait(
+        [keepalive, first, second], loop=loop))
+
+    assert pool.pings == 1
+    assert second.result()['volume'] == 50
+    pool.close()
+
+
+def test_keepalive_reconnects(loop, server, pool):
+    server.stop()
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(pool.get_status())
+
+    loop.run_until_complete(server.start())
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    loop.run_until_complete(pool.regular._keepalive(10))
+
+    assert pool.regular.stats()['connected'] == 1
@@ -0,0 +1,77 @@
+import pytest
+
+from zr.mpd_ctrl import protocol
+from zr.mpd_ctrl.protocol import Frame, ProtocolError
+
+
+def test_decode_v1():
+    assert protocol.decode(b'v\x05') == Frame(1, None, [('v', 5)])
+    assert protocol.decode(b't\xff') == Frame(1, None, [('t', -1)])
+    assert protocol.decode(b'p\x00') == Frame(1, None, [('p', 0)])
+
+
+def test_decode_v1_padding():
+    assert protocol.decode(b'v\x01\x00\x00\x00') == Frame(1, None, [('v', 1)])
+
+
+def test_decode_v2():
+    raw = protocol.encode([('v', -3), ('t', 1), ('p', 0)], seq=42)
+
+    assert raw[0] == protocol.VERSION_2
+    assert protocol.decode(raw) == \
+        Frame(2, 42, [('v', -3), ('t', 1), ('p', 0)])
+
+
+def test_decode_v2_padding():
+    raw = protocol.encode([('v', 1)], seq=1) + b'\x00' * 20
+    assert protocol.decode(raw) == Frame(2, 1, [('v', 1)])
+
+
+def test_decode_v2_empty():
+    assert protocol.decode(protocol.encode([], seq=3)) == Frame(2, 3, [])
+
+
+def test_encode_seq_wraps():
+    assert protocol.decode(protocol.encode([('p', 0)], seq=257)).seq == 1
+
+
+def test_encode_too_many():
+    with pytest.raises(ProtocolError):
+        protocol.encode([('v', 1)] * (protocol.MAX_COMMANDS + 1))
+
+
+@pytest.mark.parametrize('raw', [
+    b'',
+    b'v',
+    b'x\x01',
+    b'\xff\x01',
+    b'\x02\x01',
+    b'\x02\x01\x02v\x01',
+    b'\x02\x01\x01x\x01',
+    bytes([protocol.VERSION_2, 0, protocol.MAX_COMMANDS + 1]) + b'v\x01' * 20,
+])
+def test_decode_bad(raw):
+    with pytest.raises(ProtocolError):
+        protocol.decode(raw)
+
+
+@pytest.mark.parametrize('commands, merged', [
+    ([], []),
+    ([('v', 5), ('v', 5)], [('v', 10)]),
+    ([('v', 5), ('v', -5)], []),
+    ([('v', 90), ('v', 90)], [('v', 100)]),
+    ([('t', 1), ('t', 1), ('t', 1)], [('t', 3)]),
+    ([('t', -1), ('t', -1)], [('t', -2)]),
+    ([('p', 0), ('p', 0)], []),
+    ([('p', 0), ('p', 0), ('p', 0)], [('p', 0)]),
+    ([('v', 1), ('t', 1), ('v', 1)], [('v', 1), ('t', 1), ('v', 1)]),
+    ([('v', 1), ('p', 0), ('p', 0), ('v', 1)], [('v', 2)]),
+    ([('t', 1), ('t', -1), ('p', 0)], [('p', 0)]),
+])
+def test_merge(commands, merged):
+    assert protocol.merge(commands) == merged
+
+
+def test_merge_only_summed(monkeypatch):
+    monkeypatch.setattr(protocol, 'SUMMED', frozenset(['v']))
+    assert protocol.merge([('t', 1), ('t', 1)]) == [('t', 1), ('t', 1)]
@@ -0,0 +1,106 @@
+import asyncio
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.sim import SimulatedNRF24
+from zr.mpd_ctrl import protocol
+from zr.mpd_ctrl.radio import RadioController
+
+from test_remote import FakeLane
+
+ADDRESS = 0xd1d2d3d2d1
+
+
+def setup_controller(loop, sim, **kwargs):
+    """ RadioController configured like in production, receiving
+    """
+    controller = RadioController(
+        FakeLane(), radio_factory=lambda: NRF24(backend=sim), **kwargs)
+    worker = controller.worker
+
+    controller.radio = loop.run_until_complete(worker.open())
+    controller.irq = controller.radio.backend.irq
+    loop.run_until_complete(worker.call(controller._setup, loop))
+    loop.run_until_complete(worker.call(controller.radio.__enter__))
+    loop.run_until_complete(worker.set_status(NRF24.STATUS.rx))
+    return controller
+
+
+def receive(loop, controller):
+    pipe = controller.radio.pipes[0]
+    loop.run_until_complete(controller.worker.read_rx_fifo())
+    loop.run_until_complete(asyncio.sleep(0, loop=loop))
+    pipe.close()
+    loop.run_until_complete(pipe.task())
+    loop.run_until_complete(controller.worker.close())
+    return pipe
+
+
+def test_v1_by_default(loop):
+    sim = SimulatedNRF24()
+    controller = setup_controller(loop, sim)
+
+    assert sim.transmit(ADDRESS, b'v\x05')
+    assert not sim.transmit(ADDRESS, protocol.encode([('v', 5)], seq=1))
+    assert sim.lost == 1
+
+    pipe = receive(loop, controller)
+
+    assert not pipe.auto_ack
+    assert controller.mpd.calls == [('incr_volume', 5)]
+
+
+def test_v2_with_dynamic_payload(loop):
+    sim = SimulatedNRF24()
+    controller = setup_controller(loop, sim, dynamic_payload=True)
+    frame = protocol.encode([('v', 5), ('p', 0)], seq=7)
+
+    assert sim.transmit(ADDRESS, frame)
+    assert sim.transmit(ADDRESS, frame)  # repeated, no ack came
+    assert sim.transmit(ADDRESS, b't\x01')  # v1 remotes still work
+
+    pipe = receive(loop, controller)
+
+    assert pipe.auto_ack
+    assert pipe.dynamic_payload
+    assert controller.radio._registry['CONFIG']['EN_CRC']
+    assert pipe.duplicates == 1
+    assert controller.mpd.calls == [
+        ('incr_volume', 5),
+        ('toggle',),
+        ('command_list', [('next',)]),
+    ]
+
+
+def test_irq_receive(loop):
+    sim = SimulatedNRF24()
+    controller = setup_controller(loop, sim, irq_timeout=10)
+    controller._stop = False
+    pipe = controller.radio.pipes[0]
+
+    assert controller.irq is sim.irq
+
+    task = asyncio.async(controller._irq_circle(), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    idle = sim.xfers
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+
+    assert sim.xfers == idle  # no polling between edges
+
+    for n in range(2):
+        sim.transmit(ADDRESS, b'v' + bytes([n]))
+
+        for _ in range(50):
+            if pipe.received > n:
+                break
+            loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+        assert pipe.received == n + 1
+        assert not sim.rx_fifo
+        assert not sim.flags  # RX_DR cleared: the IRQ line is released
+
+    controller.stop()
+    loop.run_until_complete(task)
+
+    assert sim.irq._callback is None
+    assert [pipe.receive(), pipe.receive()] == [b'v\x00', b'v\x01']
+    loop.run_until_complete(controller.worker.close())
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.sim import SimulatedNRF24
+from zr.mpd_ctrl import protocol
+from zr.mpd_ctrl.remote import MpdPipe
+
+
+class FakeLane:
+    """ Lane of MPDPool recording calls
+    """
+    def __init__(self):
+        self.calls = []
+
+    @asyncio.coroutine
+    def run(self, func, *args):
+        self.calls.append((func.__name__,) + args)
+
+    @asyncio.coroutine
+    def toggle(self):
+        self.calls.append(('toggle',))
+
+    @asyncio.coroutine
+    def incr_volume(self, value):
+        self.calls.append(('incr_volume', value))
+
+
+@pytest.fixture
+def mpd():
+    return FakeLane()
+
+
+@pytest.fixture
+def pipe(loop, mpd):
+    radio = NRF24(backend=SimulatedNRF24())
+    return MpdPipe(mpd, radio, 0, queue_size=10, loop=loop)
+
+
+def process(loop, pipe, *frames):
+    for raw in frames:
+        pipe.receive_from_fifo(raw)
+
+    pipe.close()
+    loop.run_until_complete(pipe.task())
+
+
+def test_track_merged(loop, pipe, mpd):
+    process(loop, pipe, b't\x01', b't\x01', b't\x01')
+
+    assert pipe.commands_in == 3
+    assert pipe.mpd_calls == 1
+    assert mpd.calls == [('command_list', [('next',)] * 3)]
+
+
+def test_track_back(loop, pipe, mpd):
+    process(loop, pipe, protocol.encode([('t', -1), ('t', -1)], seq=1))
+
+    assert mpd.calls == [('command_list', [('previous',)] * 2)]
+
+
+def test_track_cancelled(loop, pipe, mpd):
+    process(loop, pipe, b't\x01', b't\xff')
+
+    assert pipe.commands_in == 2
+    assert mpd.calls == []
+
+
+def test_volume_and_toggle(loop, pipe, mpd):
+    process(loop, pipe, b'v\x05', b'v\x05', b'p\x00', b'p\x00', b'p\x00')
+
+    assert mpd.calls == [('incr_volume', 10), ('toggle',)]
+
+
+def test_duplicate_frame(loop, pipe, mpd):
+    raw = protocol.encode([('v', 1)], seq=7)
+    process(loop, pipe, raw, raw)
+
+    assert pipe.duplicates == 1
+    assert mpd.calls == [('incr_volume', 1)]
+
+
+def test_bad_frame(loop, pipe, mpd):
+    process(loop, pipe, b'x\x01', b'v\x01')
+
+    assert mpd.calls == [('incr_volume', 1)]
+
+
+class BrokenLane(FakeLane):
+    """ Lane of MPDPool with MPD down for the first `failures` calls
+    """
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    @asyncio.coroutine
+    def incr_volume(self, value):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('can not connect to mpd')
+
+        yield from super().incr_volume(value)
+
+
+def test_mpd_errors(loop):
+    mpd = BrokenLane(failures=1)
+    radio = NRF24(backend=SimulatedNRF24())
+    pipe = MpdPipe(mpd, radio, 0, queue_size=10, coalesce_window=0, loop=loop)
+
+    task = asyncio.async(pipe.task(), loop=loop)
+    pipe.receive_from_fifo(b'v\x01')
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    pipe.receive_from_fifo(b'v\x02')
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+    assert not task.done()
+    assert pipe.errors == 1
+    assert mpd.calls == [('incr_volume', 2)]
+
+    pipe.close()
+    loop.run_until_complete(task)
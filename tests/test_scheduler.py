@@ -0,0 +1,179 @@
+import asyncio
+
+from zr.lib.cron import SimClock
+from zr.mpd_ctrl.scheduler import MPDScheduler
+from zr.settings import Settings
+
+
+class FakeMPD:
+    cache = None
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.volumes = []
+        self.polls = 0
+        self.priority = self
+
+    @asyncio.coroutine
+    def get_status(self):
+        self.polls += 1
+
+        if len(self.statuses) > 1:
+            return self.statuses.pop(0)
+
+        return self.statuses[0]
+
+    @asyncio.coroutine
+    def set_volume(self, volume):
+        self.volumes.append(volume)
+        self.statuses = [dict(self.statuses[-1], volume=str(volume))]
+
+        if self.cache is not None:
+            self.cache.changed()
+
+    @asyncio.coroutine
+    def run(self, func, *args, **kwargs):
+        return []
+
+
+class FakeCache:
+    """ Live cache: only idle events update it, elapsed is stale
+    """
+    live = True
+
+    def __init__(self, mpd, loop):
+        self.mpd = mpd
+        mpd.cache = self
+        self.status = status(state='pause', elapsed='0.000')
+        self.status_version = 0
+        self.waits = 0
+        self._changed = asyncio.Event(loop=loop)
+
+    def changed(self):
+        # the mixer event reloads the volume, elapsed stays as it was
+        self.status = dict(self.status, volume=self.mpd.statuses[0]['volume'])
+        self.status_version += 1
+        self._changed.set()
+        self._changed.clear()
+
+    @asyncio.coroutine
+    def get_status(self):
+        return self.status
+
+    @asyncio.coroutine
+    def wait_status(self, version, timeout=1):
+        self.waits += 1
+
+        if version == self.status_version:
+            try:
+                yield from asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return self.status
+
+
+def status(state='play', elapsed='1.0', volume='50'):
+    return {'state': state, 'elapsed': elapsed, 'volume': volume}
+
+
+def scheduler(mpd, volume=(50,), clock=None, cache=None):
+    settings = Settings({
+        'playlists': {'Morning': ['http://localhost:8000/a']},
+        'scheduler': {
+            'morning': {
+                'playlist': 'Morning',
+                'start': '7:00',
+                'volume': list(volume),
+            },
+        },
+    })
+    return MPDScheduler(mpd, settings, clock=clock, cache=cache)
+
+
+def test_record_waits_for_volume(loop):
+    mpd = FakeMPD([
+        status(state='pause', elapsed='0.000'),
+        status(elapsed='0.000'),
+        status(volume='0'),
+        status(volume='10'),
+    ])
+    sched = scheduler(mpd, clock=SimClock(100))
+
+    loop.run_until_complete(
+        sched._record('morning', 99, False, interval=0.001))
+
+    assert mpd.polls == 4
+    run, = sched.runs
+    assert run['audible']
+    assert run['skew'] == 1
+
+
+def test_record_no_mixer(loop):
+    mpd = FakeMPD([status(volume='-1')])
+    sched = scheduler(mpd, clock=SimClock(100))
+
+    loop.run_until_complete(sched._record('morning', 100, True))
+
+    assert mpd.polls == 1
+    assert sched.runs[0]['audible']
+
+
+def test_record_muted(loop):
+    mpd = FakeMPD([status(volume='0')])
+    sched = scheduler(mpd, clock=SimClock(100))
+
+    loop.run_until_complete(sched._record(
+        'morning', 100, False, timeout=0.05, interval=0.001))
+
+    run, = sched.runs
+    assert not run['audible']
+
+
+def test_fade_from_zero(loop):
+    mpd = FakeMPD([status(volume='0')])
+    sched = scheduler(mpd, volume=[[60, 1]])
+    start = loop.time()
+
+    sched._fire('morning', sched.engine.clock.time())
+    loop.run_until_complete(asyncio.wait(list(sched._futures)))
+
+    # the fade is not delayed by waiting for audible playback
+    assert mpd.volumes == [30, 60]
+    assert loop.time() - start < 2
+
+    run, = sched.runs
+    assert run['audible']
+    assert 0.5 <= run['skew'] < 1.5
+
+
+def test_record_fresh_status(loop):
+    mpd = FakeMPD([status()])
+    cache = FakeCache(mpd, loop)
+    sched = scheduler(mpd, clock=SimClock(100), cache=cache)
+
+    loop.run_until_complete(sched._record('morning', 100, True))
+
+    # the cached status still says paused at 0.000
+    assert mpd.polls == 1
+    assert sched.runs[0]['audible']
+
+
+def test_fade_from_zero_with_cache(loop):
+    mpd = FakeMPD([status(volume='0')])
+    cache = FakeCache(mpd, loop)
+    cache.status['volume'] = '0'
+    sched = scheduler(mpd, volume=[[60, 1]], cache=cache)
+
+    sched._fire('morning', sched.engine.clock.time())
+    loop.run_until_complete(asyncio.wait(list(sched._futures)))
+
+    assert mpd.volumes == [30, 60]
+
+    # woken by the mixer change instead of polling
+    assert mpd.polls == 2
+    assert cache.waits == 1
+
+    run, = sched.runs
+    assert run['audible']
+    assert 0.5 <= run['skew'] < 0.6
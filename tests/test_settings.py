@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from zr.settings import DEFAULT_LEAD, Settings, SettingsError, VolumeStep
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'zr.json')
+
+
+def raw(**kwargs):
+    data = {
+        'playlists': {'Morning': ['http://localhost:8000/a']},
+        'scheduler': {
+            'morning': {
+                'playlist': 'Morning',
+                'start': '7:00',
+                'volume': [10, [20, 60], [30, 60, 'exponential']],
+            },
+        },
+    }
+    data.update(kwargs)
+    return data
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('zr.json'))
+
+
+def write(path, data):
+    with open(path, 'w') as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+
+
+def test_example():
+    settings = Settings.load(EXAMPLE)
+
+    assert set(settings.playlists) == {'Night', 'Morning'}
+    assert set(settings.schedules) == {'night', 'morning'}
+
+
+def test_compile():
+    settings = Settings(raw())
+    schedule = settings.schedules['morning']
+
+    assert settings.playlists['Morning'] == ('http://localhost:8000/a',)
+    assert schedule.lead == DEFAULT_LEAD
+    assert schedule.volume == (
+        VolumeStep(10, None, 'linear'),
+        VolumeStep(20, 60, 'linear'),
+        VolumeStep(30, 60, 'exponential'),
+    )
+
+
+def test_read_only():
+    settings = Settings(raw())
+
+    with pytest.raises(TypeError):
+        settings.playlists['Other'] = ()
+
+
+def test_load(path):
+    write(path, raw())
+    assert set(Settings.load(path).schedules) == {'morning'}
+
+
+def test_load_missing(path):
+    settings = Settings.load(path)
+
+    assert dict(settings.playlists) == {}
+    assert dict(settings.schedules) == {}
+
+
+def test_load_missing_not_ok(path):
+    # a reload must not take away the schedules while the file is replaced
+    with pytest.raises(SettingsError):
+        Settings.load(path, missing_ok=False)
+
+
+@pytest.mark.parametrize('data', [
+    '{"playlists": ',
+    '[]',
+    raw(playlists=[]),
+    raw(playlists={'Morning': 'http://localhost'}),
+    raw(scheduler=[]),
+    raw(scheduler={'morning': {'playlist': 'Morning'}}),
+    raw(scheduler={'morning': {'playlist': 'Other', 'start': '7:00'}}),
+    raw(scheduler={'morning': {'playlist': 'Morning', 'start': '7:00',
+                               'lead': -1}}),
+    raw(scheduler={'morning': {'playlist': 'Morning', 'start': '7:00',
+                               'volume': [101]}}),
+    raw(scheduler={'morning': {'playlist': 'Morning', 'start': '7:00',
+                               'volume': [[10, 60, 'sine']]}}),
+    raw(mpd=[]),
+])
+def test_load_bad(path, data):
+    write(path, data)
+
+    with pytest.raises(SettingsError):
+        Settings.load(path)
+
+
+def test_diff():
+    old = Settings(raw())
+    new_raw = raw(mpd={'host': 'music'})
+    new_raw['playlists']['Night'] = ['http://localhost:8000/n']
+    new_raw['scheduler']['night'] = {'playlist': 'Night', 'start': '22:00'}
+    new_raw['scheduler']['morning']['start'] = '8:00'
+
+    changes = old.diff(Settings(new_raw))
+
+    assert changes.added == {'night'}
+    assert changes.removed == set()
+    assert changes.changed == {'morning'}
+    assert changes.playlists == {'Night'}
+    assert changes.restart == {'mpd'}
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from zr.mpd_ctrl.streams import StreamProber
+
+
+@pytest.fixture
+def serve(loop, request):
+    """ Start a local HTTP server behaving like a radio stream, return url
+    """
+    servers = []
+    stopped = asyncio.Event(loop=loop)
+
+    def serve(delay=0, status='200 OK', headers=(), body=True):
+        @asyncio.coroutine
+        def handle(reader, writer):
+            while (yield from reader.readline()) not in (b'\r\n', b''):
+                pass
+
+            try:
+                yield from asyncio.wait_for(stopped.wait(), delay, loop=loop)
+            except asyncio.TimeoutError:
+                pass
+
+            head = ['HTTP/1.0 {}'.format(status)] + list(headers) + ['', '']
+            writer.write('\r\n'.join(head).encode('latin1'))
+
+            if body:
+                writer.write(b'\xff' * 1024)
+                yield from stopped.wait()  # endless stream
+
+            writer.close()
+
+        server = loop.run_until_complete(
+            asyncio.start_server(handle, '127.0.0.1', 0, loop=loop))
+        servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+        return 'http://127.0.0.1:{}/stream'.format(port)
+
+    def stop():
+        stopped.set()
+
+        for server in servers:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+
+        loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+
+    request.addfinalizer(stop)
+    return serve
+
+
+def probe(loop, url, **kwargs):
+    prober = StreamProber(lambda: [url], loop=loop, **kwargs)
+    return prober, loop.run_until_complete(prober.probe(url))
+
+
+def test_alive(loop, serve):
+    url = serve()
+    prober, health = probe(loop, url)
+
+    assert health.ok
+    assert health.ttfb > 0
+    assert health.error is None
+    assert prober.get(url) == health
+    assert prober.failures == 0
+
+
+def test_redirect(loop, serve):
+    target = serve()
+    url = serve(status='302 Found', body=False,
+                headers=['Location: {}'.format(target)])
+
+    assert probe(loop, url)[1].ok
+
+
+def test_too_many_redirects(loop, serve):
+    url = serve(status='302 Found', body=False, headers=['Location: /stream'])
+    prober, health = probe(loop, url)
+
+    assert not health.ok
+    assert health.error == 'too many redirects'
+    assert prober.failures == 1
+
+
+def test_timeout(loop, serve):
+    url = serve(delay=1)
+    health = probe(loop, url, timeout=0.05)[1]
+
+    assert not health.ok
+    assert health.error == 'TimeoutError'
+
+
+def test_not_found(loop, serve):
+    health = probe(loop, serve(status='404 Not Found', body=False))[1]
+
+    assert not health.ok
+    assert health.error == 'status 404'
+
+
+def test_empty_body(loop, serve):
+    health = probe(loop, serve(body=False))[1]
+
+    assert not health.ok
+    assert health.error == 'empty body'
+
+
+def test_bad_url(loop, serve):
+    url = serve()
+    prober = StreamProber(
+        lambda: {'a': [url, 'http://host:abc/'], 'b': ['ftp://host/']},
+        loop=loop)
+
+    healths = loop.run_until_complete(prober.probe_all())
+
+    # one bad url does not fail the others
+    assert [(h.url, h.ok) for h in healths] == [
+        ('ftp://host/', False),
+        (url, True),
+        ('http://host:abc/', False),
+    ]
+    assert healths[0].error == 'bad scheme: ftp'
+    assert healths[2].error.startswith('bad url:')
+
+
+def test_rank(loop, serve):
+    fast = serve()
+    slow = serve(delay=0.1)
+    dead = serve(status='500 Internal Server Error', body=False)
+    unknown = 'http://127.0.0.1:1/never-probed'
+
+    prober = StreamProber(lambda: [slow, dead, fast], loop=loop)
+    loop.run_until_complete(prober.probe_all())
+    urls = [dead, unknown, slow, fast]
+
+    assert prober.rank(urls) == [fast, slow, unknown, dead]
+    assert prober.rank(urls, skip_dead=True) == [fast, slow, unknown]
+
+    # nothing else left: dead ones are better than nothing
+    assert prober.rank([dead], skip_dead=True) == [dead]
+
+
+def test_ttl(loop, serve):
+    url = serve()
+    prober, health = probe(loop, url, ttl=-1)
+
+    assert health.ok
+    assert prober.get(url) is None
+    assert prober.rank([url]) == [url]
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from zr.mpd_ctrl.volume import CURVES, Fader, Ramp, max_slope
+
+
+class FakeMPD:
+    """ Mixer keeping the volume, `rounding` is added on every setvol
+    """
+    def __init__(self, volume=0, rounding=0):
+        self.volume = volume
+        self.rounding = rounding
+        self.written = []
+        self.on_set = None
+
+    @asyncio.coroutine
+    def get_status(self):
+        return {'volume': self.volume}
+
+    @asyncio.coroutine
+    def set_volume(self, value):
+        self.written.append(value)
+        self.volume = max(0, value + self.rounding)
+
+        if self.on_set is not None:
+            self.on_set(self)
+
+
+def steps(levels, start):
+    values = [start] + [level for _, level in levels]
+    return [b - a for a, b in zip(values, values[1:])]
+
+
+def test_max_slope():
+    assert max_slope(CURVES['linear']) == pytest.approx(1)
+    assert max_slope(CURVES['logarithmic']) > 3
+    assert max_slope(CURVES['exponential']) > 3
+
+
+@pytest.mark.parametrize('curve', sorted(CURVES))
+def test_levels_one_point_per_step(curve):
+    ramp = Ramp(None, 100, 600, curve=curve, max_rate=2)
+    levels = ramp.levels(0)
+
+    assert levels[-1][0] <= 600
+    assert levels[-1][1] == 100
+    assert set(steps(levels, 0)) == {1}
+
+
+@pytest.mark.parametrize('curve', sorted(CURVES))
+def test_levels_rate_limited(curve):
+    ramp = Ramp(None, 100, 10, curve=curve, max_rate=2)
+    levels = ramp.levels(0)
+    offsets = [0] + [offset for offset, _ in levels]
+
+    assert levels[-1][1] == 100
+    assert min(b - a for a, b in zip(offsets, offsets[1:])) >= 0.5
+    assert all(step > 0 for step in steps(levels, 0))
+
+
+def test_levels_steep_curve_smaller_steps():
+    # the steep end of the curve is split finer than the average slope asks
+    ramp = Ramp(None, 100, 300, curve='exponential', max_rate=2)
+    assert max(steps(ramp.levels(0), 0)) <= 1
+
+
+def test_levels_down():
+    levels = Ramp(None, 20, 5, max_rate=2).levels(30)
+
+    assert levels[-1] == (5, 20)
+    assert all(step < 0 for step in steps(levels, 30))
+
+
+def test_levels_nothing_to_do():
+    assert Ramp(None, 30, 5).levels(30) == []
+    assert Ramp(None, 30, 0).levels(10) == [(0, 30)]
+
+
+def test_run(loop):
+    mpd = FakeMPD(volume=10)
+    ramp = Ramp(mpd, 20, 0.1, max_rate=1000, loop=loop)
+
+    assert loop.run_until_complete(ramp.run()) == 'done'
+    assert mpd.written == list(range(11, 21))
+    assert ramp.calls == 10
+
+
+def test_run_mixer_rounding(loop):
+    mpd = FakeMPD(volume=10, rounding=-1)
+    ramp = Ramp(mpd, 20, 0.1, max_rate=1000, loop=loop)
+
+    assert loop.run_until_complete(ramp.run()) == 'done'
+    assert mpd.written[-1] == 20
+
+
+def test_run_overridden(loop):
+    mpd = FakeMPD(volume=10)
+    ramp = Ramp(mpd, 20, 0.1, max_rate=1000, loop=loop)
+
+    def by_hand(mpd):
+        if len(mpd.written) == 5:
+            mpd.volume = 50
+
+    mpd.on_set = by_hand
+
+    assert loop.run_until_complete(ramp.run()) == 'overridden'
+    assert len(mpd.written) == 5
+    assert mpd.volume == 50
+
+
+def test_run_overridden_to_earlier_level(loop):
+    mpd = FakeMPD(volume=10)
+    ramp = Ramp(mpd, 20, 0.1, max_rate=1000, loop=loop)
+
+    def by_hand(mpd):
+        if len(mpd.written) == 5:
+            mpd.volume = 11  # was set by the ramp before
+
+    mpd.on_set = by_hand
+
+    assert loop.run_until_complete(ramp.run()) == 'overridden'
+    assert mpd.volume == 11
+
+
+def test_run_no_mixer(loop):
+    mpd = FakeMPD(volume=-1)
+    ramp = Ramp(mpd, 20, 0.1, loop=loop)
+
+    assert loop.run_until_complete(ramp.run()) == 'done'
+    assert mpd.written == []
+
+
+def test_fader_supersedes(loop):
+    mpd = FakeMPD(volume=0)
+    fader = Fader(mpd, max_rate=1000, loop=loop)
+
+    first = asyncio.async(fader.fade(100, 1), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    second = fader.fade(mpd.volume, 0)
+
+    assert loop.run_until_complete(second) == 'done'
+    assert loop.run_until_complete(first) == 'cancelled'
+    assert mpd.volume < 100
+
+
+def test_fader_cancel(loop):
+    mpd = FakeMPD(volume=0)
+    fader = Fader(mpd, max_rate=1000, loop=loop)
+
+    task = asyncio.async(fader.fade(100, 1), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        loop.run_until_complete(task)
+
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    assert fader.ramp.state == 'cancelled'
@@ -0,0 +1,249 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from zr.mpd_ctrl.cache import MPDCache
+from zr.web.assets import etag_matches
+from zr.web.mpd import CachedView, MPD, MPDEvents, MPDEventsView
+
+
+class FakeMPD:
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    @asyncio.coroutine
+    def get_status(self):
+        self.calls += 1
+        return dict(self.status)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            raise ConnectionResetError()
+
+        self.data += data
+
+    def events(self):
+        """ Events after the headers: (name, data) or ':' comments
+        """
+        body = self.data.split(b'\r\n\r\n', 1)[1].decode('utf8')
+        events = []
+
+        for block in body.split('\n\n')[:-1]:
+            if block.startswith(':'):
+                events.append(block)
+            else:
+                name, data = block.split('\n')
+                assert name.startswith('event: ') and data.startswith('data: ')
+                events.append((name[7:], json.loads(data[6:])))
+
+        return events
+
+
+def status(**kwargs):
+    data = {'state': 'play', 'volume': '50', 'elapsed': '1.000'}
+    data.update(kwargs)
+    return data
+
+
+def live_cache(loop, mpd):
+    cache = MPDCache(mpd, loop=loop)
+    cache._live = True
+    cache._slot.client = SimpleNamespace(
+        _transport=SimpleNamespace(close=lambda: None))
+    cache._set_status(status())
+    return cache
+
+
+def cached(method, etag, if_none_match=None):
+    headers = {} if if_none_match is None else {'If-None-Match': if_none_match}
+    view = SimpleNamespace(
+        request=SimpleNamespace(method=method, headers=headers))
+    return CachedView.cached(view, etag, {'state': 'play'})
+
+
+@pytest.mark.parametrize('header, result', [
+    ('"12-3"', True),
+    ('"1", "12-3"', True),
+    ('W/"12-3"', True),
+    ('*', True),
+    ('"12-34"', False),
+    ('"12-3', False),
+    ('', False),
+])
+def test_etag_matches(header, result):
+    assert etag_matches(header, '"12-3"') is result
+
+
+def test_not_modified():
+    assert cached('GET', '"s1-3"', '"s0-3", "s1-3"').status == 304
+    assert cached('GET', '"s1-3"', '"s1-34"').status == 200
+    assert cached('POST', '"s1-3"', '"s1-3"').status == 200
+
+    response = cached('GET', '"s1-3"')
+    assert response.status == 200
+    assert response.headers['ETag'] == '"s1-3"'
+    assert response.body == b'{"state": "play"}'
+
+
+def test_cache_versions(loop):
+    mpd = FakeMPD(status())
+    cache = MPDCache(mpd, loop=loop)
+    subscription = cache.subscribe()
+
+    # not live: every call asks MPD, the version moves on changes only
+    assert loop.run_until_complete(cache.get_status()) == status()
+    assert loop.run_until_complete(cache.get_status()) == status()
+    assert mpd.calls == 2
+    assert cache.status_version == 1
+
+    etag = cache.status_etag
+    mpd.status = status(volume='60')
+    loop.run_until_complete(cache.get_status())
+
+    assert cache.status_version == 2
+    assert cache.status_etag != etag
+
+    events = [subscription._queue.get_nowait() for _ in range(4)]
+    assert events[2:] == [('status_diff', {'volume': '60'}), ('volume', '60')]
+
+
+def test_is_current(loop):
+    cache = live_cache(loop, FakeMPD(status()))
+
+    assert cache.is_current(status(elapsed='7.5', bitrate='128'))
+    assert not cache.is_current(status(state='pause'))
+    assert not cache.is_current(status(song='1'))
+
+
+def test_wait_no_change(loop):
+    mpd = FakeMPD(status(elapsed='3.000'))
+    cache = live_cache(loop, mpd)
+    resource = SimpleNamespace(mpd=mpd, cache=cache)
+    start = loop.time()
+
+    data = loop.run_until_complete(MPD.wait(resource, cache.status_version))
+
+    # `clear` of an empty playlist: no idle event comes, no 1s stall
+    assert loop.time() - start < 0.5
+    assert data == status()
+    assert mpd.calls == 1
+
+
+def test_wait_change(loop):
+    mpd = FakeMPD(status(state='pause'))
+    cache = live_cache(loop, mpd)
+    resource = SimpleNamespace(mpd=mpd, cache=cache)
+    version = cache.status_version
+
+    # the watcher gets the idle event a moment later
+    loop.call_later(0.05, cache._set_status, status(state='pause'))
+    data = loop.run_until_complete(MPD.wait(resource, version))
+
+    assert data['state'] == 'pause'
+    assert cache.status_version == version + 1
+
+
+def test_wait_already_changed(loop):
+    mpd = FakeMPD(status())
+    cache = live_cache(loop, mpd)
+    resource = SimpleNamespace(mpd=mpd, cache=cache)
+
+    data = loop.run_until_complete(
+        MPD.wait(resource, cache.status_version - 1))
+
+    assert data == status()
+    assert mpd.calls == 0
+
+
+def events_view(loop, cache, keepalive=15):
+    resource = SimpleNamespace(cache=cache)
+    resource.subscribe = lambda: MPDEvents.subscribe(resource)
+    resource.snapshot = lambda: MPDEvents.snapshot(resource)
+
+    view = SimpleNamespace(
+        request=SimpleNamespace(transport=FakeTransport()),
+        resource=resource, keepalive=keepalive)
+    task = asyncio.async(MPDEventsView.get(view), loop=loop)
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    return view.request.transport, task
+
+
+SONG = {'file': 'a.mp3', 'id': 1, 'pos': 0}
+
+
+def test_events(loop):
+    cache = live_cache(loop, FakeMPD(status()))
+    cache._set_playlist([SONG])
+    transport, task = events_view(loop, cache)
+
+    assert b'Content-Type: text/event-stream' in transport.data
+    assert transport.events() == [('status', status()), ('playlist', [SONG])]
+
+    cache._set_status(status(volume='60'))  # from the watcher
+    cache.stop()
+    response = loop.run_until_complete(task)
+
+    assert response.status == 200
+    assert transport.events()[2:] == [
+        ('status_diff', {'volume': '60'}),
+        ('volume', '60'),
+    ]
+    assert not cache._subscriptions
+
+
+def test_events_reset(loop):
+    cache = live_cache(loop, FakeMPD(status()))
+    cache._set_playlist([SONG])
+    transport, task = events_view(loop, cache)
+
+    # the queue overflowed: the changes were lost
+    subscription, = cache._subscriptions
+    cache.status = status(state='stop')
+    subscription.push('reset', None)
+    loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    cache.stop()
+    loop.run_until_complete(task)
+
+    # the client gets everything again
+    assert transport.events()[2:] == [
+        ('status', status(state='stop')),
+        ('playlist', [SONG]),
+    ]
+
+
+def test_events_keepalive(loop):
+    cache = live_cache(loop, FakeMPD(status()))
+    transport, task = events_view(loop, cache, keepalive=0.02)
+
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    cache._set_status(status(state='pause'))
+    cache.stop()
+    loop.run_until_complete(task)
+
+    events = transport.events()
+    comments = events[2:-1]
+
+    assert len(comments) >= 2
+    assert all(e == ': keepalive' for e in comments)
+    assert events[-1] == ('status_diff', {'state': 'pause'})
+
+
+def test_events_disconnect(loop):
+    cache = live_cache(loop, FakeMPD(status()))
+    transport, task = events_view(loop, cache, keepalive=0.02)
+
+    assert len(cache._subscriptions) == 1
+
+    transport.closed = True  # the next keepalive fails
+    loop.run_until_complete(asyncio.wait_for(task, 1, loop=loop))
+
+    assert not cache._subscriptions
@@ -0,0 +1,86 @@
+import asyncio
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.pipe import AsyncPipe, BLOCK, DROP_NEWEST
+from zr.lib.nrf24.sim import SimulatedNRF24
+from zr.lib.nrf24.worker import RadioWorker
+
+ADDRESS = 0xd1d2d3d2d1
+
+
+def open_radio(loop, sim, **pipe_kwargs):
+    worker = RadioWorker(lambda: NRF24(backend=sim), loop=loop)
+    radio = loop.run_until_complete(worker.open())
+
+    def setup():
+        radio.__enter__()
+        pipe = AsyncPipe(radio, 0, loop=loop, **pipe_kwargs)
+        pipe.address = ADDRESS
+        pipe.payload_length = 2
+        pipe.enabled = True
+        radio.pipes[0] = pipe
+        radio.status = NRF24.STATUS.rx
+        return pipe
+
+    pipe = loop.run_until_complete(worker.call(setup))
+    return worker, pipe
+
+
+def read(loop, worker):
+    received = loop.run_until_complete(worker.read_rx_fifo())
+    loop.run_until_complete(asyncio.sleep(0))  # deliveries from the thread
+    return received
+
+
+def test_deliver(loop):
+    sim = SimulatedNRF24()
+    worker, pipe = open_radio(loop, sim)
+
+    sim.transmit(ADDRESS, b'v\x01')
+    sim.transmit(ADDRESS, b'v\x02')
+
+    assert read(loop, worker) == {0: 2}
+    assert [pipe.receive(), pipe.receive()] == [b'v\x01', b'v\x02']
+
+    loop.run_until_complete(worker.close())
+
+
+def test_block_leaves_payloads_in_fifo(loop):
+    sim = SimulatedNRF24()
+    worker, pipe = open_radio(loop, sim, queue_size=2, overflow=BLOCK)
+    spaces = []
+    pipe.on_space = lambda: spaces.append(True)
+
+    for n in range(3):
+        sim.transmit(ADDRESS, bytes([n, n]))
+
+    # all three are read by one call in the thread, before the loop
+    # had a chance to queue the first of them
+    assert read(loop, worker) == {0: 2}
+    assert len(sim.rx_fifo) == 1
+    assert pipe.dropped == 0
+    assert pipe.blocked
+
+    assert pipe.receive() == b'\x00\x00'
+    assert spaces == [True]
+
+    assert read(loop, worker) == {0: 1}
+    assert not sim.rx_fifo
+    assert [pipe.receive(), pipe.receive()] == [b'\x01\x01', b'\x02\x02']
+    assert pipe.dropped == 0
+
+    loop.run_until_complete(worker.close())
+
+
+def test_drop_newest(loop):
+    sim = SimulatedNRF24()
+    worker, pipe = open_radio(loop, sim, queue_size=2, overflow=DROP_NEWEST)
+
+    for n in range(3):
+        sim.transmit(ADDRESS, bytes([n, n]))
+
+    assert read(loop, worker) == {0: 3}
+    assert pipe.dropped == 1
+    assert [pipe.receive(), pipe.receive()] == [b'\x00\x00', b'\x01\x01']
+
+    loop.run_until_complete(worker.close())
@@ -1,21 +1,18 @@
 import os
-import json
 import asyncio
 import signal
 import functools
 import logging
 
-import aiompd
-
-try:
-    from zr.lib.nrf24 import NRF24
-except ImportError:
-    WITH_RADIO = False
-else:
-    WITH_RADIO = True
-
-from zr.mpd_ctrl.remote import MpdPipe
+from zr.lib.loopmon import LoopMonitor, PROFILE as LOOP_PROFILE
+from zr.lib.nrf24.backend import HAS_HARDWARE as WITH_RADIO
+from zr.lib.watch import FileWatcher
+from zr.mpd_ctrl.cache import MPDCache
+from zr.mpd_ctrl.pool import MPDPool
+from zr.mpd_ctrl.radio import RadioController
 from zr.mpd_ctrl.scheduler import MPDScheduler
+from zr.mpd_ctrl.streams import StreamProber
+from zr.settings import Settings, SettingsError
 
 from aiotraversal import Application as Web
 
@@ -36,72 +33,6 @@ def logging_setup():
     logging.getLogger('aiompd').setLevel('INFO')
 
 
-class RadioController:
-    _stop = True
-
-    def __init__(self, mpd):
-        self.mpd = mpd
-        self.radio = NRF24(csn=26, ce=24)
-
-    @asyncio.coroutine
-    def start(self, interval):
-        self._stop = False
-
-        radio = self.radio
-        with radio:
-            radio.status = NRF24.STATUS.stand_by
-
-            radio._registry['CONFIG']['EN_CRC'] = False
-            radio._registry['CONFIG']['CRCO'] = 1
-            radio._registry['RF_SETUP']['RF_DR'] = 1
-            radio._registry['SETUP_AW']['AW'] = 0b11
-
-            radio.channel = 13
-
-            radio.pipes[0] = MpdPipe(self.mpd, self.radio, 0, queue_size=10)
-
-        yield from asyncio.sleep(0.1)  # for stable start radio
-
-        yield from self._start_pipes()
-        yield from self._main_circle(interval)
-        yield from self._stop_pipes()
-
-        self.radio.close()
-        log.info('{}.coro stoped'.format(self.__class__.__name__))
-
-    def stop(self):
-        self._stop = True
-
-    @asyncio.coroutine
-    def _main_circle(self, interval):
-        with self.radio:
-            self.radio.status = NRF24.STATUS.rx  # blocking!!!
-
-            while not self._stop:
-                self.radio.read_rx_fifo()
-                yield from asyncio.sleep(interval)
-
-    @asyncio.coroutine
-    def _start_pipes(self):
-        self._pipes_tasks = []
-        for pipe in self.radio.pipes.values():
-            if hasattr(pipe, 'task'):
-                task = asyncio.async(pipe.task())
-                self._pipes_tasks.append(task)
-
-    @asyncio.coroutine
-    def _stop_pipes(self):
-        for pipe in self.radio.pipes.values():
-            if hasattr(pipe, 'stop'):
-                pipe.stop()
-
-        yield from asyncio.wait(self._pipes_tasks, timeout=2)
-
-        for task in self._pipes_tasks:
-            if not task.done():
-                task.cancel()
-
-
 def exit_handler(loop, signame):
     log.info('got signal {}: exit'.format(signame))
     loop.stop()
@@ -110,30 +41,91 @@ def exit_handler(loop, signame):
 def main():
     logging_setup()
 
-    if os.path.isfile(SETTINGS):
-        with open(SETTINGS) as f:
-            settings = json.load(f)
-    else:
-        settings = {}
+    settings = Settings.load(SETTINGS)
 
     loop = asyncio.get_event_loop()
     tasks = []
 
-    mpd = loop.run_until_complete(aiompd.Client.make_connection())
-
-    mpd_scheduler = MPDScheduler(mpd=mpd, settings=settings)
+    loop_settings = settings.loop
+    loop_monitor = LoopMonitor(
+        loop,
+        interval=loop_settings.get('interval', 0.25),
+        threshold=loop_settings.get('threshold', 0.1),
+        slow=loop_settings.get('slow', 0.05),
+        profile=loop_settings.get('profile', LOOP_PROFILE))
+    loop_monitor.start()
+
+    mpd_settings = settings.mpd
+    mpd = MPDPool(
+        host=mpd_settings.get('host', 'localhost'),
+        port=mpd_settings.get('port', 6600),
+        size=mpd_settings.get('pool_size', 2),
+        priority_size=mpd_settings.get('priority_size', 1),
+        keepalive=mpd_settings.get('keepalive', 30),
+        loop=loop)
+    loop.run_until_complete(mpd.start())
+
+    mpd_cache = MPDCache(mpd, loop=loop)
+    mpd_cache.start()
+
+    streams_settings = settings.streams
+    streams = StreamProber(
+        lambda: settings.playlists,
+        interval=streams_settings.get('interval', 600),
+        ttl=streams_settings.get('ttl', 900),
+        timeout=streams_settings.get('timeout', 5),
+        concurrency=streams_settings.get('concurrency', 4),
+        loop=loop)
+    streams.start()
+
+    mpd_scheduler = MPDScheduler(mpd=mpd, settings=settings,
+                                 cache=mpd_cache, prober=streams)
     tasks.append(asyncio.async(mpd_scheduler.start()))
 
     if WITH_RADIO:
-        radio_controller = RadioController(mpd=mpd)
-        tasks.append(asyncio.async(radio_controller.start(interval=0.05)))
+        radio_settings = settings.radio
+        radio_controller = RadioController(
+            mpd=mpd.priority, irq=radio_settings.get('irq'),
+            dynamic_payload=radio_settings.get('dynamic_payload', False))
+        tasks.append(asyncio.async(radio_controller.start(
+            interval=radio_settings.get('interval', 0.05))))
 
     web = Web()
     web['mpd'] = mpd
-    web['settings'].update(settings)
+    web['mpd_cache'] = mpd_cache
+    web['streams'] = streams
+    web['loop_monitor'] = loop_monitor
+    web['settings'].update(settings.raw)
     web.include('zr.web')
     web.start(loop)
 
+    def reload_settings():
+        nonlocal settings
+
+        try:
+            new = Settings.load(SETTINGS, missing_ok=False)
+        except SettingsError as exc:
+            log.error('settings are not reloaded: {}'.format(exc))
+            return
+
+        changes = settings.diff(new)
+        log.info('settings reloaded: {}'.format(changes))
+
+        mpd_scheduler.update(new)
+
+        for key in set(settings.raw) - set(new.raw):
+            web['settings'].pop(key, None)
+
+        web['settings'].update(new.raw)
+        settings = new
+
+        if changes.restart:
+            log.warning('restart to apply changes of {}'.format(
+                ', '.join(sorted(changes.restart))))
+
+    settings_watcher = FileWatcher(SETTINGS, reload_settings, loop=loop)
+    settings_watcher.start()
+
     for signame in ['SIGINT', 'SIGTERM']:
         loop.add_signal_handler(
             getattr(signal, signame),
@@ -142,7 +134,11 @@ def main():
     try:
         loop.run_forever()
 
+        settings_watcher.stop()
+        loop_monitor.stop()
         mpd_scheduler.stop()
+        mpd_cache.stop()
+        streams.stop()
 
         if WITH_RADIO:
             radio_controller.stop()
@@ -158,6 +154,7 @@ def main():
                     'exception': exc,
                 })
     finally:
+        mpd.close()
         loop.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,356 @@
+""" Scheduler of recurring jobs on one timer heap
+
+    scheduler = Scheduler()
+    scheduler.add('wakeup', Rule('07:00', weekdays='mon-fri',
+                                 overrides={'sat': '09:30'},
+                                 timezone='local'), callback)
+    scheduler.start()
+    scheduler.next_runs(5)
+
+`callback(name, when)` is called for every fire, coroutines are started
+as tasks.  With `lead` the callback is called that many seconds before
+`when`, to prepare.  Fire times are wall-clock epoch seconds computed by `Rule` in
+UTC or in the local timezone (DST-aware through time.mktime).
+
+The engine sleeps on the monotonic loop clock, at most `max_sleep`
+seconds, and compares both clocks after every wakeup.  After a jump
+forward (NTP on a Pi without RTC) late fires are handled by
+`misfire_grace`; after a jump back the heap is re-armed from the new wall
+time, otherwise jobs would wait for the old future time.
+
+For simulations pass `SimClock` and call `run_until()`:
+
+    clock = SimClock(start)
+    scheduler = Scheduler(clock=clock)
+    ...
+    fired = scheduler.run_until(start + 365 * 86400)
+"""
+from datetime import date, datetime, time as dtime, timedelta, timezone
+import asyncio
+import calendar
+import heapq
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+SEARCH_DAYS = 400  # enough for yearly date overrides
+
+
+def parse_time(value):
+    """ 'HH:MM[:SS]' or datetime.time -> datetime.time
+    """
+    if isinstance(value, dtime):
+        return value.replace(tzinfo=None)
+
+    return dtime(*[int(i) for i in value.split(':')])
+
+
+def parse_weekdays(value):
+    """ None, 'mon-fri', 'sat,sun' or list of names -> set of 0..6
+    """
+    if value is None:
+        return set(range(7))
+
+    if isinstance(value, str):
+        value = value.split(',')
+
+    days = set()
+
+    for item in value:
+        item = item.strip().lower()
+
+        if '-' in item:
+            first, last = (WEEKDAYS.index(d) for d in item.split('-'))
+            days.update(range(first, last + 1))
+        else:
+            days.add(WEEKDAYS.index(item))
+
+    return days
+
+
+class Rule:
+    """ Daily recurrence
+
+    `weekdays` limits days of the week, `overrides` maps a weekday name or
+    an ISO date ('2015-12-31') to another start time, or to None to skip
+    that day.  `timezone` is 'utc' or 'local'.
+    """
+    def __init__(self, start, weekdays=None, overrides=None, timezone='utc'):
+        if timezone not in ('utc', 'local'):
+            raise ValueError('bad timezone: {!r}'.format(timezone))
+
+        self.start = parse_time(start)
+        self.weekdays = parse_weekdays(weekdays)
+        self.timezone = timezone
+
+        self.day_overrides = {}
+        self.date_overrides = {}
+
+        for key, value in (overrides or {}).items():
+            value = None if value is None else parse_time(value)
+
+            if key.lower() in WEEKDAYS:
+                self.day_overrides[WEEKDAYS.index(key.lower())] = value
+            else:
+                day = datetime.strptime(key, '%Y-%m-%d').date()
+                self.date_overrides[day] = value
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings['start'],
+                   weekdays=settings.get('weekdays'),
+                   overrides=settings.get('overrides'),
+                   timezone=settings.get('timezone', 'utc'))
+
+    def time_for(self, day):
+        """ Start time on the date or None
+        """
+        if day in self.date_overrides:
+            return self.date_overrides[day]
+        elif day.weekday() in self.day_overrides:
+            return self.day_overrides[day.weekday()]
+        elif day.weekday() in self.weekdays:
+            return self.start
+        else:
+            return None
+
+    def next_after(self, timestamp):
+        """ First fire time (epoch seconds) after `timestamp` or None
+        """
+        day = self._date(timestamp)
+
+        for _ in range(SEARCH_DAYS):
+            start = self.time_for(day)
+
+            if start is not None:
+                when = self._timestamp(day, start)
+
+                if when > timestamp:
+                    return when
+
+            day += timedelta(days=1)
+
+        return None
+
+    def _date(self, timestamp):
+        if self.timezone == 'utc':
+            tm = time.gmtime(timestamp)
+        else:
+            tm = time.localtime(timestamp)
+
+        # previous day too: its time may still be ahead after DST shift
+        return date(tm.tm_year, tm.tm_mon, tm.tm_mday) - timedelta(days=1)
+
+    def _timestamp(self, day, start):
+        tm = (day.year, day.month, day.day,
+              start.hour, start.minute, start.second, 0, 0, -1)
+
+        if self.timezone == 'utc':
+            return calendar.timegm(tm)
+        else:
+            return time.mktime(tm)  # isdst=-1: let the C library decide
+
+
+class Clock:
+    """ Wall and monotonic clocks of the engine
+    """
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+class SimClock(Clock):
+    """ Clock moved by hand, for simulations
+    """
+    def __init__(self, start=0):
+        self._time = start
+        self._monotonic = 0
+
+    def time(self):
+        return self._time
+
+    def monotonic(self):
+        return self._monotonic
+
+    def advance(self, seconds):
+        self._time += seconds
+        self._monotonic += seconds
+
+    def jump(self, seconds):
+        """ Change the wall clock only, like NTP does
+        """
+        self._time += seconds
+
+
+class Scheduler:
+    """ Jobs on a heap of `(fire time, sequence, name)`
+
+    Fires later than `misfire_grace` seconds (after suspend or a clock
+    jump forward) are skipped.  The engine wakes up at least every
+    `max_sleep` seconds to check the clocks.
+    """
+    def __init__(self, clock=None, loop=None, misfire_grace=300,
+                 max_sleep=60, jump_threshold=2):
+        self.clock = clock if clock is not None else Clock()
+        self.misfire_grace = misfire_grace
+        self.max_sleep = max_sleep
+        self.jump_threshold = jump_threshold
+
+        self.fired = 0
+        self.missed = 0
+        self.jumps = 0
+
+        self._loop = loop
+        self._jobs = {}
+        self._heap = []
+        self._seq = 0
+        self._task = None
+        self._wakeup = None
+
+    def add(self, name, rule, callback, lead=0):
+        self.remove(name)
+        self._jobs[name] = (rule, callback, lead)
+        self._arm(name, self.clock.time())
+        self._kick()
+
+    def remove(self, name):
+        self._jobs.pop(name, None)
+        self._heap = [item for item in self._heap if item[2] != name]
+        heapq.heapify(self._heap)
+
+    def next_runs(self, count=10, until=None):
+        """ List of upcoming `(aware datetime in UTC, name)`, nothing fires
+        """
+        heap = list(self._heap)
+        runs = []
+
+        while heap and len(runs) < count:
+            fire, _, name = heapq.heappop(heap)
+            rule, _, lead = self._jobs[name]
+            when = fire + lead
+
+            if until is not None and when > until:
+                break
+
+            runs.append((datetime.fromtimestamp(when, timezone.utc), name))
+
+            following = rule.next_after(when)
+            if following is not None:
+                heapq.heappush(heap, (following - lead, 0, name))
+
+        return runs
+
+    def advance(self, now=None):
+        """ Fire all jobs due at `now`, return list of `(when, name)`
+        """
+        if now is None:
+            now = self.clock.time()
+
+        fired = []
+
+        while self._heap and self._heap[0][0] <= now:
+            fire, _, name = heapq.heappop(self._heap)
+            rule, callback, lead = self._jobs[name]
+            when = fire + lead
+
+            if now - when > self.misfire_grace:
+                self.missed += 1
+                log.warning('{}: missed start at {:%Y-%m-%d %H:%M:%S}'.format(
+                    name, datetime.fromtimestamp(when, timezone.utc)))
+            else:
+                self.fired += 1
+                fired.append((when, name))
+                self._call(callback, name, when)
+
+            self._arm(name, max(when, now))
+
+        return fired
+
+    def rearm(self):
+        """ Compute fire times of all jobs again from the wall clock
+        """
+        now = self.clock.time()
+        self._heap = []
+
+        for name in self._jobs:
+            self._arm(name, now)
+
+    def run_until(self, until):
+        """ Fast-forward SimClock to `until`, firing jobs on the way
+        """
+        fired = []
+
+        # an overdue job (after a jump forward) must not turn the clock back
+        while self._heap and self._heap[0][0] <= until:
+            self.clock.advance(max(0, self._heap[0][0] - self.clock.time()))
+            fired.extend(self.advance())
+
+        self.clock.advance(max(0, until - self.clock.time()))
+        return fired
+
+    def start(self):
+        self._task = asyncio.async(self._main_circle(), loop=self._loop)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @asyncio.coroutine
+    def _main_circle(self):
+        loop = self._loop or asyncio.get_event_loop()
+
+        while True:
+            self.advance()
+
+            if self._heap:
+                delay = min(self._heap[0][0] - self.clock.time(), self.max_sleep)
+            else:
+                delay = self.max_sleep
+
+            wall = self.clock.time()
+            mono = self.clock.monotonic()
+
+            self._wakeup = asyncio.Event(loop=loop)
+
+            try:
+                yield from asyncio.wait_for(
+                    self._wakeup.wait(), max(0, delay), loop=loop)
+            except asyncio.TimeoutError:
+                pass
+
+            drift = (self.clock.time() - wall) - (self.clock.monotonic() - mono)
+
+            if abs(drift) > self.jump_threshold:
+                self.jumps += 1
+                log.warning('wall clock jumped by {:.1f}s'.format(drift))
+
+                if drift < 0:
+                    self.rearm()
+
+    def _arm(self, name, after):
+        rule, _, lead = self._jobs[name]
+        when = rule.next_after(after)
+
+        if when is not None:
+            self._push(when - lead, name)
+
+    def _push(self, when, name):
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, name))
+
+    def _call(self, callback, name, when):
+        result = callback(name, when)
+
+        if asyncio.iscoroutine(result):
+            asyncio.async(result, loop=self._loop)
+
+    def _kick(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
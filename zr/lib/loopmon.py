@@ -0,0 +1,238 @@
+""" Health of the shared event loop
+
+    monitor = LoopMonitor(loop, interval=0.25, threshold=0.1)
+    monitor.start()
+    monitor.stats()
+
+Lag: a timer is scheduled every `interval` seconds, the difference
+between the planned and the real time of its call is the scheduling lag
+of everything else on the loop (zr_loop_lag_seconds).
+
+Stalls: a watchdog thread checks the heartbeat of that timer.  When the
+loop did not come back for `threshold` seconds, the stack of the loop
+thread is taken right then, so it shows the code that blocks the loop
+(time.sleep in a driver, a long computation), not the place it returned
+to.  Stalls are logged and kept in `stalls`.
+
+Slow callbacks: off by default, the lag timer and the watchdog cost
+next to nothing.  With `profile=True` (or ZR_LOOP_PROFILE=1 in the
+environment) every callback run by any loop of the process is timed:
+asyncio.events.Handle._run is wrapped, about 0.3 us per callback, until
+`stop()` puts back the function it replaced (when nothing wrapped it
+since, otherwise the wrapper only passes calls through).  Callbacks
+longer than `slow` seconds are counted and the `top` slowest are kept.
+"""
+from collections import deque
+import asyncio
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from zr.lib import metrics
+
+log = logging.getLogger(__name__)
+
+LAG_SECONDS = metrics.histogram(
+    'zr_loop_lag_seconds', 'Delay of a timer on the event loop')
+STALLS = metrics.counter(
+    'zr_loop_stalls_total', 'Event loop blocked longer than the threshold')
+SLOW_CALLBACKS = metrics.counter(
+    'zr_loop_slow_callbacks_total', 'Callbacks running longer than `slow`')
+
+PROFILE = os.environ.get('ZR_LOOP_PROFILE', '') not in ('', '0')
+
+_handle_run = asyncio.events.Handle._run
+
+
+class LoopMonitor:
+    def __init__(self, loop=None, interval=0.25, threshold=0.1, slow=0.05,
+                 top=20, profile=PROFILE):
+        self.interval = interval
+        self.threshold = threshold
+        self.slow = slow
+        self.top = top
+        self.profile = profile
+
+        self.lag = 0
+        self.lag_max = 0
+        self.stalls = deque(maxlen=top)
+
+        self._loop = loop or asyncio.get_event_loop()
+        self._slowest = []  # min-heap of (duration, seq, info)
+        self._seq = 0
+        self._handle = None
+        self._thread = None
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._beat = 0  # written by the loop thread only
+
+    def start(self):
+        self._thread_id = threading.get_ident()  # loop runs in this thread
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._schedule()
+
+        self._thread = threading.Thread(
+            target=self._watchdog, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+        if self.profile:
+            _install(self)
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        if self.profile:
+            _uninstall(self)
+
+    def slowest(self):
+        """ List of the slowest callbacks, the slowest first
+        """
+        return [info for _, _, info in sorted(self._slowest, reverse=True)]
+
+    def stats(self):
+        return {
+            'lag': self.lag,
+            'lag_max': self.lag_max,
+            'threshold': self.threshold,
+            'profile': self.profile,
+            'stalls': list(self.stalls),
+            'slowest': self.slowest(),
+        }
+
+    def _schedule(self):
+        self._expected = self._loop.time() + self.interval
+        self._handle = self._loop.call_at(self._expected, self._tick)
+
+    def _tick(self):
+        lag = max(0, self._loop.time() - self._expected)
+        self.lag = lag
+        self.lag_max = max(self.lag_max, lag)
+        LAG_SECONDS.observe(lag)
+
+        self._beat = time.monotonic()
+        self._schedule()
+
+    def _watchdog(self):
+        # runs in own thread: notices a loop which does not come back,
+        # one report per stall: until the next heartbeat
+        reported = None
+
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+
+            if blocked < self.threshold or beat == reported:
+                continue
+
+            reported = beat
+            frame = sys._current_frames().get(self._thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            del frame
+
+            STALLS.inc()
+            self.stalls.append({
+                'time': time.time(),
+                'blocked': blocked,
+                'stack': [line.rstrip() for line in stack],
+            })
+
+            log.warning('event loop blocked for {:.3f}s at:\n{}'.format(
+                blocked, ''.join(stack[-8:])))
+
+    def _observe(self, handle, duration):
+        # called in the loop thread for callbacks longer than `slow`
+        SLOW_CALLBACKS.inc()
+
+        if len(self._slowest) >= self.top and duration <= self._slowest[0][0]:
+            return
+
+        self._seq += 1
+        info = {
+            'duration': duration,
+            'time': time.time(),
+            'callback': _describe(handle),
+        }
+
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, (duration, self._seq, info))
+        else:
+            heapq.heapreplace(self._slowest, (duration, self._seq, info))
+
+        if duration >= self.threshold:
+            log.warning('slow callback {:.3f}s: {}'.format(
+                duration, info['callback']))
+
+
+_monitor = None
+
+
+def _install(monitor):
+    global _monitor, _handle_run
+    _monitor = monitor
+    run = asyncio.events.Handle._run
+
+    if run is not _timed_run:
+        _handle_run = run  # maybe a wrapper of somebody else
+        asyncio.events.Handle._run = _timed_run
+
+
+def _uninstall(monitor):
+    global _monitor
+
+    if _monitor is not monitor:
+        return
+
+    _monitor = None
+
+    if asyncio.events.Handle._run is _timed_run:
+        asyncio.events.Handle._run = _handle_run
+    else:
+        log.debug('Handle._run is wrapped again, left in place')
+
+
+def _timed_run(handle):
+    start = time.perf_counter()
+
+    try:
+        _handle_run(handle)
+    finally:
+        duration = time.perf_counter() - start
+        monitor = _monitor
+
+        if monitor is not None and duration >= monitor.slow:
+            monitor._observe(handle, duration)
+
+
+def _describe(handle):
+    """ Coroutine name and the line it stopped on, or the callback repr
+    """
+    callback = handle._callback
+    task = getattr(callback, '__self__', None)
+
+    if not isinstance(task, asyncio.Task):
+        # tasks of the C implementation are wakened by a wrapper
+        task = next((arg for arg in handle._args or ()
+                     if isinstance(arg, asyncio.Task)), task)
+
+    if isinstance(task, asyncio.Task):
+        coro = task._coro
+        name = getattr(coro, '__qualname__', getattr(coro, '__name__', coro))
+        frame = getattr(coro, 'gi_frame', None) or \
+            getattr(coro, 'cr_frame', None)
+
+        if frame is not None:
+            return '{} at {}:{}'.format(
+                name, frame.f_code.co_filename, frame.f_lineno)
+
+        return 'task {}'.format(name)
+
+    return repr(callback)
@@ -0,0 +1,251 @@
+""" Counters, gauges and histograms in Prometheus text format
+
+    REQUESTS = metrics.counter('zr_requests_total', 'Requests', ['view'])
+    LATENCY = metrics.histogram('zr_latency_seconds', 'Latency',
+                                buckets=metrics.LATENCY_BUCKETS)
+
+    REQUESTS.labels('root').inc()
+    LATENCY.observe(time.perf_counter() - start)
+
+    text = metrics.REGISTRY.exposition()
+
+Metrics are made once at import time of the instrumented module.  An
+observation is plain arithmetic on preallocated lists, a histogram
+finds its bucket with `bisect` and keeps bucket counts non-cumulative,
+they are summed only for the exposition.  Children of labelled metrics
+are cached, look them up once where it is possible.
+
+Values are not locked: an increment from another thread may only race
+with the exposition, which is fine for monitoring.
+"""
+from bisect import bisect_left
+import math
+import time
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+                   0.01, 0.05, 0.1, 0.5, 1, 5)
+
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+INF = float('inf')
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=(), **kwargs):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._kwargs = kwargs
+        self._children = {}
+
+        if not self.labelnames:
+            self._init(**kwargs)
+
+    def labels(self, *values):
+        """ Child metric for label values (strings, in order of `labelnames`)
+        """
+        child = self._children.get(values)
+
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('{}: expected labels {}'.format(
+                    self.name, self.labelnames))
+
+            child = self.__class__(self.name, self.help, **self._kwargs)
+            self._children[values] = child
+
+        return child
+
+    def samples(self):
+        """ Iterate `(suffix, labels dict, value)`
+        """
+        if not self.labelnames:
+            yield from self._samples({})
+            return
+
+        for values in sorted(self._children):
+            labels = dict(zip(self.labelnames, values))
+            yield from self._children[values]._samples(labels)
+
+    def _init(self):
+        raise NotImplementedError
+
+    def _samples(self, labels):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _init(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def _samples(self, labels):
+        yield '', labels, self.value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def _init(self, func=None):
+        self.value = 0
+        self._func = func
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def _samples(self, labels):
+        yield '', labels, self.value if self._func is None else self._func()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def _init(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # the last is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, labels):
+        total = 0
+
+        for bound, count in zip(self.buckets + (INF,), self.counts):
+            total += count
+            le = '+Inf' if bound == INF else repr(float(bound))
+            yield '_bucket', dict(labels, le=le), total
+
+        yield '_sum', labels, self.sum
+        yield '_count', labels, self.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """ Add metric, return the registered one with the same name
+        """
+        registered = self._metrics.get(metric.name)
+
+        if registered is not None:
+            if registered.type != metric.type:
+                raise ValueError('metric {} is already a {}'.format(
+                    metric.name, registered.type))
+
+            return registered
+
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def exposition(self):
+        """ Text format 0.0.4
+        """
+        lines = []
+
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append('# HELP {} {}'.format(name, _escape_help(metric.help)))
+            lines.append('# TYPE {} {}'.format(name, metric.type))
+
+            for suffix, labels, value in metric.samples():
+                lines.append('{}{}{} {}'.format(
+                    name, suffix, _format_labels(labels), _format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name, help, labelnames=(), registry=REGISTRY):
+    return registry.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=(), func=None, registry=REGISTRY):
+    """ Gauge, with `func` its value is read on exposition
+    """
+    return registry.register(Gauge(name, help, labelnames, func=func))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS,
+              registry=REGISTRY):
+    return registry.register(Histogram(name, help, labelnames, buckets=buckets))
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\')
+                                         .replace('"', r'\"')
+                                         .replace('\n', r'\n'))
+        for key, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        elif math.isnan(value):
+            return 'NaN'
+
+        return repr(value)
+
+    return str(int(value))
+
+
+def bench(count=1000000):
+    """ Return seconds per call: (counter inc, histogram observe)
+    """
+    registry = Registry()
+    c = counter('bench_total', 'bench', registry=registry)
+    h = histogram('bench_seconds', 'bench', registry=registry)
+    values = [(n % 1000) / 100000 for n in range(count)]
+
+    start = time.perf_counter()
+    for _ in values:
+        c.inc()
+    inc = (time.perf_counter() - start) / count
+
+    start = time.perf_counter()
+    for value in values:
+        h.observe(value)
+    observe = (time.perf_counter() - start) / count
+
+    return inc, observe
+
+
+if __name__ == '__main__':
+    inc, observe = bench()
+    print('counter inc {:.0f} ns, histogram observe {:.0f} ns'.format(
+        inc * 1e9, observe * 1e9))
@@ -1,13 +1,14 @@
 import time
 import enum
-# from contextlib import contextmanager
+from collections import namedtuple
+from contextlib import contextmanager
 import logging
 
-import spidev
-from quick2wire.gpio import Out, pi_header_1
-
+from zr.lib import metrics
+from zr.lib.nrf24.backend import SpidevBackend
 from zr.lib.nrf24.registry import Registry
-from zr.lib.nrf24.pipe import Pipe
+from zr.lib.nrf24.pipe import Pipe, MAX_PAYLOAD_SIZE
+from zr.lib.nrf24.timing import get_profile, delay
 from zr.lib.nrf24.mnemonic import *
 
 
@@ -16,17 +17,24 @@ logger = logging.getLogger(__name__)
 
 MAX_CHANNEL = 127
 
+SPI_SECONDS = metrics.histogram(
+    'zr_radio_spi_seconds', 'SPI transaction time with CSN delays', ['op'])
+
 
 def _acquire_csn(meth):
+    observe = SPI_SECONDS.labels(meth.__name__.strip('_')).observe
+
     def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
         self._csn.value = 0
-        time.sleep(0.001)
-        logger.debug('CSN = 0')
-        res = meth(self, *args, **kwargs)
-        self._csn.value = 1
-        time.sleep(0.001)
-        logger.debug('CSN = 1')
-        return res
+        delay(self.timing.csn_setup)
+        try:
+            return meth(self, *args, **kwargs)
+        finally:
+            self._csn.value = 1
+            delay(self.timing.csn_hold)
+            self.transactions += 1
+            observe(time.perf_counter() - start)
 
     return wrapper
 
@@ -44,42 +52,136 @@ def _check_status(*statuses):
     return wrapper
 
 
+class SendResult(namedtuple('SendResult', (
+        'ok', 'payloads', 'bytes', 'retransmits', 'elapsed'))):
+    """ Result of NRF24.send
+
+    `retransmits` is the sum of OBSERVE_TX.ARC_CNT read after every
+    TX_DS or MAX_RT seen, so it is exact only while the sender keeps up
+    with the chip.
+    """
+    @property
+    def throughput(self):
+        """ Bytes per second
+        """
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+
 class TX:
+    """ Transmitter to the address of the pipe, use `NRF24.tx(pipe)`
+    """
+    SAVED = ('EN_RXADDR', 'EN_AA', 'DYNPD', 'FEATURE')  # restored after tx
+
     def __init__(self, radio, pipe):
         self._radio = radio
-        self._pipe = pipe
-        self._csn = radio._csn
-        self._radio._registry['TX_ADDR'] = radio.pipe(pipe).address
-        self._payload_size = radio._registry['RX_PW_P' + str(pipe)]
+        self._pipe = radio.pipes[pipe]
+        self._dynamic = self._pipe.dynamic_payload
+        self._payload_size = self._pipe.payload_length
+
+        if not self._dynamic and not self._payload_size:
+            raise ValueError('payload length of pipe {} is 0'.format(pipe))
 
-    def write(self, data, no_ack=False):
+        registry = radio._registry
+        address = _address_to_int(self._pipe.full_address)
+
+        # auto ack comes back to pipe 0: it needs auto ack and, for dynamic
+        # payloads, DPL on pipe 0; W_TX_PAYLOAD_NO_ACK needs EN_DYN_ACK
+        self._rx_addr_p0 = registry['RX_ADDR_P0']
+        self._saved = {name: int(registry[name]) for name in self.SAVED}
+
+        feature = self._saved['FEATURE'] | (1 << EN_DYN_ACK)
+
+        if self._dynamic:
+            feature |= 1 << EN_DPL
+
+        registry['TX_ADDR'] = address
+        registry['RX_ADDR_P0'] = address
+        registry.write_bits('EN_RXADDR', 1 << ERX_P0, True)
+        registry.write_bits('EN_AA', 1 << ENAA_P0, True)
+        registry.write_bits('DYNPD', 1 << DPL_P0, self._dynamic)
+        registry['FEATURE'] = feature
+
+    def restore(self):
+        registry = self._radio._registry
+        registry['RX_ADDR_P0'] = _address_to_int(self._rx_addr_p0)
+
+        for name in self.SAVED:
+            registry[name] = self._saved[name]
+
+    def payloads(self, data):
+        """ Split data to payloads, static payloads padded with zeros
+        """
         if isinstance(data, str):
-            data.encode(data)
+            data = data.encode('utf8')
+
+        ps = MAX_PAYLOAD_SIZE if self._dynamic else self._payload_size
+
+        for n in range(0, len(data), ps):
+            payload = list(data[n:n + ps])
 
-        ps = self._payload_size
+            if not self._dynamic:
+                payload += [0x00] * (ps - len(payload))
 
-        for n in range((len(data) // ps) + 1):
-            payload_data = list(data[ps*n:ps*n+ps])
+            yield payload
 
-            if not payload_data:
+    def write(self, data, no_ack=False, timeout=1):
+        """ Send data and wait until the tx fifo is empty
+
+        Tx fifo is kept full while there are payloads.  On MAX_RT or
+        timeout the fifo is flushed and result is not ok.
+        """
+        radio = self._radio
+        registry = radio._registry
+        cmd = W_TX_PAYLOAD_NO_ACK if no_ack else W_TX_PAYLOAD
+
+        payloads = list(self.payloads(data))
+        size = sum(len(p) for p in payloads)
+        queued = 0
+        retransmits = 0
+        ok = True
+
+        start = time.perf_counter()
+        deadline = start + timeout
+
+        while True:
+            status = radio._get_status()
+
+            if status & (1 << MAX_RT):
+                retransmits += registry['OBSERVE_TX']['ARC_CNT']
+                logger.warning('MAX_RT, receiver unreachable')
+                ok = False
                 break
-            elif len(payload_data) < ps:
-                payload_data = [0x00]*(len(payload_data) - ps) + payload_data
 
-            if no_ack:
-                cmd = W_TX_PAYLOAD_NO_ACK
-            else:
-                cmd = W_TX_PAYLOAD
+            if status & (1 << TX_DS):
+                retransmits += registry['OBSERVE_TX']['ARC_CNT']
+                registry['STATUS'] = 1 << TX_DS
 
-            self._radio._csn.value = 0
-            payload = [cmd] + payload_data
-            self._radio._spi.xfer(payload)
-            self._radio._csn.value = 1
+            if queued < len(payloads) and not status & (1 << TX_FULL):
+                radio._transfer([cmd] + payloads[queued])
+                queued += 1
+                continue
+
+            if queued == len(payloads) and self.empty:
+                break
+
+            if time.perf_counter() > deadline:
+                logger.warning('send timeout')
+                ok = False
+                break
+
+            delay(radio.timing.tx_poll)
+
+        if not ok:
+            self.flush()
+
+        return SendResult(ok, len(payloads), size, retransmits,
+                          time.perf_counter() - start)
 
-    @_acquire_csn
     def flush(self):
-        self._csn = self._radio._csn
-        self._radio._spi.xfer([FLUSH_TX])
+        """ Drop tx fifo, then clear TX_DS and MAX_RT
+        """
+        self._radio._transfer([FLUSH_TX])
+        self._radio._registry['STATUS'] = (1 << TX_DS) | (1 << MAX_RT)
 
     @property
     def empty(self):
@@ -90,6 +192,10 @@ class TX:
         return self._radio._registry['FIFO_STATUS']['TX_FULL']
 
 
+def _address_to_int(data):
+    return sum(b << (8 * n) for n, b in enumerate(data))
+
+
 class NRF24:
     @enum.unique
     class STATUS(enum.Enum):
@@ -98,13 +204,25 @@ class NRF24:
         rx = 3
         tx = 4
 
-    def __init__(self, csn, ce, spi_major=0, spi_minor=0):
-        self._spi = spidev.SpiDev()
-        self._spi.open(spi_major, spi_minor)
-        self._csn = pi_header_1.pin(csn, direction=Out)
-        self._ce = pi_header_1.pin(ce, direction=Out)
+    transactions = 0
+    deliver = None  # callable(pipe, data), instead of pipe.receive_from_fifo
+
+    def __init__(self, csn=None, ce=None, spi_major=0, spi_minor=0,
+                 shadow_registers=True, timing='nrf24l01', backend=None,
+                 irq=None):
+        """ Pins, spi device and irq pin are used when `backend` is not given
+        """
+        self.timing = get_profile(timing)
+
+        if backend is None:
+            backend = SpidevBackend(csn, ce, spi_major, spi_minor, irq)
+
+        self.backend = backend
+        self._spi = backend.spi
+        self._csn = backend.csn
+        self._ce = backend.ce
 
-        self._registry = Registry(self)
+        self._registry = Registry(self, shadow=shadow_registers)
 
         self._status = NRF24.STATUS.power_down
 
@@ -171,6 +289,23 @@ class NRF24:
         self._ce.close()
         time.sleep(0.1)
         self._csn.close()
+        self.backend.close()
+
+    @_acquire_csn
+    def _transfer(self, buf):
+        return self._spi.xfer(buf)
+
+    def _get_status(self):
+        return self._transfer([NOP])[0]
+
+    def batch(self, commands):
+        """ Run several SPI commands back to back
+
+        The chip latches a command on the CSN falling edge, so every command
+        gets its own CSN frame, but frames follow each other with only
+        the delays from the timing profile.  Return list of responses.
+        """
+        return [self._transfer(list(buf)) for buf in commands]
 
     @_acquire_csn
     def _read_register(self, reg, blen=1):
@@ -180,7 +315,10 @@ class NRF24:
         buf += [NOP] * max(1, blen)
 
         data = self._spi.xfer(buf)[1:]
-        logger.debug('read registry {}, {} => {}'.format(reg, buf, data))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('read registry {}, {} => {}'.format(reg, buf, data))
+
         return data
 
     @_acquire_csn
@@ -196,7 +334,9 @@ class NRF24:
             i -= 1
 
         self._spi.xfer(buf)
-        logger.debug('write registry {}, {}'.format(reg, buf))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('write registry {}, {}'.format(reg, buf))
 
     @property
     def channel(self):
@@ -241,9 +381,9 @@ class NRF24:
         self._status = NRF24.STATUS.stand_by
 
         if old == NRF24.STATUS.power_down:
-            time.sleep(0.0015)
+            delay(self.timing.power_up)
         elif old in (NRF24.STATUS.rx, NRF24.STATUS.tx):
-            time.sleep(0.00013)
+            delay(self.timing.stand_by)
 
     @_check_status(STATUS.power_down, STATUS.stand_by)
     def _set_status_tx(self):
@@ -252,7 +392,7 @@ class NRF24:
 
         self._registry['CONFIG']['PRIM_RX'] = False
         self._ce.value = True
-        time.sleep(0.00002)
+        delay(self.timing.ce_high)
         self._status = NRF24.STATUS.tx
 
     @_check_status(STATUS.power_down, STATUS.stand_by)
@@ -267,40 +407,124 @@ class NRF24:
     def listening(self):
         self.status = NRF24.STATUS.rx
 
+    @property
+    def rx_ready(self):
+        """ RX_DR flag: new data in the rx fifo
+        """
+        return self._registry['STATUS']['RX_DR']
+
+    def clear_rx_ready(self):
+        """ Reset RX_DR flag and release the IRQ line
+        """
+        self._registry['STATUS'] = 1 << RX_DR
+
     @_acquire_csn
-    def _read_from_rx_fifo(self):
+    def _read_payload_width(self):
+        status, width = self._spi.xfer([R_RX_PL_WID, NOP])
+        return (status >> RX_P_NO) & 0b111, width
+
+    @_acquire_csn
+    def _read_rx_payload(self, width=None):
         status = self._spi.xfer([R_RX_PAYLOAD])[0]
-        pipe_number = (status >> 1) & 0b111  # get STATUS/RX_P_NO
+        pipe_number = (status >> RX_P_NO) & 0b111  # get STATUS/RX_P_NO
 
-        if pipe_number < 7:
+        if pipe_number in self.pipes:
             pipe = self.pipes[pipe_number]
-            data = self._spi.xfer([NOP] * pipe.payload_length)
-            logger.debug(
-                '_read_from_rx_fifo: {} bytes for pipe {}'.format(len(data), pipe.number))
+
+            if width is None:
+                width = pipe.payload_length
+
+            data = self._spi.xfer([NOP] * width)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('_read_from_rx_fifo: {} bytes for pipe {}'
+                             ''.format(len(data), pipe.number))
+
             return pipe, bytes(data)
         else:
             logger.debug('_read_from_rx_fifo: no data')
             return None, None
 
-    def read_rx_fifo(self, count=3):
+    @_acquire_csn
+    def _flush_rx(self):
+        self._spi.xfer([FLUSH_RX])
+
+    def _read_from_rx_fifo(self, dynamic=False):
+        if not dynamic:
+            return self._read_rx_payload()
+
+        pipe_number, width = self._read_payload_width()
+
+        if pipe_number not in self.pipes:
+            return None, None
+        elif width > MAX_PAYLOAD_SIZE:
+            logger.warning('bad payload width {}, flush rx fifo'.format(width))
+            self._flush_rx()
+            return None, None
+        elif self.pipes[pipe_number].dynamic_payload:
+            return self._read_rx_payload(width)
+        else:
+            return self._read_rx_payload()
+
+    def _rx_drained(self):
+        # clear RX_DR and check that nothing has arrived in the meantime
+        _, fifo_status = self.batch([
+            [W_REGISTER | STATUS, 1 << RX_DR],
+            [R_REGISTER | FIFO_STATUS, NOP],
+        ])
+        return bool(fifo_status[1] & (1 << RX_EMPTY))
+
+    def read_rx_fifo(self, count=None):
         """ This method read from radio rx fifo and send data to pipes
+
+        Without `count` the fifo is drained until RX_EMPTY and RX_DR
+        is cleared.  Return dict `{pipe number: count of payloads}`.
         """
-        res = False
+        received = {}
+        dynamic = self._registry['FEATURE']['EN_DPL']
+
+        while count is None or sum(received.values()) < count:
+            if any(pipe.blocked for pipe in self.pipes.values()):
+                break  # leave payloads in the fifo until reader makes room
+
+            pipe, data = self._read_from_rx_fifo(dynamic)
 
-        for _ in range(count):
-            pipe, data = self._read_from_rx_fifo()
             if pipe is not None:
-                pipe.receive_from_fifo(data)
-            else:
+                if self.deliver is None:
+                    pipe.receive_from_fifo(data)
+                else:
+                    self.deliver(pipe, data)
+
+                received[pipe.number] = received.get(pipe.number, 0) + 1
+            elif count is not None or self._rx_drained():
                 break
 
-        return res
+        return received
 
-    # @_check_status(STATUS.stand_by)
-    # @contextmanager
-    # def tx(self, pipe):
-    #     """ Go into TX mode
-    #     """
-    #     last, self.status = self.status, NRF24.STATUS.tx
-    #     yield TX(self, pipe)
-    #     self.status = last
+    @contextmanager
+    def tx(self, pipe):
+        """ Go into TX mode for sending to the address of the pipe
+        """
+        last = self.status
+
+        if last != NRF24.STATUS.stand_by:
+            self.status = NRF24.STATUS.stand_by
+
+        tx = TX(self, pipe)
+
+        try:
+            tx.flush()
+            self.status = NRF24.STATUS.tx
+            yield tx
+        finally:
+            self.status = NRF24.STATUS.stand_by
+            tx.restore()
+
+            if last != NRF24.STATUS.stand_by:
+                self.status = last
+
+    def send(self, pipe, data, no_ack=False, timeout=1):
+        """ Send data to the address of the pipe, return SendResult
+        """
+        with self.tx(pipe) as tx:
+            return tx.write(data, no_ack=no_ack, timeout=timeout)
@@ -0,0 +1,49 @@
+""" Hardware backends for NRF24
+
+Backend gives the radio four things:
+
+    spi - object with `xfer(list_of_bytes) -> list_of_bytes`
+    csn, ce - output pins with `value`, `closed`, `open()` and `close()`
+    irq - IRQ source (see zr.lib.nrf24.irq) or None
+"""
+try:
+    import spidev
+    from quick2wire.gpio import Out, pi_header_1
+except ImportError:
+    HAS_HARDWARE = False
+else:
+    HAS_HARDWARE = True
+
+from zr.lib.nrf24.irq import GPIOIRQ
+
+
+class Backend:
+    spi = None
+    csn = None
+    ce = None
+    irq = None
+
+    def close(self):
+        pass
+
+
+class SpidevBackend(Backend):
+    """ Raspberry Pi: spidev for SPI and quick2wire for GPIO
+
+    Pins are numbers of the pi header 1.
+    """
+    def __init__(self, csn, ce, spi_major=0, spi_minor=0, irq=None):
+        if not HAS_HARDWARE:
+            raise ImportError('spidev and quick2wire are required')
+
+        self.spi = spidev.SpiDev()
+        self.spi.open(spi_major, spi_minor)
+
+        self.csn = pi_header_1.pin(csn, direction=Out)
+        self.ce = pi_header_1.pin(ce, direction=Out)
+
+        if irq is not None:
+            self.irq = GPIOIRQ(irq)
+
+    def close(self):
+        self.spi.close()
@@ -0,0 +1,199 @@
+""" Benchmarks of the radio stack against the simulated chip
+
+    python -m zr.lib.nrf24.bench [rx [calls]]
+    python -m zr.lib.nrf24.bench registers [ops]
+    python -m zr.lib.nrf24.bench tx [bytes]
+    python -m zr.lib.nrf24.bench load [payloads [rate [burst]]]
+"""
+import sys
+import time
+import asyncio
+
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.sim import SimulatedNRF24
+
+ADDRESS = 0xd1d2d3d2d1
+
+
+def make_radio(timing='nrf24l01'):
+    sim = SimulatedNRF24()
+    radio = NRF24(backend=sim, timing=timing)
+    return sim, radio
+
+
+def bench_read_rx_fifo(timing, calls, payloads=3):
+    sim, radio = make_radio(timing)
+
+    pipe = radio.pipes[0]
+    pipe.address = ADDRESS
+    pipe.enabled = True
+    payload = bytes(pipe.payload_length)
+
+    radio.__enter__()
+    radio.status = NRF24.STATUS.rx
+
+    transactions = radio.transactions
+    spent = 0.0
+
+    for _ in range(calls):
+        for _ in range(payloads):
+            sim.transmit(ADDRESS, payload)
+
+        start = time.perf_counter()
+        radio.read_rx_fifo()
+        spent += time.perf_counter() - start
+
+        while pipe.has_data():
+            pipe.receive()
+
+    transactions = radio.transactions - transactions
+    return transactions / calls, spent / calls
+
+
+def bench_registers(ops):
+    """ Return {operation: operations per second} with shadow registers
+    """
+    sim, radio = make_radio()
+    registry = radio._registry
+    pipe = radio.pipes[3]
+
+    def config_get():
+        registry['CONFIG']['PWR_UP']
+
+    def config_set():
+        registry['CONFIG']['PWR_UP'] = True
+
+    def int_register_get():
+        registry['EN_RXADDR']['ERX_P3']
+
+    def pipe_enabled_get():
+        pipe.enabled
+
+    def pipe_enabled_set():
+        pipe.enabled = True
+
+    result = {}
+
+    for func in [config_get, config_set, int_register_get,
+                 pipe_enabled_get, pipe_enabled_set]:
+        start = time.perf_counter()
+        for _ in range(ops):
+            func()
+        result[func.__name__] = ops / (time.perf_counter() - start)
+
+    return result
+
+
+def bench_tx(size, no_ack=False):
+    """ Send `size` bytes through pipe 0, return SendResult
+    """
+    sim, radio = make_radio()
+
+    with radio:
+        radio.status = NRF24.STATUS.stand_by
+        radio.pipes[0].address = ADDRESS
+        return radio.send(0, bytes(size), no_ack=no_ack)
+
+
+class CountingMPD:
+    """ MPD client stub counting remote control calls
+    """
+    def __init__(self):
+        self.calls = 0
+
+    @asyncio.coroutine
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+
+    incr_volume = toggle = run = _call
+
+
+@asyncio.coroutine
+def load_test(payloads, rate=2000, burst=3, use_irq=True):
+    """ Push payloads through sim -> RadioController -> MpdPipe -> MPD
+
+    Remote sends `rate` payloads per second in bursts of `burst`.
+
+    Return (seconds, commands received, calls to mpd, lost in the chip,
+    dropped by the pipe).
+    """
+    from zr.mpd_ctrl.radio import RadioController
+
+    sim = SimulatedNRF24(irq=use_irq)
+    mpd = CountingMPD()
+    controller = RadioController(
+        mpd, radio_factory=lambda: NRF24(backend=sim))
+
+    task = asyncio.async(controller.start(interval=0.001))
+
+    while not sim.receiving:
+        yield from asyncio.sleep(0.01)
+
+    pipe = controller.radio.pipes[0]
+    start = time.perf_counter()
+
+    for n in range(payloads):
+        sim.transmit(ADDRESS, b'v\x01')
+
+        if n % burst == burst - 1:
+            delay = start + (n + 1) / rate - time.perf_counter()
+            yield from asyncio.sleep(max(0, delay))
+
+    while pipe.commands_in + sim.lost + pipe.dropped < payloads:
+        yield from asyncio.sleep(0.001)
+
+    spent = time.perf_counter() - start
+
+    controller.stop()
+    yield from task
+
+    return spent, pipe.commands_in, mpd.calls, sim.lost, pipe.dropped
+
+
+def main(argv=sys.argv[1:]):
+    mode = argv[0] if argv else 'rx'
+
+    if mode == 'rx':
+        calls = int(argv[1]) if len(argv) > 1 else 1000
+
+        for timing in ['nrf24l01', 'slow']:
+            n = calls if timing != 'slow' else max(1, calls // 100)
+            transactions, spent = bench_read_rx_fifo(timing, n)
+            print('read_rx_fifo [{}]: {:.1f} transactions, {:.1f} us per call'
+                  ''.format(timing, transactions, spent * 1000000))
+
+    elif mode == 'registers':
+        ops = int(argv[1]) if len(argv) > 1 else 100000
+
+        for name, speed in sorted(bench_registers(ops).items()):
+            print('{}: {:.0f} ops per second'.format(name, speed))
+
+    elif mode == 'tx':
+        size = int(argv[1]) if len(argv) > 1 else 32 * 1000
+
+        for no_ack in [False, True]:
+            result = bench_tx(size, no_ack)
+            print('tx [{}]: {} payloads, {:.0f} bytes per second, ok: {}'
+                  ''.format('no_ack' if no_ack else 'ack', result.payloads,
+                            result.throughput, result.ok))
+
+    elif mode == 'load':
+        payloads = int(argv[1]) if len(argv) > 1 else 10000
+        rate = int(argv[2]) if len(argv) > 2 else 2000
+        burst = int(argv[3]) if len(argv) > 3 else 3
+        loop = asyncio.get_event_loop()
+
+        for use_irq in [True, False]:
+            spent, commands, calls, lost, dropped = loop.run_until_complete(
+                load_test(payloads, rate, burst, use_irq))
+            print('load [{}]: {} payloads in {:.3f}s, {:.0f} per second, '
+                  '{} mpd calls, lost in chip {}, dropped by pipe {}'
+                  ''.format('irq' if use_irq else 'polling', commands, spent,
+                            commands / spent, calls, lost, dropped))
+
+    else:
+        print(__doc__)
+
+
+if __name__ == '__main__':
+    main()
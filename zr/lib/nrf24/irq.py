@@ -0,0 +1,54 @@
+""" Sources of the radio IRQ edges for the event loop
+"""
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class IRQ:
+    """ Base class for IRQ sources
+
+    `start` must arrange for `callback` to be called in the event loop
+    after every active edge of the IRQ line.
+    """
+    def start(self, loop, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+
+class GPIOIRQ(IRQ):
+    """ IRQ pin watched through the sysfs value file
+
+    The value file is registered with `loop.add_reader`: sysfs reports
+    an edge as POLLPRI | POLLERR, which the selector treats as readable.
+    """
+    _pin = None
+    _loop = None
+
+    def __init__(self, number, edge='falling'):
+        self.number = number
+        self.edge = edge
+
+    def start(self, loop, callback):
+        from quick2wire.gpio import In, pi_header_1
+
+        self._pin = pi_header_1.pin(
+            self.number, direction=In, interrupt=self.edge)
+        self._pin.open()
+
+        self._loop = loop
+        self._loop.add_reader(self._pin.fileno(), self._on_edge, callback)
+        logger.debug('watch irq on pin {}'.format(self.number))
+
+    def stop(self):
+        if self._pin is not None:
+            self._loop.remove_reader(self._pin.fileno())
+            self._pin.close()
+            self._pin = None
+
+    def _on_edge(self, callback):
+        self._pin.value  # read for acknowledge the edge
+        callback()
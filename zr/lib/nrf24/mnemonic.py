@@ -100,6 +100,7 @@ ACTIVATE = 0x50
 R_RX_PL_WID = 0x60
 R_RX_PAYLOAD = 0x61
 W_TX_PAYLOAD = 0xA0
+W_TX_PAYLOAD_NO_ACK = 0xB0
 W_ACK_PAYLOAD = 0xA8
 FLUSH_TX = 0xE1
 FLUSH_RX = 0xE2
@@ -1,11 +1,34 @@
 import queue
+import asyncio
+from collections import deque
 import logging
+import sys
+import threading
 
+from zr.lib import metrics
 
 logger = logging.getLogger(__name__)
 
 MAX_PAYLOAD_SIZE = 32
 
+# AsyncPipe overflow policies
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+
+
+RECEIVED = metrics.counter(
+    'zr_radio_pipe_received_total', 'Payloads queued by the pipe', ['pipe'])
+DROPPED = metrics.counter(
+    'zr_radio_pipe_dropped_total', 'Payloads lost on a full queue', ['pipe'])
+DEPTH = metrics.histogram(
+    'zr_radio_pipe_depth', 'Queue length after a payload was queued',
+    ['pipe'], buckets=metrics.DEPTH_BUCKETS)
+
+
+class PipeClosed(Exception):
+    pass
+
 
 class BasePipe:
     _payload_length = None
@@ -15,67 +38,99 @@ class BasePipe:
         self._radio = radio
         self.number = number
 
+        # precomputed keys for the registry
+        self._mask = 1 << number
+        self._address_name = 'RX_ADDR_P{}'.format(number)
+        self._payload_length_name = 'RX_PW_P{}'.format(number)
+
+        self._received = RECEIVED.labels(str(number))
+        self._dropped = DROPPED.labels(str(number))
+        self._depth = DEPTH.labels(str(number))
+
         self.enabled = False
         # self.address = 0
         self.payload_length = MAX_PAYLOAD_SIZE
         self.dynamic_payload = False
         self.auto_ack = False
 
-    def receive_from_fifo(self, data):
+    def receive_from_fifo(self, data, reserved=False):
+        """ Queue payload, `reserved` when it was counted by `reserve()`
+        """
         raise NotImplementedError
 
+    def reserve(self):
+        """ Count payload on its way to `receive_from_fifo` from another thread
+        """
+
     def has_data(self):
         raise NotImplementedError
 
     def receive(self):
         raise NotImplementedError
 
+    @property
+    def blocked(self):
+        """ True when radio must leave payloads in the rx fifo
+        """
+        return False
+
     @property
     def enabled(self):
-        return self._radio._registry['EN_RXADDR'][self.number]
+        return self._radio._registry.read_bits('EN_RXADDR', self._mask)
 
     @enabled.setter
     def enabled(self, value):
-        self._radio._registry['EN_RXADDR'][self.number] = value
+        self._radio._registry.write_bits('EN_RXADDR', self._mask, value)
 
     @property
     def address(self):
-        return self._radio._registry['RX_ADDR_P' + str(self.number)]
+        return self._radio._registry[self._address_name]
 
     @address.setter
     def address(self, value):
-        self._radio._registry['RX_ADDR_P' + str(self.number)] = value
+        self._radio._registry[self._address_name] = value
+
+    @property
+    def full_address(self):
+        """ Address bytes, pipes 2-5 share upper bytes with pipe 1
+        """
+        address = self.address
+
+        if self.number >= 2:
+            address = address + self._radio._registry['RX_ADDR_P1'][1:]
+
+        return address
 
     @property
     def payload_length(self):
         if self._payload_length is None:
-            self._payload_length = self._radio._registry['RX_PW_P' + str(self.number)]
+            self._payload_length = self._radio._registry[self._payload_length_name]
 
         return self._payload_length
 
     @payload_length.setter
     def payload_length(self, value):
         if 0 <= value <= MAX_PAYLOAD_SIZE:
-            self._radio._registry['RX_PW_P' + str(self.number)] = value
+            self._radio._registry[self._payload_length_name] = value
             self._payload_length = value
         else:
             raise ValueError('0 <= {} <= {}'.format(value, MAX_PAYLOAD_SIZE))
 
     @property
     def dynamic_payload(self):
-        return self._radio._registry['DYNPD'][self.number]
+        return self._radio._registry.read_bits('DYNPD', self._mask)
 
     @dynamic_payload.setter
     def dynamic_payload(self, value):
-        self._radio._registry['DYNPD'][self.number] = value
+        self._radio._registry.write_bits('DYNPD', self._mask, value)
 
     @property
     def auto_ack(self):
-        return self._radio._registry['EN_AA'][self.number]
+        return self._radio._registry.read_bits('EN_AA', self._mask)
 
     @auto_ack.setter
     def auto_ack(self, value):
-        self._radio._registry['EN_AA'][self.number] = value
+        self._radio._registry.write_bits('EN_AA', self._mask, value)
 
 
 class Pipe(BasePipe):
@@ -88,11 +143,14 @@ class Pipe(BasePipe):
     def __repr__(self):
         return '<Pipe: {}>'.format(self.number)
 
-    def receive_from_fifo(self, data):
+    def receive_from_fifo(self, data, reserved=False):
         try:
             self._queue.put(data, block=False)
+            self._received.inc()
+            self._depth.observe(self._queue.qsize())
             return True
         except queue.Full:
+            self._dropped.inc()
             logger.warning(
                 'queue pipe {} is full, lost {} bytes'.format(self.number, len(data)))
             return False
@@ -105,3 +163,189 @@ class Pipe(BasePipe):
             return self._queue.get_nowait()
         except queue.Empty:
             return None
+
+
+class AsyncPipe(BasePipe):
+    """ Pipe for consuming payloads from coroutines
+
+        payload = yield from pipe.get()
+        payloads = yield from pipe.get_many(10, timeout=0.1)
+        async for payload in pipe: ...  # python 3.5+
+
+    When the queue is full, `overflow` decides what to do:
+    `DROP_OLDEST` and `DROP_NEWEST` drop a payload and count it in
+    `dropped`, `BLOCK` stops the radio from reading the rx fifo until
+    the reader makes room, `on_space` is called at that moment.
+
+    Payloads read in the radio thread are counted with `reserve()`
+    before they are handed to the loop, so `blocked` covers them too
+    and BLOCK never drops a payload.
+    """
+    _payload_length = None
+
+    def __init__(self, radio, number, queue_size=1024,
+                 overflow=DROP_OLDEST, loop=None):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('bad overflow policy: {!r}'.format(overflow))
+
+        super().__init__(radio, number)
+
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.on_space = None
+
+        self.received = 0
+        self.dropped = 0
+
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._buffer = deque()
+        self._getters = deque()
+        self._closed = False
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<AsyncPipe: {}>'.format(self.number)
+
+    if sys.version_info >= (3, 5):
+        # `async for` and StopAsyncIteration are missing on python 3.4
+        def __aiter__(self):
+            return self
+
+        @asyncio.coroutine
+        def __anext__(self):
+            try:
+                return (yield from self.get())
+            except PipeClosed:
+                raise StopAsyncIteration
+
+    @property
+    def full(self):
+        return len(self._buffer) >= self.queue_size
+
+    @property
+    def blocked(self):
+        # read from the radio thread
+        return (self.overflow == BLOCK and
+                len(self._buffer) + self._in_flight >= self.queue_size)
+
+    def reserve(self):
+        with self._in_flight_lock:
+            self._in_flight += 1
+
+    def receive_from_fifo(self, data, reserved=False):
+        if reserved:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+        if self._closed:
+            return False
+
+        if self.full and self.overflow != BLOCK:
+            self.dropped += 1
+            self._dropped.inc()
+
+            if self.overflow == DROP_OLDEST:
+                self._buffer.popleft()
+                logger.warning('queue pipe {} is full, dropped oldest payload'
+                               ''.format(self.number))
+            else:
+                logger.warning('queue pipe {} is full, lost {} bytes'
+                               ''.format(self.number, len(data)))
+                return False
+
+        self._buffer.append(data)
+        self.received += 1
+        self._received.inc()
+        self._depth.observe(len(self._buffer))
+        self._wakeup_getter()
+        return True
+
+    def has_data(self):
+        return bool(self._buffer)
+
+    def receive(self):
+        if self._buffer:
+            return self._pop()
+        else:
+            return None
+
+    @asyncio.coroutine
+    def get(self):
+        """ Wait and return next payload
+
+        Raise PipeClosed when pipe closed and all payloads received.
+        """
+        while not self._buffer:
+            if self._closed:
+                raise PipeClosed(self.number)
+
+            yield from self._wait()
+
+        return self._pop()
+
+    @asyncio.coroutine
+    def get_many(self, n, timeout=None):
+        """ Wait for payloads and return list of up to `n` of them
+
+        Return empty list, when nothing received before `timeout`.
+        Raise PipeClosed when pipe closed and all payloads received.
+        """
+        if not self._buffer and not self._closed:
+            try:
+                yield from asyncio.wait_for(
+                    self._wait(), timeout, loop=self._loop)
+            except asyncio.TimeoutError:
+                pass  # a payload may come together with the timeout
+
+        if not self._buffer and self._closed:
+            raise PipeClosed(self.number)
+
+        items = []
+
+        while self._buffer and len(items) < n:
+            items.append(self._pop())
+
+        return items
+
+    def close(self):
+        """ Stop receiving, wake up all readers
+        """
+        self._closed = True
+
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+
+    def _pop(self):
+        blocked = self.blocked
+        data = self._buffer.popleft()
+
+        if blocked and self.on_space is not None:
+            self.on_space()
+
+        return data
+
+    @asyncio.coroutine
+    def _wait(self):
+        # wait for a payload or close, without taking the payload
+        getter = asyncio.Future(loop=self._loop)
+        self._getters.append(getter)
+
+        try:
+            yield from getter
+        except asyncio.CancelledError:
+            if getter in self._getters:
+                self._getters.remove(getter)
+            elif self._buffer:
+                self._wakeup_getter()  # woken and cancelled: pass it on
+
+            raise
+
+    def _wakeup_getter(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
@@ -14,52 +14,93 @@ def _BV(x):
     return 1 << x
 
 
-class Register:
+class Field:
+    """ Compiled bit field: `value = (data >> shift) & mask`
+    """
+    __slots__ = ('name', 'shift', 'mask', 'flag', 'default', 'rw')
+
+    def __init__(self, name, bit):
+        if isinstance(bit, int):
+            bit = Bit(bit, 1, 0, True)
+
+        self.name = name
+        self.shift = bit.bit - bit.len + 1
+        self.mask = (1 << bit.len) - 1
+        self.flag = bit.len == 1
+        self.default = bit.default
+        self.rw = bit.rw
+
+
+class RegisterMeta(type):
+    """ Compile register layout once per class
+
+    `_BITS` becomes `_FIELDS` (name -> Field) and `_DATA` default,
+    `keys_startswith` becomes `_KEYS` (int or 'ERX_P3' -> bit mask).
+    """
+    def __init__(cls, name, bases, attrs):
+        super().__init__(name, bases, attrs)
+
+        if cls._BITS is not None:
+            cls._FIELDS = {n: Field(n, b) for n, b in cls._BITS.items()}
+
+            if '_DATA' not in attrs:
+                cls._DATA = 0
+                for field in cls._FIELDS.values():
+                    cls._DATA |= field.default << field.shift
+
+        cls._KEYS = {}
+        for n in range(8):
+            cls._KEYS[n] = _BV(n)
+            if cls.keys_startswith:
+                cls._KEYS[cls.keys_startswith + str(n)] = _BV(n)
+
+
+class Register(metaclass=RegisterMeta):
     name = None
     address = None
+    keys_startswith = ''
     _DATA = 0b00
     _BITS = None
+    _FIELDS = {}
 
     def __init__(self, registry):
         self._registry = registry
         self._radio = registry._radio
 
-        for name, bit in self._BITS.copy().items():
-            if isinstance(bit, int):
-                self._BITS[name] = Bit(bit, 1, 0, True)
-            elif bit.default != 0:
-                self._DATA = self._DATA | (bit.default << bit.bit)
-
     def __int__(self):
         return self._DATA
 
     def __str__(self):
         s = '{}\n'.format(bin(int(self)))
-        for name in sorted(self._BITS):
+        for name in sorted(self._FIELDS):
             s += '{}: {}\n'.format(name, self[name])
         return s
 
     def __getitem__(self, name):
-        if name not in self._BITS:
+        try:
+            field = self._FIELDS[name]
+        except KeyError:
             raise AttributeError(name)
 
-        return self._get_value(self._BITS[name])
+        return self._get_value(field)
 
     def __setitem__(self, name, value):
-        logger.debug('set registry {}/{} = {}'.format(self.name, name, bin(value)))
-        if name not in self._BITS:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('set registry {}/{} = {}'.format(self.name, name, bin(value)))
+
+        try:
+            field = self._FIELDS[name]
+        except KeyError:
             raise AttributeError(name)
-        else:
-            bit = self._BITS[name]
 
-            mask = (2**bit.len - 1) << (bit.bit - bit.len + 1)
-            data = (self._DATA & ~mask) | (value << bit.bit - bit.len + 1)
+        mask = field.mask << field.shift
+        data = (self._DATA & ~mask) | ((value << field.shift) & mask)
 
-            self._registry[self.name] = data
+        self._registry[self.name] = data
 
-    def _get_value(self, bit):
-        value = (self._DATA >> (bit.bit - bit.len + 1)) & ((1 << bit.len) - 1)
-        if bit.len == 1:
+    def _get_value(self, field):
+        value = (self._DATA >> field.shift) & field.mask
+        if field.flag:
             return bool(value)
         else:
             return value
@@ -71,36 +112,30 @@ class IntRegister(Register):
     keys_startswith = ''
     _DATA = 0b00
 
-    def __init__(self, registry):
-        self._registry = registry
-        self._radio = registry._radio
-
     def __str__(self):
         return bin(int(self))
 
     def __getitem__(self, item):
-        item = self._prepare_key(item)
-        return bool(self._DATA & _BV(item))
+        return bool(self._DATA & self._prepare_key(item))
 
     def __setitem__(self, item, value):
-        logger.debug('set registry {}/{} = {}'.format(self.name, item, bin(value)))
-        item = self._prepare_key(item)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('set registry {}/{} = {}'.format(self.name, item, bin(value)))
+
+        mask = self._prepare_key(item)
 
         if value:
-            data = self._DATA | _BV(item)
+            data = self._DATA | mask
         else:
-            data = self._DATA & ~_BV(item)
+            data = self._DATA & ~mask
 
         self._registry[self.name] = data
 
     def _prepare_key(self, key):
-        if isinstance(key, int):
-            return key
-        elif (isinstance(key, str)
-                and len(key) == len(self.keys_startswith) + 1
-                and key.startswith(self.keys_startswith)):
-            return int(key[-1])
-        else:
+        # return bit mask for key
+        try:
+            return self._KEYS[key]
+        except (KeyError, TypeError):
             raise KeyError(key)
 
 
@@ -117,12 +152,6 @@ class CONFIG_R(Register):
         'PRIM_RX': 0,
     }
 
-    def _get_value(self, bit):
-        if bit == CRCO:
-            return (self._DATA & _BV(bit)) + 1
-        else:
-            return super()._get_value(bit)
-
 
 class EN_AA_R(IntRegister):
     name = 'EN_AA'
@@ -252,6 +281,13 @@ class FEATURE_R(Register):
 
 
 class Registry:
+    """ Access to the radio registers by name
+
+    With `shadow` enabled configuration registers are kept in a write-through
+    cache: they are read from the chip once and after that updated only by
+    our own writes.  Registers changed by the chip itself (listed in
+    `VOLATILE`) are always read from the chip.
+    """
     _REGISTERS_CLASSES = [
         CONFIG_R,
         EN_RXADDR_R,
@@ -268,9 +304,16 @@ class Registry:
         FEATURE_R,
     ]
 
-    def __init__(self, radio):
+    VOLATILE = frozenset(['STATUS', 'OBSERVE_TX', 'CD', 'FIFO_STATUS'])
+
+    def __init__(self, radio, shadow=True):
         self._radio = radio
         self._REGISTERS = {}
+        self._shadow = {}
+
+        self.shadow = shadow
+        self.hits = 0
+        self.misses = 0
 
         for register_class in self._REGISTERS_CLASSES:
             self._REGISTERS[register_class.name] = register_class(self)
@@ -278,31 +321,105 @@ class Registry:
     def __getitem__(self, name):
         if name in self._REGISTERS:
             register = self._REGISTERS[name]
-            register._DATA = self._radio._read_register(register.address)[0]
+            register._DATA = self._read(name, register.address)[0]
             return register
         elif name.startswith('RX_ADDR_P'):
             num = int(name[-1])
-            return self._radio._read_register(0x0A + num, 5 if num < 2 else 1)
+            return self._read(name, 0x0A + num, 5 if num < 2 else 1)
         elif name == 'TX_ADDR':
-            return self._radio._read_register(0x10, 5)  # TX_ADDR
+            return self._read(name, 0x10, 5)  # TX_ADDR
         elif name.startswith('RX_PW_P'):
             num = int(name[-1])
-            return self._radio._read_register(0x11 + num)[0]
+            return self._read(name, 0x11 + num)[0]
         else:
             raise KeyError(name)
 
     def __setitem__(self, name, value):
-        logger.debug('set registry {} = {}'.format(name, bin(value)))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('set registry {} = {}'.format(name, bin(value)))
 
         if name in self._REGISTERS:
-            self._radio._write_register(self[name].address, value)
+            self._write(name, self._REGISTERS[name].address, value)
         elif name.startswith('RX_ADDR_P'):
             num = int(name[-1])
-            return self._radio._write_register(0x0A + num, value, 5 if num < 2 else 1)
+            self._write(name, 0x0A + num, value, 5 if num < 2 else 1)
         elif name == 'TX_ADDR':
-            return self._radio._write_register(0x10, value, 5)  # TX_ADDR
+            self._write(name, 0x10, value, 5)  # TX_ADDR
         elif name.startswith('RX_PW_P'):
             num = int(name[-1])
-            return self._radio._write_register(0x11 + num, value)
+            self._write(name, 0x11 + num, value)
         else:
             raise KeyError(name)
+
+    def read_bits(self, name, mask):
+        """ Fast path for `bool(int(registry[name]) & mask)`
+        """
+        return bool(self._read_byte(name) & mask)
+
+    def write_bits(self, name, mask, value):
+        """ Fast path for setting or clearing `mask` bits of register
+        """
+        data = self._read_byte(name)
+
+        if value:
+            data |= mask
+        else:
+            data &= ~mask
+
+        self._write(name, self._REGISTERS[name].address, data)
+
+    def names(self):
+        """ All names accepted by this registry
+        """
+        names = list(self._REGISTERS)
+        names += ['RX_ADDR_P{}'.format(n) for n in range(6)]
+        names += ['TX_ADDR']
+        names += ['RX_PW_P{}'.format(n) for n in range(6)]
+        return names
+
+    def sync(self):
+        """ Reload shadow of all configuration registers from the chip
+        """
+        self._shadow.clear()
+
+        if self.shadow:
+            for name in self.names():
+                if name not in self.VOLATILE:
+                    self[name]
+
+    def invalidate(self, name=None):
+        """ Drop shadow of one register or of all registers
+        """
+        if name is None:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(name, None)
+
+    def _cacheable(self, name):
+        return self.shadow and name not in self.VOLATILE
+
+    def _read(self, name, address, length=1):
+        if not self._cacheable(name):
+            return self._radio._read_register(address, length)
+
+        if name in self._shadow:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._shadow[name] = self._radio._read_register(address, length)
+
+        return list(self._shadow[name])
+
+    def _read_byte(self, name):
+        if self.shadow and name in self._shadow:
+            self.hits += 1
+            return self._shadow[name][0]
+        else:
+            return self._read(name, self._REGISTERS[name].address)[0]
+
+    def _write(self, name, address, value, length=1):
+        self._radio._write_register(address, value, length)
+
+        if self._cacheable(name):
+            self._shadow[name] = [
+                (value >> (8 * i)) & 0xff for i in range(length)]
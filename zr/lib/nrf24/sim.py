@@ -0,0 +1,385 @@
+""" In-memory nRF24L01+ for running the radio stack without hardware
+
+    sim = SimulatedNRF24()
+    radio = NRF24(backend=sim)
+    ...
+    sim.transmit(0xd1d2d3d2d1, b'v\x01')  # payload from a remote
+
+The simulator decodes SPI commands per CSN frame and models the register
+file, the 3-level RX and TX FIFOs, pipe addresses, payload widths and
+the IRQ line.  Methods are thread-safe, so the radio may live in
+the RadioWorker thread while the test pushes payloads from the loop.
+"""
+from collections import deque
+import threading
+import logging
+
+from zr.lib.nrf24.backend import Backend
+from zr.lib.nrf24.irq import IRQ
+from zr.lib.nrf24.mnemonic import *
+
+
+logger = logging.getLogger(__name__)
+
+
+FIFO_SIZE = 3
+MAX_PAYLOAD_SIZE = 32
+
+
+def _BV(x):
+    return 1 << x
+
+
+RESET_VALUES = {
+    CONFIG: [0x08],
+    EN_AA: [0x3f],
+    EN_RXADDR: [0x03],
+    SETUP_AW: [0x03],
+    SETUP_RETR: [0x03],
+    RF_CH: [0x02],
+    RF_SETUP: [0x0e],
+    OBSERVE_TX: [0x00],
+    RPD: [0x00],
+    RX_ADDR_P0: [0xe7] * 5,
+    RX_ADDR_P1: [0xc2] * 5,
+    RX_ADDR_P2: [0xc3],
+    RX_ADDR_P3: [0xc4],
+    RX_ADDR_P4: [0xc5],
+    RX_ADDR_P5: [0xc6],
+    TX_ADDR: [0xe7] * 5,
+    RX_PW_P0: [0x00],
+    RX_PW_P1: [0x00],
+    RX_PW_P2: [0x00],
+    RX_PW_P3: [0x00],
+    RX_PW_P4: [0x00],
+    RX_PW_P5: [0x00],
+    DYNPD: [0x00],
+    FEATURE: [0x00],
+}
+
+IRQ_FLAGS = _BV(RX_DR) | _BV(TX_DS) | _BV(MAX_RT)
+
+
+class SimPin:
+    """ Output pin calling `on_change(value)` on every change
+    """
+    closed = True
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.writes = 0
+        self._value = 0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        value = int(bool(value))
+        self.writes += 1
+
+        if value != self._value:
+            self._value = value
+
+            if self.on_change is not None:
+                self.on_change(value)
+
+    def open(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class SimIRQ(IRQ):
+    """ IRQ source fired by the simulator or by hand with `trigger()`
+    """
+    _loop = None
+    _callback = None
+
+    def start(self, loop, callback):
+        self._loop = loop
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+    def trigger(self):
+        if self._callback is not None:
+            self._loop.call_soon_threadsafe(self._callback)
+
+
+class SimulatedNRF24(Backend):
+    """ Backend with the simulated chip
+
+    Counters:
+        received - payloads put into the rx fifo
+        lost - payloads addressed to us, but dropped by the chip
+            (rx fifo full, wrong width, receiver off)
+        sent - list of `(address, payload, no_ack)` sent from the tx fifo
+        ignored - W_TX_PAYLOAD_NO_ACK commands ignored without EN_DYN_ACK
+
+    `ack` and `retransmits` set what happens to sent payloads: without
+    `ack` every payload waiting for an ack ends with MAX_RT.  Like the
+    chip, only payloads sent with EN_AA on pipe 0 wait for an ack.
+
+    Without `irq` the IRQ pin is not wired: `self.irq` is None.
+    """
+    ack = True
+    retransmits = 0
+
+    def __init__(self, irq=True):
+        self.spi = self
+        self.csn = SimPin(self._on_csn)
+        self.ce = SimPin(self._on_ce)
+        self.irq = SimIRQ() if irq else None
+
+        self.registers = {k: list(v) for k, v in RESET_VALUES.items()}
+        self.rx_fifo = deque()
+        self.tx_fifo = deque()
+        self.flags = 0
+
+        self.received = 0
+        self.lost = 0
+        self.ignored = 0
+        self.sent = []
+        self.xfers = 0
+
+        self._lock = threading.RLock()
+        self._frame = None
+
+    # radio side
+
+    def transmit(self, address, payload, channel=None):
+        """ Payload from a remote on the air
+
+        Return True when the payload was put into the rx fifo.
+        """
+        payload = bytes(payload)
+
+        with self._lock:
+            if channel is not None and channel != self._reg(RF_CH):
+                return False
+
+            pipe = self._match_pipe(address)
+
+            if pipe is None:
+                return False
+
+            if not (self.receiving and self._accept_width(pipe, payload)
+                    and len(self.rx_fifo) < FIFO_SIZE):
+                self.lost += 1
+                return False
+
+            self.rx_fifo.append((pipe, payload))
+            self.received += 1
+            self._set_flags(_BV(RX_DR))
+            return True
+
+    # SPI side
+
+    def open(self, major, minor):
+        pass
+
+    def xfer(self, buf):
+        with self._lock:
+            self.xfers += 1
+
+            if self._frame is None:
+                # spidev without manual CSN: one xfer is one frame
+                self._begin()
+                out = [self._clock(b) for b in buf]
+                self._end()
+                return out
+            else:
+                return [self._clock(b) for b in buf]
+
+    def _on_csn(self, value):
+        with self._lock:
+            if value:
+                self._end()
+            else:
+                self._begin()
+
+    def _on_ce(self, value):
+        if value:
+            with self._lock:
+                self._send_tx_fifo()
+
+    def _begin(self):
+        self._frame = {'cmd': None, 'in': [], 'out': []}
+
+    def _end(self):
+        frame, self._frame = self._frame, None
+
+        if frame is None or frame['cmd'] is None:
+            return
+
+        cmd, data = frame['cmd'], frame['in']
+
+        if cmd & ~REGISTER_MASK == W_REGISTER:
+            self._write_register(cmd & REGISTER_MASK, data)
+        elif cmd == W_TX_PAYLOAD_NO_ACK and \
+                not self._reg(FEATURE) & _BV(EN_DYN_ACK):
+            self.ignored += 1  # the chip ignores it without EN_DYN_ACK
+        elif cmd in (W_TX_PAYLOAD, W_TX_PAYLOAD_NO_ACK) and data:
+            if len(self.tx_fifo) < FIFO_SIZE:
+                self.tx_fifo.append((bytes(data), cmd == W_TX_PAYLOAD_NO_ACK))
+                if self.ce.value:
+                    self._send_tx_fifo()
+
+    def _clock(self, byte):
+        frame = self._frame
+
+        if frame['cmd'] is None:
+            frame['cmd'] = byte
+            status = self._status()
+            self._command(byte)
+            return status
+        elif frame['out']:
+            frame['in'].append(byte)
+            return frame['out'].pop(0)
+        else:
+            frame['in'].append(byte)
+            return 0
+
+    def _command(self, cmd):
+        out = self._frame['out']
+
+        if cmd & ~REGISTER_MASK == R_REGISTER:
+            out.extend(self._read_register(cmd & REGISTER_MASK))
+        elif cmd == R_RX_PAYLOAD:
+            if self.rx_fifo:
+                payload = self.rx_fifo.popleft()[1]
+                out.extend(payload)
+        elif cmd == R_RX_PL_WID:
+            out.append(len(self.rx_fifo[0][1]) if self.rx_fifo else 0)
+        elif cmd == FLUSH_RX:
+            self.rx_fifo.clear()
+        elif cmd == FLUSH_TX:
+            self.tx_fifo.clear()
+
+    # registers
+
+    def _reg(self, address):
+        return self.registers[address][0]
+
+    def _read_register(self, address):
+        if address == STATUS:
+            return [self._status()]
+        elif address == FIFO_STATUS:
+            return [self._fifo_status()]
+        else:
+            return list(self.registers.get(address, [0]))
+
+    def _write_register(self, address, data):
+        if address == STATUS:
+            if data:
+                self.flags &= ~(data[0] & IRQ_FLAGS)
+
+                if self.ce.value:
+                    self._send_tx_fifo()
+        elif address in self.registers:
+            width = len(RESET_VALUES[address])
+            value = list(data[:width])
+            value += self.registers[address][len(value):]
+            self.registers[address] = value
+
+    def _status(self):
+        if self.rx_fifo:
+            rx_p_no = self.rx_fifo[0][0]
+        else:
+            rx_p_no = 0b111
+
+        tx_full = len(self.tx_fifo) >= FIFO_SIZE
+        return self.flags | (rx_p_no << RX_P_NO) | (tx_full << TX_FULL)
+
+    def _fifo_status(self):
+        return (
+            (len(self.tx_fifo) >= FIFO_SIZE) << FIFO_FULL |
+            (not self.tx_fifo) << TX_EMPTY |
+            (len(self.rx_fifo) >= FIFO_SIZE) << RX_FULL |
+            (not self.rx_fifo) << RX_EMPTY
+        )
+
+    def _set_flags(self, flags):
+        was_active = self._irq_active()
+        self.flags |= flags
+
+        if self.irq is not None and not was_active and self._irq_active():
+            self.irq.trigger()
+
+    def _irq_active(self):
+        # CONFIG.MASK_* bits share positions with the STATUS flags
+        return bool(self.flags & ~self._reg(CONFIG) & IRQ_FLAGS)
+
+    # air
+
+    def _address_width(self):
+        return (self._reg(SETUP_AW) & 0b11) + 2
+
+    def _pipe_address(self, pipe):
+        width = self._address_width()
+
+        if pipe < 2:
+            data = self.registers[RX_ADDR_P0 + pipe][:width]
+        else:
+            data = self.registers[RX_ADDR_P0 + pipe] + \
+                self.registers[RX_ADDR_P1][1:width]
+
+        return sum(b << (8 * n) for n, b in enumerate(data))
+
+    def _match_pipe(self, address):
+        enabled = self._reg(EN_RXADDR)
+
+        for pipe in range(6):
+            if enabled & _BV(pipe) and self._pipe_address(pipe) == address:
+                return pipe
+
+        return None
+
+    @property
+    def receiving(self):
+        config = self._reg(CONFIG)
+        return bool(self.ce.value and config & _BV(PWR_UP) and
+                    config & _BV(PRIM_RX))
+
+    def _accept_width(self, pipe, payload):
+        dynamic = (self._reg(FEATURE) & _BV(EN_DPL) and
+                   self._reg(DYNPD) & _BV(pipe))
+
+        if dynamic:
+            return 0 < len(payload) <= MAX_PAYLOAD_SIZE
+        else:
+            return len(payload) == self._reg(RX_PW_P0 + pipe)
+
+    def _send_tx_fifo(self):
+        config = self._reg(CONFIG)
+
+        if not config & _BV(PWR_UP) or config & _BV(PRIM_RX):
+            return
+
+        address = sum(b << (8 * n) for n, b in
+                      enumerate(self.registers[TX_ADDR][:self._address_width()]))
+
+        observe_tx = self._reg(OBSERVE_TX)
+
+        # without auto ack on pipe 0 nothing waits for an ack
+        auto_ack = self._reg(EN_AA) & _BV(ENAA_P0)
+
+        while self.tx_fifo and not self.flags & _BV(MAX_RT):
+            payload, no_ack = self.tx_fifo[0]
+            no_ack = no_ack or not auto_ack
+
+            if no_ack or self.ack:
+                self.tx_fifo.popleft()
+                self.sent.append((address, payload, no_ack))
+                arc = 0 if no_ack else min(self.retransmits, 15)
+                self.registers[OBSERVE_TX] = [(observe_tx & 0xf0) | arc]
+                self._set_flags(_BV(TX_DS))
+            else:
+                plos = min((observe_tx >> PLOS_CNT) + 1, 15)
+                arc = self._reg(SETUP_RETR) & 0x0f
+                self.registers[OBSERVE_TX] = [(plos << PLOS_CNT) | arc]
+                self._set_flags(_BV(MAX_RT))
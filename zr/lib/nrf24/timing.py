@@ -0,0 +1,60 @@
+from collections import namedtuple
+import time
+
+
+# All values in seconds.
+#   csn_setup - CSN low before the first SPI clock
+#   csn_hold - CSN high after the last SPI clock (inactive time)
+#   power_up - power down -> stand by
+#   stand_by - rx/tx -> stand by
+#   ce_high - minimal CE high pulse
+#   tx_poll - pause between STATUS polls while sending
+Timing = namedtuple('Timing', (
+    'csn_setup', 'csn_hold', 'power_up', 'stand_by', 'ce_high', 'tx_poll'))
+
+
+# nRF24L01+ datasheet, table 16 and chapter 6.1.7
+NRF24L01 = Timing(
+    csn_setup=2e-9,
+    csn_hold=50e-9,
+    power_up=0.0015,
+    stand_by=0.00013,
+    ce_high=0.00001,
+    tx_poll=0.0001,
+)
+
+# Old values with millisecond sleeps around every SPI transaction.
+# Useful for long wires and slow level shifters.
+SLOW = Timing(
+    csn_setup=0.001,
+    csn_hold=0.001,
+    power_up=0.0015,
+    stand_by=0.00013,
+    ce_high=0.00002,
+    tx_poll=0.001,
+)
+
+PROFILES = {
+    'nrf24l01': NRF24L01,
+    'rpi': NRF24L01,
+    'slow': SLOW,
+}
+
+# Shorter delays are covered by the GPIO write itself.
+MIN_SLEEP = 0.000001
+
+
+def get_profile(timing):
+    """ Return Timing by the profile name or Timing itself
+    """
+    if isinstance(timing, Timing):
+        return timing
+    elif timing in PROFILES:
+        return PROFILES[timing]
+    else:
+        raise KeyError('unknown timing profile: {!r}'.format(timing))
+
+
+def delay(seconds):
+    if seconds >= MIN_SLEEP:
+        time.sleep(seconds)
@@ -0,0 +1,92 @@
+""" Radio I/O in a dedicated thread
+
+SPI and GPIO calls are synchronous and sleep for the chip timings, so they
+run in one worker thread owning the radio.  Coroutines use the worker
+facade and received payloads come back to the event loop with
+`call_soon_threadsafe`.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+class RadioWorker:
+    """ Async facade for a radio living in the worker thread
+
+    `factory` is called in the worker thread and must return NRF24 instance.
+    """
+    radio = None
+
+    def __init__(self, factory, loop=None):
+        self._factory = factory
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @asyncio.coroutine
+    def open(self):
+        self.radio = yield from self.call(self._factory)
+        self.radio.deliver = self._deliver
+        return self.radio
+
+    @asyncio.coroutine
+    def close(self):
+        if self.radio is not None:
+            yield from self.call(self.radio.close)
+
+        self._executor.shutdown(wait=False)
+
+    @asyncio.coroutine
+    def call(self, func, *args, **kwargs):
+        """ Call `func` in the worker thread and return the result
+        """
+        if kwargs:
+            func = functools.partial(func, **kwargs)
+
+        return (yield from self._loop.run_in_executor(
+            self._executor, func, *args))
+
+    @asyncio.coroutine
+    def configure(self, registers=(), **attrs):
+        """ Write register fields and set radio attributes
+
+            yield from worker.configure(
+                [('CONFIG', 'EN_CRC', False), ('RF_SETUP', 'RF_DR', 1)],
+                channel=13)
+        """
+        def _configure(radio):
+            for register, name, value in registers:
+                radio._registry[register][name] = value
+
+            for name, value in sorted(attrs.items()):
+                setattr(radio, name, value)
+
+        yield from self.call(_configure, self.radio)
+
+    @asyncio.coroutine
+    def set_status(self, status):
+        yield from self.call(setattr, self.radio, 'status', status)
+
+    @asyncio.coroutine
+    def rx_ready(self):
+        return (yield from self.call(getattr, self.radio, 'rx_ready'))
+
+    @asyncio.coroutine
+    def read_rx_fifo(self, count=None):
+        return (yield from self.call(self.radio.read_rx_fifo, count))
+
+    @asyncio.coroutine
+    def send(self, pipe, data, no_ack=False, timeout=1):
+        """ Send data to the address of the pipe, return SendResult
+        """
+        return (yield from self.call(
+            self.radio.send, pipe, data, no_ack=no_ack, timeout=timeout))
+
+    def _deliver(self, pipe, data):
+        # called from the worker thread: the payload is counted by the pipe
+        # before the loop gets it, so the next `pipe.blocked` sees it
+        pipe.reserve()
+        self._loop.call_soon_threadsafe(pipe.receive_from_fifo, data, True)
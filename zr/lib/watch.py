@@ -0,0 +1,160 @@
+""" Watch a file for changes from the event loop
+
+    watcher = FileWatcher('~/.zr.json', on_change)
+    watcher.start()
+
+On Linux the directory of the file is watched with inotify (through
+ctypes, the fd goes to `loop.add_reader`), so replacing the file by an
+editor or `mv` is noticed too.  Elsewhere, or when inotify can not be
+set up, the file is polled with `os.stat` every `interval` seconds.
+
+Events are debounced: `callback()` is called once, `debounce` seconds
+after the last change.  Coroutine callbacks are started as tasks.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+log = logging.getLogger(__name__)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    HAS_INOTIFY = hasattr(_libc, 'inotify_init1')
+except OSError:
+    HAS_INOTIFY = False
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+IN_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+           IN_CREATE | IN_DELETE)
+
+IN_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class FileWatcher:
+    def __init__(self, path, callback, interval=2, debounce=0.2,
+                 inotify=HAS_INOTIFY, loop=None):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self.inotify = inotify
+
+        self.changes = 0
+
+        self._loop = loop
+        self._fd = None
+        self._task = None
+        self._handle = None
+
+    def start(self):
+        loop = self._loop or asyncio.get_event_loop()
+
+        if self.inotify:
+            try:
+                self._fd = _inotify_watch(os.path.dirname(self.path))
+            except OSError as exc:
+                log.warning('inotify failed, polling {}: {}'.format(
+                    self.path, exc))
+            else:
+                loop.add_reader(self._fd, self._on_inotify)
+                log.debug('watch {} with inotify'.format(self.path))
+                return
+
+        self._task = asyncio.async(self._poll_circle(), loop=loop)
+
+    def stop(self):
+        loop = self._loop or asyncio.get_event_loop()
+
+        if self._fd is not None:
+            loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _on_inotify(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        name = os.path.basename(self.path)
+        offset = 0
+
+        while offset < len(data):
+            _, mask, _, length = IN_EVENT.unpack_from(data, offset)
+            offset += IN_EVENT.size
+            event_name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_MASK and os.fsdecode(event_name) == name:
+                self._changed()
+
+    @asyncio.coroutine
+    def _poll_circle(self):
+        last = self._stat()
+
+        while True:
+            yield from asyncio.sleep(self.interval, loop=self._loop)
+            current = self._stat()
+
+            if current != last:
+                last = current
+                self._changed()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        return stat.st_ino, stat.st_size, stat.st_mtime
+
+    def _changed(self):
+        loop = self._loop or asyncio.get_event_loop()
+
+        if self._handle is not None:
+            self._handle.cancel()
+
+        self._handle = loop.call_later(self.debounce, self._call)
+
+    def _call(self):
+        self._handle = None
+        self.changes += 1
+        result = self.callback()
+
+        if asyncio.iscoroutine(result):
+            asyncio.async(result, loop=self._loop)
+
+
+def _inotify_watch(directory):
+    fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    wd = _libc.inotify_add_watch(fd, os.fsencode(directory), IN_MASK)
+
+    if wd < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, os.strerror(errno))
+
+    return fd
@@ -0,0 +1,198 @@
+""" Benchmarks of the MPD layer without MPD
+
+    python -m zr.mpd_ctrl.bench [playlist [size [lookups]]]
+    python -m zr.mpd_ctrl.bench schedule [jobs [days]]
+    python -m zr.mpd_ctrl.bench streams [count]
+"""
+import sys
+import time
+import asyncio
+
+from zr.lib.cron import Rule, Scheduler, SimClock
+from zr.mpd_ctrl.cache import MPDCache
+from zr.mpd_ctrl.streams import StreamProber
+
+
+class LiveCache(MPDCache):
+    """ Cache pretending that the idle watcher is running
+    """
+    live = True
+
+
+def make_playlist(size):
+    return [{'file': 'http://stream/{}'.format(n), 'pos': n, 'id': n + 1000}
+            for n in range(size)]
+
+
+def find_linear(playlist, id):
+    # the way MPDSong looked songs up: two scans per request
+    for item in playlist:
+        if item['id'] == id:
+            break
+    else:
+        return None
+
+    for song in playlist:
+        if song['id'] == id:
+            return song
+
+
+def bench_playlist(size, lookups):
+    """ Return seconds per lookup: (linear scan, index, index rebuild)
+    """
+    loop = asyncio.get_event_loop()
+    playlist = make_playlist(size)
+    ids = [playlist[n * 7919 % size]['id'] for n in range(lookups)]
+
+    start = time.perf_counter()
+    for id in ids:
+        find_linear(playlist, id)
+    linear = (time.perf_counter() - start) / lookups
+
+    cache = LiveCache(mpd=None, loop=loop)
+    cache._set_playlist(playlist)
+
+    @asyncio.coroutine
+    def lookup_all():
+        for id in ids:
+            yield from cache.get_song(id)
+
+    loop.run_until_complete(cache.get_song(ids[0]))  # build index
+
+    start = time.perf_counter()
+    loop.run_until_complete(lookup_all())
+    indexed = (time.perf_counter() - start) / lookups
+
+    reordered = make_playlist(size)[::-1]
+    start = time.perf_counter()
+    cache._set_playlist(reordered)
+    loop.run_until_complete(cache.get_song(ids[0]))
+    rebuild = time.perf_counter() - start
+
+    return linear, indexed, rebuild
+
+
+def bench_schedule(jobs, days, start=1420070400):
+    """ Fast-forward `days` with SimClock, return (fires, seconds)
+    """
+    clock = SimClock(start)
+    scheduler = Scheduler(clock=clock)
+    fires = []
+
+    for n in range(jobs):
+        rule = Rule('{:02}:{:02}'.format(n % 24, n * 7 % 60),
+                    weekdays='mon-fri' if n % 2 else None,
+                    overrides={'sat': '10:00'} if n % 3 else None,
+                    timezone='local')
+        scheduler.add('job{}'.format(n), rule, lambda *args: fires.append(args))
+
+    begin = time.perf_counter()
+    scheduler.run_until(start + days * 86400)
+    spent = time.perf_counter() - begin
+
+    return len(fires), spent
+
+
+@asyncio.coroutine
+def stand_in_stream(delay=0, status='200 OK', headers=(), body=True):
+    """ Local HTTP server behaving like a radio stream, return its url
+    """
+    @asyncio.coroutine
+    def handle(reader, writer):
+        while (yield from reader.readline()) not in (b'\r\n', b''):
+            pass
+
+        yield from asyncio.sleep(delay)
+
+        head = ['HTTP/1.0 {}'.format(status)] + list(headers) + ['', '']
+        writer.write('\r\n'.join(head).encode('latin1'))
+
+        if body:
+            writer.write(b'\xff' * 1024)
+            yield from asyncio.sleep(60)  # endless stream
+
+        writer.close()
+
+    server = yield from asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, 'http://127.0.0.1:{}/stream'.format(port)
+
+
+def bench_streams(count):
+    """ Probe `count` groups of stand-in streams, return (prober, seconds)
+    """
+    loop = asyncio.get_event_loop()
+    kinds = [
+        ('fast', {}),
+        ('slow', {'delay': 0.3}),
+        ('stalled', {'body': False, 'delay': 10}),
+        ('missing', {'status': '404 Not Found', 'body': False}),
+    ]
+    urls = {}
+    servers = []
+
+    for n in range(count):
+        for kind, params in kinds:
+            server, url = loop.run_until_complete(stand_in_stream(**params))
+            servers.append(server)
+            urls[url] = kind
+
+        server, url = loop.run_until_complete(stand_in_stream(
+            status='302 Found', body=False,
+            headers=['Location: {}'.format(list(urls)[-4])]))
+        servers.append(server)
+        urls[url] = 'redirect'
+
+    prober = StreamProber(lambda: list(urls), timeout=1, concurrency=8)
+
+    start = time.perf_counter()
+    loop.run_until_complete(prober.probe_all())
+    spent = time.perf_counter() - start
+
+    for server in servers:
+        server.close()
+
+    for url in prober.rank(urls):
+        health = prober.get(url)
+        print('  {:8} {:5} {}'.format(
+            urls[url], 'ok' if health.ok else 'dead',
+            '{:.0f} ms'.format(health.ttfb * 1000) if health.ok
+            else health.error))
+
+    return prober, spent
+
+
+def main(argv=sys.argv[1:]):
+    mode = argv[0] if argv else 'playlist'
+
+    if mode == 'playlist':
+        size = int(argv[1]) if len(argv) > 1 else 10000
+        lookups = int(argv[2]) if len(argv) > 2 else 1000
+
+        linear, indexed, rebuild = bench_playlist(size, lookups)
+        print('playlist [{}]: linear {:.1f} us, index {:.2f} us per song, '
+              'index rebuild {:.2f} ms'
+              ''.format(size, linear * 1000000, indexed * 1000000,
+                        rebuild * 1000))
+
+    elif mode == 'schedule':
+        jobs = int(argv[1]) if len(argv) > 1 else 10
+        days = int(argv[2]) if len(argv) > 2 else 365
+
+        fires, spent = bench_schedule(jobs, days)
+        print('schedule [{} jobs, {} days]: {} fires in {:.1f} ms'
+              ''.format(jobs, days, fires, spent * 1000))
+
+    elif mode == 'streams':
+        count = int(argv[1]) if len(argv) > 1 else 2
+
+        prober, spent = bench_streams(count)
+        print('streams [{}]: probed in {:.2f} s, {} dead'
+              ''.format(prober.probes, spent, prober.failures))
+
+    else:
+        print(__doc__)
+
+
+if __name__ == '__main__':
+    main()
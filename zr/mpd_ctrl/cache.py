@@ -0,0 +1,284 @@
+""" Status and playlist of MPD kept up to date by `idle`
+
+    cache = MPDCache(pool)
+    cache.start()
+
+    status = yield from cache.get_status()
+    etag = cache.status_etag
+
+The watcher holds a dedicated connection blocked in `idle` and reloads
+only what changed.  Every change bumps `status_version` or
+`playlist_version`.  Without the watcher connection (MPD restarts) the
+cache falls back to asking the pool on every call.
+
+Time fields of the status (elapsed, bitrate) are as of the last change,
+MPD does not notify about playback progress.
+
+Changes are fanned out to subscribers as events:
+
+    subscription = cache.subscribe()
+    name, data = yield from subscription.get()
+
+    ('status_diff', {key: new value})
+    ('volume', volume)
+    ('playlist_diff', {'removed': [ids], 'changed': [songs]})
+    ('reset', None) - events were lost, reload everything
+    ('close', None) - cache stopped
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from zr.mpd_ctrl.commands import idle
+from zr.mpd_ctrl.pool import Slot
+
+log = logging.getLogger(__name__)
+
+
+STATUS_SUBSYSTEMS = frozenset(['player', 'mixer', 'options', 'playlist'])
+PLAYLIST_SUBSYSTEMS = frozenset(['playlist'])
+
+# status fields changing during playback without idle events
+PROGRESS_FIELDS = frozenset(['elapsed', 'time', 'bitrate'])
+
+
+def diff_status(old, new):
+    """ Return dict of changed and added keys, removed keys are None
+    """
+    old = old or {}
+    diff = {k: v for k, v in new.items() if old.get(k) != v}
+    diff.update((k, None) for k in old if k not in new)
+    return diff
+
+
+def diff_playlist(old, new):
+    """ Return ids of removed songs and list of new or changed songs
+    """
+    old = {song['id']: song for song in old or []}
+    ids = {song['id'] for song in new}
+
+    return {
+        'removed': [id for id in old if id not in ids],
+        'changed': [song for song in new if old.get(song['id']) != song],
+    }
+
+
+class Subscription:
+    """ Queue of events for one subscriber
+
+    When the subscriber is too slow and the queue overflows, queued events
+    are replaced by a single ('reset', None).
+    """
+    def __init__(self, cache, size=100):
+        self._cache = cache
+        self._queue = asyncio.Queue(maxsize=size, loop=cache._loop)
+
+    def push(self, name, data):
+        try:
+            self._queue.put_nowait((name, data))
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+            self._queue.put_nowait(('reset', None))
+
+    @asyncio.coroutine
+    def get(self):
+        return (yield from self._queue.get())
+
+    def close(self):
+        self._cache.unsubscribe(self)
+
+
+class PlaylistIndex:
+    """ Songs of one playlist version by id and by position
+    """
+    def __init__(self, playlist, version):
+        self.version = version
+        self.by_id = {song['id']: song for song in playlist}
+        self.by_pos = {song['pos']: song for song in playlist}
+
+
+class MPDCache:
+    status = None
+    playlist = None
+    _live = False
+    _index = None
+
+    def __init__(self, mpd, idle_timeout=30, loop=None):
+        self.mpd = mpd
+        self.idle_timeout = idle_timeout
+
+        self.status_version = 0
+        self.playlist_version = 0
+        self.updates = 0
+
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._epoch = uuid.uuid4().hex[:8]  # etags from other runs never match
+        self._slot = Slot('idle')
+        self._changed = asyncio.Event(loop=self._loop)
+        self._task = None
+        self._subscriptions = set()
+
+    @property
+    def live(self):
+        """ Snapshots are kept up to date by the watcher
+        """
+        return self._live and self._slot.connected
+
+    @property
+    def status_etag(self):
+        return '"s{}-{}"'.format(self._epoch, self.status_version)
+
+    @property
+    def playlist_etag(self):
+        return '"p{}-{}"'.format(self._epoch, self.playlist_version)
+
+    def start(self):
+        self._task = asyncio.async(self._watch(), loop=self._loop)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self._live = False
+        self._slot.close()
+
+        self._publish('close', None)
+        self._subscriptions.clear()
+
+    def subscribe(self, size=100):
+        subscription = Subscription(self, size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    @asyncio.coroutine
+    def get_status(self):
+        if not self.live:
+            self._set_status((yield from self.mpd.get_status()))
+
+        return self.status
+
+    @asyncio.coroutine
+    def get_playlist(self):
+        if not self.live:
+            self._set_playlist((yield from self.mpd.playlist()))
+
+        return self.playlist
+
+    @asyncio.coroutine
+    def get_song(self, id):
+        """ Song by id or None
+        """
+        return (yield from self._get_index()).by_id.get(id)
+
+    @asyncio.coroutine
+    def get_song_at(self, pos):
+        """ Song by position or None
+        """
+        return (yield from self._get_index()).by_pos.get(pos)
+
+    @asyncio.coroutine
+    def _get_index(self):
+        playlist = yield from self.get_playlist()
+
+        if self._index is None or self._index.version != self.playlist_version:
+            self._index = PlaylistIndex(playlist, self.playlist_version)
+
+        return self._index
+
+    def is_current(self, status):
+        """ True when `status` from MPD brings nothing new but progress
+        """
+        if self.status is None:
+            return False
+
+        keys = (set(status) | set(self.status)) - PROGRESS_FIELDS
+        return all(status.get(k) == self.status.get(k) for k in keys)
+
+    @asyncio.coroutine
+    def wait_status(self, version, timeout=1):
+        """ Wait for status newer than `version`, return status
+
+        For answering right after a command: the watcher gets the change
+        a moment later.  Return current status after `timeout`.
+        """
+        if self.live and self.status_version == version:
+            try:
+                yield from asyncio.wait_for(
+                    self._changed.wait(), timeout, loop=self._loop)
+            except asyncio.TimeoutError:
+                pass
+
+        return (yield from self.get_status())
+
+    @asyncio.coroutine
+    def _watch(self):
+        changed = STATUS_SUBSYSTEMS
+
+        while True:
+            try:
+                if not self._slot.connected:
+                    self._live = False
+                    yield from self.mpd.connect(self._slot)
+                    changed = STATUS_SUBSYSTEMS
+
+                yield from self._update(self._slot.client, changed)
+                self._live = True
+
+                changed = yield from idle(
+                    self._slot.client, STATUS_SUBSYSTEMS, self.idle_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.warning('mpd watcher: {!r}'.format(exc))
+                self._live = False
+                self._slot.close()
+
+                delay = max(1, self._slot.next_attempt - time.monotonic())
+                yield from asyncio.sleep(delay, loop=self._loop)
+
+    @asyncio.coroutine
+    def _update(self, client, changed):
+        if changed & PLAYLIST_SUBSYSTEMS:
+            self._set_playlist((yield from client.playlist()))
+
+        if changed & STATUS_SUBSYSTEMS:
+            self._set_status((yield from client.get_status()))
+
+    def _set_status(self, status):
+        if status != self.status:
+            if self._subscriptions:
+                self._publish('status_diff', diff_status(self.status, status))
+
+                if self.status is None or \
+                        status.get('volume') != self.status.get('volume'):
+                    self._publish('volume', status.get('volume'))
+
+            self.status = status
+            self.status_version += 1
+            self._notify()
+
+    def _set_playlist(self, playlist):
+        if playlist != self.playlist:
+            if self._subscriptions:
+                self._publish('playlist_diff',
+                              diff_playlist(self.playlist, playlist))
+
+            self.playlist = playlist
+            self.playlist_version += 1
+            self._notify()
+
+    def _publish(self, name, data):
+        for subscription in self._subscriptions:
+            subscription.push(name, data)
+
+    def _notify(self):
+        self.updates += 1
+        self._changed.set()
+        self._changed = asyncio.Event(loop=self._loop)
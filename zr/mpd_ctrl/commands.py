@@ -0,0 +1,224 @@
+""" Command lists for aiompd.Client
+
+    replies = yield from command_list(mpd, [('clear',), ('add', url)])
+    results = yield from add_many(mpd, urls, before=[('clear',)])
+    changed = yield from idle(mpd, ['player', 'mixer'], timeout=30)
+
+All commands go to the server in one `command_list_ok_begin` ...
+`command_list_end` batch, so they cost one round trip instead of one per
+command.  The server stops at the first failed command of the list.
+"""
+import asyncio
+import logging
+import re
+import time
+
+log = logging.getLogger(__name__)
+
+
+ACK_RE = re.compile(r'^ACK \[(\d+)@(\d+)\] \{(.*?)\} (.*)$')
+
+
+class CommandError(Exception):
+    """ Error reply from the server: ACK [code@index] {command} message
+    """
+    def __init__(self, code, index, command, message):
+        super().__init__('{} ({}): {}'.format(command, code, message))
+        self.code = code
+        self.index = index
+        self.command = command
+        self.message = message
+
+    @classmethod
+    def from_line(cls, line):
+        match = ACK_RE.match(line)
+
+        if match is None:
+            return cls(None, 0, None, line)
+
+        code, index, command, message = match.groups()
+        return cls(int(code), int(index), command, message)
+
+
+def quote(arg):
+    """ Quote command argument
+    """
+    arg = str(arg).replace('\\', '\\\\').replace('"', '\\"')
+    return '"{}"'.format(arg)
+
+
+def format_command(command):
+    name, *args = command
+    return ' '.join([name] + [quote(a) for a in args])
+
+
+@asyncio.coroutine
+def command_list(mpd, commands):
+    """ Send list of commands `(name, *args)` in one round trip
+
+    Return list with item per command: list of reply lines for succeeded
+    command, CommandError for failed one, None for not executed.
+    """
+    if not commands:
+        return []
+
+    if mpd._transport is None:
+        log.error("connection closed")
+        raise RuntimeError("connection closed")
+
+    lines = ['command_list_ok_begin']
+    lines += [format_command(c) for c in commands]
+    lines += ['command_list_end']
+    prepared = '\n'.join(lines) + '\n'
+
+    with (yield from mpd._lock):
+        mpd._transport.write(prepared.encode('utf8'))
+        log.debug('command list sent: {} commands'.format(len(commands)))
+        raw = yield from _read_response(mpd)
+
+    return _parse_response(raw.decode('utf8'), len(commands))
+
+
+@asyncio.coroutine
+def add_many(mpd, urls, before=(), after=()):
+    """ Add urls to the playlist with `addid`
+
+    Commands from `before` run first, commands from `after` run last.
+    A bad url does not stop the rest of them: the list is sent again
+    starting after the failed url, so one failure costs one round trip.
+
+    Return list with item per url: `{'file': url, 'id': id}` or
+    `{'file': url, 'error': message}`.  Raise CommandError when
+    a command from `before` or `after` fails.
+    """
+    before = list(before)
+    after = list(after)
+    results = []
+
+    while True:
+        pending = urls[len(results):]
+        commands = before + [('addid', url) for url in pending] + after
+        replies = yield from command_list(mpd, commands)
+
+        for reply in replies[:len(before)]:
+            if isinstance(reply, CommandError):
+                raise reply
+
+        failed = False
+
+        for url, reply in zip(pending, replies[len(before):]):
+            if isinstance(reply, CommandError):
+                log.warning('can not add {!r}: {}'.format(url, reply.message))
+                results.append({'file': url, 'error': reply.message})
+                failed = True
+                break
+            else:
+                results.append({'file': url, 'id': _parse_id(reply)})
+
+        if failed:
+            before = []  # already done
+            continue
+
+        for reply in replies[len(before) + len(pending):]:
+            if isinstance(reply, CommandError):
+                raise reply
+
+        return results
+
+
+@asyncio.coroutine
+def idle(mpd, subsystems=(), timeout=None):
+    """ Wait for changes in MPD subsystems
+
+    Return set of changed subsystems, empty set when nothing changed
+    before `timeout` (idle is cancelled with `noidle` then).  Raise
+    asyncio.TimeoutError when there is no answer to `noidle` either.
+    """
+    if mpd._transport is None:
+        log.error("connection closed")
+        raise RuntimeError("connection closed")
+
+    prepared = ' '.join(['idle'] + list(subsystems)) + '\n'
+
+    with (yield from mpd._lock):
+        mpd._transport.write(prepared.encode('utf8'))
+
+        data = b''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cancelled = False
+
+        while not _complete(data):
+            wait = None if deadline is None else max(0, deadline - time.monotonic())
+
+            try:
+                data += yield from asyncio.wait_for(
+                    mpd._received_data.get(), wait)
+            except asyncio.TimeoutError:
+                if cancelled:
+                    raise
+                elif mpd._transport is None:
+                    raise RuntimeError("connection closed")
+
+                mpd._transport.write(b'noidle\n')
+                deadline = time.monotonic() + timeout
+                cancelled = True
+
+    changed = set()
+
+    for line in data.decode('utf8').split('\n'):
+        if line.startswith('changed: '):
+            changed.add(line[len('changed: '):])
+        elif line.startswith('ACK '):
+            raise CommandError.from_line(line)
+
+    return changed
+
+
+@asyncio.coroutine
+def _read_response(mpd):
+    data = b''
+
+    while not _complete(data):
+        data += yield from mpd._received_data.get()
+
+    return data
+
+
+def _complete(data):
+    # reply ends with OK or ACK line
+    if not data.endswith(b'\n'):
+        return False
+
+    last = data[data.rfind(b'\n', 0, -1) + 1:]
+    return last == b'OK\n' or last.startswith(b'ACK ')
+
+
+def _parse_response(raw, count):
+    replies = [None] * count
+    current = []
+    index = 0
+
+    for line in raw.split('\n'):
+        if line == 'list_OK':
+            replies[index] = current
+            current = []
+            index += 1
+        elif line.startswith('ACK '):
+            error = CommandError.from_line(line)
+            replies[error.index] = error
+            break
+        elif line == 'OK':
+            break
+        elif line:
+            current.append(line)
+
+    return replies
+
+
+def _parse_id(reply):
+    for line in reply:
+        key, value = line.split(': ', 1)
+        if key == 'Id':
+            return int(value)
+
+    return None
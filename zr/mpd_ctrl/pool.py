@@ -0,0 +1,325 @@
+""" Pool of connections to MPD
+
+    pool = MPDPool(host, port, size=2, priority_size=1)
+    yield from pool.start()
+
+    yield from pool.get_status()            # any aiompd.Client method
+    yield from pool.priority.toggle()       # dedicated lane for the remote
+    yield from pool.run(add_many, urls)     # func(client, *args)
+
+Every lane has a fixed number of connection slots.  A call checks out
+an idle slot, connecting it when needed, and returns it afterwards, so
+a slow call occupies one connection only.  Broken connections are
+dropped and connected again on the next checkout; after a failure the
+slot waits with exponential backoff before the next attempt and fails
+fast meanwhile.  Idle connections are pinged every `keepalive` seconds.
+"""
+import asyncio
+import logging
+import time
+
+import aiompd
+
+from zr.lib import metrics
+
+log = logging.getLogger(__name__)
+
+CALL_SECONDS = metrics.histogram(
+    'zr_mpd_call_seconds', 'MPD call with a checked out connection',
+    ['lane', 'command'])
+WAIT_SECONDS = metrics.histogram(
+    'zr_mpd_wait_seconds', 'Wait for an idle connection', ['lane'])
+ERRORS = metrics.counter(
+    'zr_mpd_errors_total', 'Connections broken during a call', ['lane'])
+
+
+# errors meaning that the connection is unusable
+CONNECTION_ERRORS = (OSError, RuntimeError, asyncio.TimeoutError)
+
+
+class Slot:
+    client = None
+    failures = 0
+    next_attempt = 0
+    idle_since = 0
+
+    def __init__(self, number):
+        self.number = number
+
+    @property
+    def connected(self):
+        return self.client is not None and self.client._transport is not None
+
+    def close(self):
+        if self.client is not None and self.client._transport is not None:
+            self.client._transport.close()
+
+        self.client = None
+
+
+class Lane:
+    """ Group of connections with own queue of waiters
+    """
+    def __init__(self, pool, name, size):
+        self.name = name
+        self.size = size
+
+        self.checkouts = 0
+        self.wait_time = 0
+        self.wait_max = 0
+        self.errors = 0
+
+        self._pool = pool
+        self._wait = WAIT_SECONDS.labels(name)
+        self._errors = ERRORS.labels(name)
+        self._slots = [Slot(n) for n in range(size)]
+        self._idle = asyncio.Queue(loop=pool._loop)
+        self._waiting = 0
+
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+
+    def __repr__(self):
+        return '<Lane {}: {}/{} idle>'.format(
+            self.name, self._idle.qsize(), self.size)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(self._pool.client_class, name):
+            raise AttributeError(name)
+
+        @asyncio.coroutine
+        def method(*args, **kwargs):
+            def call(client):
+                return getattr(client, name)(*args, **kwargs)
+
+            call.__name__ = name
+            return (yield from self.run(call))
+
+        method.__name__ = name
+        return method
+
+    @asyncio.coroutine
+    def run(self, func, *args, **kwargs):
+        """ Call `func(client, *args, **kwargs)` with checked out connection
+        """
+        slot = yield from self._checkout()
+        start = time.perf_counter()
+
+        try:
+            return (yield from asyncio.wait_for(
+                func(slot.client, *args, **kwargs),
+                self._pool.timeout, loop=self._pool._loop))
+        except CONNECTION_ERRORS as exc:
+            self.errors += 1
+            self._errors.inc()
+            log.warning('mpd connection {}/{} broken: {!r}'
+                        ''.format(self.name, slot.number, exc))
+            slot.close()
+            raise
+        finally:
+            self._checkin(slot)
+            command = getattr(func, '__name__', '?')
+            CALL_SECONDS.labels(self.name, command).observe(
+                time.perf_counter() - start)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'connected': sum(s.connected for s in self._slots),
+            'checkouts': self.checkouts,
+            'wait_time': self.wait_time,
+            'wait_max': self.wait_max,
+            'errors': self.errors,
+        }
+
+    @asyncio.coroutine
+    def _checkout(self):
+        start = time.monotonic()
+        self._waiting += 1
+
+        try:
+            slot = yield from self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        wait = time.monotonic() - start
+        self.checkouts += 1
+        self.wait_time += wait
+        self.wait_max = max(self.wait_max, wait)
+        self._wait.observe(wait)
+
+        if not slot.connected:
+            try:
+                yield from self._pool.connect(slot)
+            except Exception:
+                self._checkin(slot)
+                raise
+
+        return slot
+
+    def _checkin(self, slot):
+        slot.idle_since = time.monotonic()
+        self._idle.put_nowait(slot)
+
+    @asyncio.coroutine
+    def _keepalive(self, interval):
+        # ping connections idle longer than interval, reconnect broken ones;
+        # one slot at a time, and only while nobody waits for a slot
+        now = time.monotonic()
+        seen = set()
+
+        while not self._waiting:
+            try:
+                slot = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            if slot.number in seen:
+                self._idle.put_nowait(slot)  # all idle slots are done
+                break
+
+            seen.add(slot.number)
+
+            try:
+                if not slot.connected:
+                    if slot.client is not None or slot.failures:
+                        yield from self._pool.connect(slot)
+                elif now - slot.idle_since >= interval:
+                    yield from self._pool._ping(slot)
+            except Exception as exc:
+                log.debug('keepalive {}/{}: {!r}'.format(self.name, slot.number, exc))
+            finally:
+                self._checkin(slot)
+
+    def _close(self):
+        for slot in self._slots:
+            slot.close()
+
+
+class MPDPool:
+    """ Connections to MPD shared by the scheduler, the remote and the web
+
+    The pool itself is the regular lane, `priority` is the lane reserved
+    for interactive commands from the remote.
+    """
+    client_class = aiompd.Client
+
+    def __init__(self, host='localhost', port=6600, size=2, priority_size=1,
+                 keepalive=30, timeout=10, backoff=(0.5, 30), loop=None):
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.backoff = backoff
+
+        self.connects = 0
+        self.connect_errors = 0
+        self.pings = 0
+
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._keepalive_task = None
+
+        self.regular = Lane(self, 'regular', size)
+        self.priority = Lane(self, 'priority', priority_size)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('regular', 'priority'):
+            raise AttributeError(name)
+
+        return getattr(self.regular, name)
+
+    @asyncio.coroutine
+    def start(self):
+        """ Connect one connection of every lane and start keepalive
+
+        When MPD is unavailable, keepalive goes on trying in background.
+        """
+        for lane in [self.regular, self.priority]:
+            try:
+                slot = yield from lane._checkout()
+            except ConnectionError:
+                continue
+
+            lane._checkin(slot)
+
+        if self.keepalive:
+            self._keepalive_task = asyncio.async(
+                self._keepalive_circle(), loop=self._loop)
+
+    def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+
+        self.regular._close()
+        self.priority._close()
+
+    def stats(self):
+        return {
+            'connects': self.connects,
+            'connect_errors': self.connect_errors,
+            'pings': self.pings,
+            'regular': self.regular.stats(),
+            'priority': self.priority.stats(),
+        }
+
+    @asyncio.coroutine
+    def connect(self, slot):
+        """ Connect slot with new client, respecting backoff
+
+        Used by the lanes and for dedicated connections outside of them,
+        like the one blocked in `idle` by MPDCache.
+        """
+        slot.close()
+
+        if time.monotonic() < slot.next_attempt:
+            raise ConnectionError('mpd is unavailable, next attempt in {:.1f}s'
+                                  ''.format(slot.next_attempt - time.monotonic()))
+
+        client = self.client_class(auto_reconnect=False)
+
+        try:
+            yield from asyncio.wait_for(
+                client.connect(self.host, self.port, self._loop),
+                self.timeout, loop=self._loop)
+        except CONNECTION_ERRORS as exc:
+            if client._transport is not None:
+                client._transport.close()
+
+            self.connect_errors += 1
+            slot.failures += 1
+
+            low, high = self.backoff
+            delay = min(high, low * 2 ** (slot.failures - 1))
+            slot.next_attempt = time.monotonic() + delay
+
+            log.error('can not connect to mpd {}:{}: {!r}, retry in {}s'
+                      ''.format(self.host, self.port, exc, delay))
+
+            raise ConnectionError('can not connect to mpd') from exc
+
+        self.connects += 1
+        slot.failures = 0
+        slot.next_attempt = 0
+        slot.client = client
+
+    @asyncio.coroutine
+    def _ping(self, slot):
+        self.pings += 1
+
+        try:
+            yield from asyncio.wait_for(
+                slot.client._send_command('ping'),
+                self.timeout, loop=self._loop)
+        except CONNECTION_ERRORS:
+            slot.close()
+            raise
+
+    @asyncio.coroutine
+    def _keepalive_circle(self):
+        while True:
+            yield from asyncio.sleep(self.keepalive, loop=self._loop)
+
+            for lane in [self.priority, self.regular]:
+                yield from lane._keepalive(self.keepalive)
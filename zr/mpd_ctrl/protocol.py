@@ -0,0 +1,114 @@
+""" Remote control frames
+
+Version 1, two bytes: command char and signed value.
+
+    b'v\x05' - volume +5
+    b'p\x00' - toggle pause
+    b't\xff' - previous track
+
+Version 2, up to 32 bytes:
+
+    byte 0 - VERSION_2 marker (not an ascii letter, unlike v1 commands)
+    byte 1 - sequence number, repeated frames keep the same number
+    byte 2 - count of commands
+    then `count` commands in the v1 format, rest is padding
+
+Version 2 frames need a pipe with payload length of at least 5 bytes
+or with dynamic payloads.
+"""
+import struct
+from collections import namedtuple
+
+
+VERSION_2 = 0x02
+
+COMMAND = struct.Struct('cb')
+HEADER_V2 = struct.Struct('BBB')
+
+MAX_COMMANDS = (32 - HEADER_V2.size) // COMMAND.size
+
+COMMANDS = frozenset(['v', 'p', 't'])
+
+# commands whose handler takes a count, runs of them are summed
+SUMMED = frozenset(['v', 't'])
+
+
+Frame = namedtuple('Frame', ('version', 'seq', 'commands'))
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def decode(raw):
+    """ Decode v1 or v2 frame into Frame with list of (command, value)
+    """
+    if len(raw) < COMMAND.size:
+        raise ProtocolError('short frame: {!r}'.format(raw))
+
+    if raw[0] != VERSION_2:
+        return Frame(1, None, [_decode_command(raw, 0)])
+
+    if len(raw) < HEADER_V2.size:
+        raise ProtocolError('short v2 frame: {!r}'.format(raw))
+
+    _, seq, count = HEADER_V2.unpack_from(raw)
+
+    if count > MAX_COMMANDS or \
+            HEADER_V2.size + count * COMMAND.size > len(raw):
+        raise ProtocolError('bad commands count {}: {!r}'.format(count, raw))
+
+    commands = [_decode_command(raw, HEADER_V2.size + n * COMMAND.size)
+                for n in range(count)]
+
+    return Frame(2, seq, commands)
+
+
+def encode(commands, seq=0):
+    """ Encode list of (command, value) into v2 frame
+    """
+    if len(commands) > MAX_COMMANDS:
+        raise ProtocolError('too many commands: {}'.format(len(commands)))
+
+    raw = HEADER_V2.pack(VERSION_2, seq & 0xff, len(commands))
+
+    for command, value in commands:
+        raw += COMMAND.pack(command.encode('ascii'), value)
+
+    return raw
+
+
+def merge(commands):
+    """ Collapse runs of the same command
+
+    Values of SUMMED commands (volume, track) are summed and dropped
+    when zero, pause toggles cancel in pairs.
+    """
+    merged = []
+
+    for command, value in commands:
+        if merged and merged[-1][0] == command:
+            if command == 'p':
+                merged.pop()
+                continue  # two toggles cancel each other
+            elif command in SUMMED:
+                last = merged.pop()
+                value = max(-100, min(100, last[1] + value))
+
+        merged.append((command, value))
+
+    return [(c, v) for c, v in merged if c not in SUMMED or v != 0]
+
+
+def _decode_command(raw, offset):
+    command, value = COMMAND.unpack_from(raw, offset)
+
+    try:
+        command = command.decode('ascii')
+    except UnicodeDecodeError:
+        raise ProtocolError('bad command: {!r}'.format(command))
+
+    if command not in COMMANDS:
+        raise ProtocolError('unknown command: {!r} ({!r})'.format(command, value))
+
+    return command, value
@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import logging
+import time
+
+from zr.lib import metrics
+from zr.lib.nrf24 import NRF24
+from zr.lib.nrf24.worker import RadioWorker
+from zr.mpd_ctrl.remote import MpdPipe
+
+log = logging.getLogger(__name__)
+
+POLL_SECONDS = metrics.histogram(
+    'zr_radio_poll_seconds', 'Check and read of the rx fifo', ['mode'])
+
+
+class RadioController:
+    """ Receive remote control commands from the radio
+
+    All radio I/O runs in the RadioWorker thread, the event loop only
+    waits for results.
+
+    The remote pipe takes v1 frames: two bytes, no acks.  With
+    `dynamic_payload` it takes v2 frames too, with auto ack (and CRC,
+    which auto ack needs); the remote must be set up the same way.
+
+    The IRQ source comes from the radio backend (`irq` is the pin number
+    for the default radio); without one the rx fifo is polled.
+    """
+    _stop = True
+    _wakeup = None
+    radio = None
+    irq = None
+
+    def __init__(self, mpd, radio_factory=None, irq=None, irq_timeout=1,
+                 dynamic_payload=False):
+        self.mpd = mpd
+        self.dynamic_payload = dynamic_payload
+
+        if radio_factory is None:
+            radio_factory = functools.partial(NRF24, csn=26, ce=24, irq=irq)
+
+        self.worker = RadioWorker(radio_factory)
+        self.irq_timeout = irq_timeout
+
+    @asyncio.coroutine
+    def start(self, interval):
+        self._stop = False
+
+        self.radio = yield from self.worker.open()
+        self.irq = self.radio.backend.irq
+        yield from self.worker.call(self._setup, asyncio.get_event_loop())
+
+        yield from asyncio.sleep(0.1)  # for stable start radio
+
+        yield from self._start_pipes()
+        yield from self._main_circle(interval)
+        yield from self._stop_pipes()
+
+        yield from self.worker.close()
+        log.info('{}.coro stoped'.format(self.__class__.__name__))
+
+    def _setup(self, loop):
+        # called in the radio thread
+        radio = self.radio
+        with radio:
+            radio.status = NRF24.STATUS.stand_by
+
+            radio._registry['CONFIG']['EN_CRC'] = self.dynamic_payload
+            radio._registry['CONFIG']['CRCO'] = 1
+            radio._registry['RF_SETUP']['RF_DR'] = 1
+            radio._registry['SETUP_AW']['AW'] = 0b11
+
+            radio.channel = 13
+
+            radio.pipes[0] = MpdPipe(
+                self.mpd, radio, 0, queue_size=10, loop=loop,
+                dynamic_payload=self.dynamic_payload)
+
+    def stop(self):
+        self._stop = True
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @asyncio.coroutine
+    def send(self, pipe, data, no_ack=False):
+        """ Send data to the remote listening on the address of the pipe
+        """
+        result = yield from self.worker.send(pipe, data, no_ack=no_ack)
+        log.debug('sent {} payloads in {:.4f}s, retransmits: {}, ok: {}'
+                  ''.format(result.payloads, result.elapsed,
+                            result.retransmits, result.ok))
+        return result
+
+    @asyncio.coroutine
+    def _main_circle(self, interval):
+        worker = self.worker
+        yield from worker.call(self.radio.__enter__)
+
+        try:
+            yield from worker.set_status(NRF24.STATUS.rx)
+
+            if self.irq is None:
+                yield from self._polling_circle(interval)
+            else:
+                yield from self._irq_circle()
+        finally:
+            yield from worker.call(self.radio.__exit__, None, None, None)
+
+    @asyncio.coroutine
+    def _polling_circle(self, interval):
+        observe = POLL_SECONDS.labels('polling').observe
+
+        while not self._stop:
+            start = time.perf_counter()
+            yield from self.worker.read_rx_fifo()
+            observe(time.perf_counter() - start)
+
+            yield from asyncio.sleep(interval)
+
+    @asyncio.coroutine
+    def _irq_circle(self):
+        self._wakeup = asyncio.Event()
+        self.irq.start(asyncio.get_event_loop(), self._wakeup.set)
+        observe = POLL_SECONDS.labels('irq').observe
+
+        try:
+            while not self._stop:
+                try:
+                    # timeout is a fallback for a lost edge
+                    yield from asyncio.wait_for(
+                        self._wakeup.wait(), self.irq_timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+                self._wakeup.clear()
+                start = time.perf_counter()
+
+                if not self._stop and (yield from self.worker.rx_ready()):
+                    yield from self.worker.read_rx_fifo()
+
+                observe(time.perf_counter() - start)
+        finally:
+            self.irq.stop()
+
+    @asyncio.coroutine
+    def _start_pipes(self):
+        self._pipes_tasks = []
+        for pipe in self.radio.pipes.values():
+            if hasattr(pipe, 'on_space'):
+                pipe.on_space = self._on_pipe_space
+
+            if hasattr(pipe, 'task'):
+                task = asyncio.async(pipe.task())
+                self._pipes_tasks.append(task)
+
+    def _on_pipe_space(self):
+        # blocked pipe has room again: drain the rx fifo
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @asyncio.coroutine
+    def _stop_pipes(self):
+        for pipe in self.radio.pipes.values():
+            if hasattr(pipe, 'stop'):
+                pipe.stop()
+
+        yield from asyncio.wait(self._pipes_tasks, timeout=2)
+
+        for task in self._pipes_tasks:
+            if not task.done():
+                task.cancel()
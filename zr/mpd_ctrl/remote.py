@@ -1,66 +1,151 @@
+import time
 import asyncio
-import struct
 import logging
 
-from zr.lib.nrf24.pipe import Pipe
+from zr.lib.nrf24.pipe import AsyncPipe, PipeClosed
+from zr.mpd_ctrl import protocol
+from zr.mpd_ctrl.commands import command_list
 
 log = logging.getLogger(__name__)
 
 
-class MpdPipe(Pipe):
-    _stop = True
+class MpdPipe(AsyncPipe):
+    """ Pipe for the remote control
 
-    def __init__(self, mpd, *args, **kwargs):
+    Accepts v1 and v2 frames (see zr.mpd_ctrl.protocol).  Repeated v2
+    frames with the same sequence number within `dedup_window` seconds
+    are ignored.
+
+    Commands received within `coalesce_window` seconds after the first one,
+    or while the previous MPD call was in flight, are merged: volume
+    deltas and track skips are summed, pause toggles cancel in pairs.
+    `commands_in` and `mpd_calls` count commands before and after merging,
+    `errors` counts failed MPD calls.
+    """
+    def __init__(self, mpd, *args, payload_length=2, dynamic_payload=False,
+                 dedup_window=1, coalesce_window=0.05, **kwargs):
         super().__init__(*args, **kwargs)
         self.mpd = mpd
+        self.dedup_window = dedup_window
+        self.coalesce_window = coalesce_window
+        self.duplicates = 0
+        self.commands_in = 0
+        self.mpd_calls = 0
+        self.errors = 0
+
+        self._handlers = {
+            'v': self._volume,
+            'p': self._toggle,
+            't': self._track,
+        }
+        self._last_seq = None
+        self._last_seq_time = 0
 
         self.address = 0xd1d2d3d2d1
-        self.payload_length = 2
-        self.auto_ack = False
-        self.enabled = True
+        self.payload_length = payload_length
 
-        self._stop = False
+        if dynamic_payload:
+            self._radio._registry['FEATURE']['EN_DPL'] = True
+            self.auto_ack = True  # required for dynamic payloads
+        else:
+            self.auto_ack = False
+
+        self.dynamic_payload = dynamic_payload
+        self.enabled = True
 
     def stop(self):
-        self._stop = True
+        self.close()
 
     @asyncio.coroutine
     def task(self):
-        while not self._stop:
-            if not self.has_data():
-                yield from asyncio.sleep(0.01)
-                continue
+        closed = False
 
-            raw = self.receive()
+        while not closed:
+            try:
+                raw = yield from self.get()
+            except PipeClosed:
+                break
 
-            log.debug('receiving data: {!r}'.format(raw))
-            command, data = struct.unpack('cb', raw)
-            log.debug('command {!r}, data: {!r}'.format(command, data))
+            commands = self._decode(raw)
+            deadline = self._loop.time() + self.coalesce_window
 
-            try:
-                command = command.decode('ascii')
-            except UnicodeDecodeError:
-                log.error("bad command: {!r}".format(command))
-                return
-
-            if command == 'v':
-                log.info('change volume: {}'.format(data))
-                yield from self.mpd.incr_volume(data)
-
-            elif command == 'p':
-                log.info('pause')
-                yield from self.mpd.toggle()
-
-            elif command == 't':
-                log.info('track: {}'.format(data))
-                if data < 0:
-                    yield from self.mpd.prev(count=abs(data))
-                elif data > 0:
-                    yield from self.mpd.next(count=data)
-                else:
-                    pass
-
-            else:
-                log.error('unknown command: {!r} ({!r})'.format(command, data))
+            while True:
+                timeout = max(0, deadline - self._loop.time())
+
+                try:
+                    more = yield from self.get_many(self.queue_size, timeout)
+                except PipeClosed:
+                    closed = True
+                    break
+
+                if not more:
+                    break
+
+                for raw in more:
+                    commands.extend(self._decode(raw))
+
+            self.commands_in += len(commands)
+
+            for command, data in protocol.merge(commands):
+                log.debug('command {!r}, data: {!r}'.format(command, data))
+                self.mpd_calls += 1
+
+                try:
+                    yield from self._handlers[command](data)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    # mpd is down or slow: lose the command, not the remote
+                    self.errors += 1
+                    log.error('command {!r} failed: {!r}'.format(command, exc))
 
         log.info('{}.process_received_data_coro stoped'.format(self.__class__.__name__))
+
+    def _decode(self, raw):
+        log.debug('receiving data: {!r}'.format(raw))
+
+        try:
+            frame = protocol.decode(raw)
+        except protocol.ProtocolError as exc:
+            log.error(str(exc))
+            return []
+
+        if self._is_duplicate(frame):
+            self.duplicates += 1
+            log.debug('duplicate frame {}'.format(frame.seq))
+            return []
+
+        return frame.commands
+
+    def _is_duplicate(self, frame):
+        if frame.seq is None:
+            return False
+
+        now = time.monotonic()
+        duplicate = (frame.seq == self._last_seq and
+                     now - self._last_seq_time < self.dedup_window)
+
+        self._last_seq = frame.seq
+        self._last_seq_time = now
+        return duplicate
+
+    @asyncio.coroutine
+    def _volume(self, data):
+        # the summed delta of a burst goes as one relative change:
+        # set_volume needs the current volume first, that is one more
+        # round trip or a cached value racing with other MPD clients
+        log.info('change volume: {}'.format(data))
+        yield from self.mpd.incr_volume(data)
+
+    @asyncio.coroutine
+    def _toggle(self, data):
+        log.info('pause')
+        yield from self.mpd.toggle()
+
+    @asyncio.coroutine
+    def _track(self, data):
+        # aiompd skips one track per call whatever the count is:
+        # send all skips in one command list
+        log.info('track: {}'.format(data))
+        command = ('next',) if data > 0 else ('previous',)
+        yield from self.mpd.run(command_list, [command] * abs(data))
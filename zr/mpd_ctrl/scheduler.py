@@ -1,93 +1,229 @@
+from collections import deque
+from datetime import datetime, timezone
 import asyncio
-from datetime import datetime, time, timezone, timedelta
 import logging
 
+from zr.lib.cron import Scheduler
+from zr.mpd_ctrl.commands import add_many, command_list, CommandError
+from zr.mpd_ctrl.volume import Fader
+
 log = logging.getLogger(__name__)
 
+# seconds to wait for audible playback after the start
+RECORD_TIMEOUT = 10
+
 
 class MPDScheduler:
-    def __init__(self, mpd, settings):
+    """ Start playlists by schedules of zr.settings.Settings
+
+        "wakeup": {
+            "start": "07:00",
+            "weekdays": "mon-fri",
+            "overrides": {"sat": "09:30", "2015-12-31": null},
+            "timezone": "local",
+            "lead": 15,
+            "playlist": "radio",
+            "volume": [10, [60, 1800, "exponential"]]
+        }
+
+    `start` is in UTC unless `timezone` is "local".  Volume steps are
+    `volume` or `[volume, seconds, curve]`, the curve is "linear" by
+    default.  A fade stops when the volume is changed by hand.
+
+    With `prober` (StreamProber) dead streams are skipped and the fastest
+    one plays first.
+
+    The playlist is staged `lead` seconds before the start: added, played
+    and paused at once, so MPD connects to the stream and fills its buffer.
+    On the start time it is unpaused through the priority connection.  The
+    delay from the planned start to audible playback is kept in `runs`.
+
+    `update()` applies reloaded settings: only added, removed and changed
+    schedules are touched, running ones are not interrupted.
+    """
+    def __init__(self, mpd, settings, clock=None, cache=None, prober=None):
         self.mpd = mpd
         self.settings = settings
+        self.prober = prober
+        self.engine = Scheduler(clock=clock)
+        self.cache = cache
+        self.fader = Fader(mpd, cache=cache,
+                           max_rate=settings.mpd.get('volume_rate', 2))
+        self.runs = deque(maxlen=100)
+        self._futures = set()
+        self._planned = {}
 
     @asyncio.coroutine
     def start(self):
-        self._futures = []
-        for name in self.settings['scheduler']:
-            self._futures.append(asyncio.async(self._start_task(name)))
+        for schedule in self.settings.schedules.values():
+            self._add(schedule)
+
+        self.engine.start()
+
+    def update(self, settings):
+        changes = self.settings.diff(settings)
+        self.settings = settings
+        self.fader.max_rate = settings.mpd.get('volume_rate', 2)
+
+        for name in changes.removed:
+            log.info('{}: removed'.format(name))
+            self.engine.remove(name)
+
+        for name in changes.added | changes.changed:
+            self._add(settings.schedules[name])
 
     def stop(self):
+        self.engine.stop()
+        self.fader.cancel()
+
         for f in self._futures:
             f.cancel()
 
-    @asyncio.coroutine
-    def _start_task(self, name):
-        settings = self._get_settings(name)
+    def next_runs(self, count=10):
+        return self.engine.next_runs(count)
 
-        while True:
-            yield from self._sleep_to_time(settings['start'])
+    def _add(self, schedule):
+        self.engine.add(schedule.name, schedule.rule, self._fire,
+                        lead=schedule.lead)
 
-            if settings['volume']:
-                vol, dur = settings['volume'][0]
+        when = schedule.rule.next_after(self.engine.clock.time())
 
-            playlist = self.settings['playlists'].get(settings['playlist'], [])
-            yield from self._play(playlist, vol)
+        if when is not None:
+            log.info('{} starts at {:%Y-%m-%d %H:%M:%S %Z}'.format(
+                schedule.name, datetime.fromtimestamp(when, timezone.utc)))
 
-            for vol, dur in settings['volume']:
-                if dur is None:
-                    yield from self.mpd.set_volume(vol)
-                else:
-                    yield from self._gradual_increase_volume(dur, vol)
+    def _fire(self, name, when):
+        if self._planned.get(name) == when:
+            return  # already staged, the clock went back
 
-    def _get_settings(self, name):
-        settings = self.settings['scheduler'][name]
+        self._planned[name] = when
+        future = asyncio.async(self._run(name, when))
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
 
-        if isinstance(settings['start'], str):
-            settings['start'] = time(
-                *[int(i) for i in settings['start'].split(':')],
-                tzinfo=timezone.utc)
+    @asyncio.coroutine
+    def _run(self, name, when):
+        schedule = self.settings.schedules[name]
+        steps = list(schedule.volume)
 
-        for n, item in enumerate(settings.setdefault('volume', []).copy()):
-            if isinstance(item, int):
-                settings['volume'][n] = [item, None]
-            elif isinstance(item[1], int):
-                settings['volume'][n][1] = timedelta(seconds=item[1])
+        if steps and steps[0].duration is None:
+            vol = steps.pop(0).volume  # set together with play
+        else:
+            vol = None
 
-        return settings
+        playlist = self.settings.playlists[schedule.playlist]
 
-    @asyncio.coroutine
-    def _sleep_to_time(self, time):
-        now = datetime.now(tz=timezone.utc)
+        if self.prober is not None:
+            playlist = self.prober.rank(playlist, skip_dead=True)
 
-        if now.timetz() <= time:
-            next_start = datetime.combine(now.date(), time)
+        clock = self.engine.clock
+        prewarmed = clock.time() < when
+
+        if prewarmed:
+            yield from self._play(playlist, vol, paused=True)
+            yield from asyncio.sleep(max(0, when - clock.time()))
+            yield from self._resume(vol)
         else:
-            _date = (now + timedelta(days=1)).date()
-            next_start = datetime.combine(_date, time)
+            yield from self._play(playlist, vol)
 
-        wait_seconds = (next_start - now).total_seconds()
-        log.info('wait {} seconds for {:%Y-%m-%d %H:%M:%S}'
-                 ''.format(wait_seconds, next_start))
+        # a fade from zero makes the playlist audible later,
+        # so the delay is measured beside the volume steps
+        fade = steps[0].duration if steps else None
+        record = asyncio.async(self._record(
+            name, when, prewarmed, timeout=RECORD_TIMEOUT + (fade or 0)))
+        self._futures.add(record)
+        record.add_done_callback(self._futures.discard)
+
+        for vol, dur, curve in steps:
+            if dur is None:
+                self.fader.cancel()
+                yield from self.mpd.set_volume(vol)
+            else:
+                state = yield from self.fader.fade(vol, dur, curve=curve)
+
+                if state != 'done':
+                    log.info('{}: volume fade {}'.format(name, state))
+                    break
 
-        yield from asyncio.sleep(wait_seconds)
+    @asyncio.coroutine
+    def _play(self, playlist, vol=None, paused=False):
+        # one round trip for the whole playlist
+        if paused:
+            # the decoder connects and buffers while the output is paused
+            after = [] if vol is None else [('setvol', 0)]
+            after += [('play', 0), ('pause', 1)]
+        else:
+            after = [] if vol is None else [('setvol', vol)]
+            after += [('play', 0)]
+
+        try:
+            yield from self.mpd.run(add_many, playlist,
+                                    before=[('clear',)], after=after)
+        except CommandError as exc:
+            log.error('can not start playlist: {}'.format(exc))
 
     @asyncio.coroutine
-    def _play(self, playlist, vol):
-        yield from self.mpd.clear()
+    def _resume(self, vol=None):
+        commands = [('pause', 0)]
 
-        for item in playlist:
-            yield from self.mpd.add(item)
+        if vol is not None:
+            commands.append(('setvol', vol))
 
-        yield from self.mpd.set_volume(vol)
-        yield from self.mpd.play(0)
+        results = yield from self.mpd.priority.run(command_list, commands)
+
+        for result in results:
+            if isinstance(result, CommandError):
+                log.error('can not resume playback: {}'.format(result))
 
     @asyncio.coroutine
-    def _gradual_increase_volume(self, duration, vol):
-        current_vol = yield from self.mpd.get_volume()
-        count = vol - current_vol
-        delay = duration.total_seconds() / abs(count)
-
-        for _ in range(abs(count)):
-            log.debug("wait {} seconds for increase volume".format(delay))
-            yield from asyncio.sleep(delay)
-            yield from self.mpd.incr_volume(-1 if count < 0 else +1)
+    def _record(self, name, when, prewarmed, timeout=RECORD_TIMEOUT,
+                interval=0.05):
+        """ Wait for playback and remember the delay from the planned start
+
+        Playback is audible when MPD plays, has decoded something and the
+        volume is above zero (or there is no mixer).
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        audible = False
+
+        while loop.time() < deadline:
+            cache = self.cache
+
+            if cache is not None and not cache.live:
+                cache = None
+
+            version = cache.status_version if cache is not None else None
+
+            # elapsed of the cached status is as of the last change,
+            # so ask MPD itself
+            status = yield from self.mpd.priority.get_status()
+            playing = (status.get('state') == 'play' and
+                       float(status.get('elapsed', 0)) > 0)
+            audible = playing and int(status.get('volume', -1)) != 0
+
+            if audible:
+                break
+            elif playing and cache is not None:
+                # muted until the fade writes a level: the mixer change
+                # wakes the cache
+                yield from cache.wait_status(
+                    version, timeout=max(0, deadline - loop.time()))
+            else:
+                yield from asyncio.sleep(interval)
+
+        skew = self.engine.clock.time() - when
+        self.runs.append({
+            'name': name,
+            'planned': when,
+            'skew': skew,
+            'prewarmed': prewarmed,
+            'audible': audible,
+        })
+
+        if audible:
+            log.info('{}: audible {:+.3f}s from planned start{}'.format(
+                name, skew, ' (prewarmed)' if prewarmed else ''))
+        else:
+            log.warning('{}: nothing audible {:.0f}s after start'.format(
+                name, skew))
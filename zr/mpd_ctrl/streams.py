@@ -0,0 +1,218 @@
+""" Health of internet radio streams
+
+    prober = StreamProber(lambda: settings.playlists)
+    prober.start()
+
+    urls = prober.rank(urls)
+
+Every `interval` seconds all streams of the playlists are probed, at most
+`concurrency` at once: connect, send GET, follow redirects and wait for
+the first byte of the body.  Results (`Health`) live for `ttl` seconds,
+streams without a fresh result are "unknown".
+
+`rank()` puts healthy streams first, fastest first, then unknown ones in
+the original order, then dead ones (or drops them with `skip_dead`, as
+long as something is left).
+"""
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+Health = namedtuple('Health', ('url', 'ok', 'ttfb', 'checked', 'error'))
+
+MAX_REDIRECTS = 3
+
+
+class ProbeError(Exception):
+    pass
+
+
+class StreamProber:
+    def __init__(self, urls, interval=600, ttl=900, timeout=5,
+                 concurrency=4, loop=None):
+        """ `urls` is a callable returning {name: [url, ...]} or [url, ...]
+        """
+        self.urls = urls
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self.probes = 0
+        self.failures = 0
+
+        self._loop = loop
+        self._health = {}
+        self._semaphore = asyncio.Semaphore(concurrency, loop=loop)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.async(self._main_circle(), loop=self._loop)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get(self, url):
+        """ Fresh Health of the stream or None
+        """
+        health = self._health.get(url)
+
+        if health is None or time.time() - health.checked > self.ttl:
+            return None
+
+        return health
+
+    def stats(self):
+        return [self._health[url] for url in sorted(self._health)]
+
+    def rank(self, urls, skip_dead=False):
+        """ Order urls by health
+        """
+        healthy, unknown, dead = [], [], []
+
+        for url in urls:
+            health = self.get(url)
+
+            if health is None:
+                unknown.append(url)
+            elif health.ok:
+                healthy.append((health.ttfb, url))
+            else:
+                dead.append(url)
+
+        ranked = [url for _, url in sorted(healthy, key=lambda i: i[0])]
+        ranked.extend(unknown)
+
+        if not skip_dead or not ranked:
+            ranked.extend(dead)
+
+        return ranked
+
+    @asyncio.coroutine
+    def probe_all(self, urls=None):
+        """ Probe streams (all known by default), return list of Health
+        """
+        if urls is None:
+            urls = self._all_urls()
+
+        return (yield from asyncio.gather(
+            *[self.probe(url) for url in urls], loop=self._loop))
+
+    @asyncio.coroutine
+    def probe(self, url):
+        with (yield from self._semaphore):
+            loop = self._loop or asyncio.get_event_loop()
+            start = loop.time()
+
+            try:
+                yield from asyncio.wait_for(
+                    self._first_byte(url), self.timeout, loop=loop)
+            except (OSError, ProbeError, asyncio.TimeoutError) as exc:
+                error = str(exc) or exc.__class__.__name__
+                health = Health(url, False, None, time.time(), error)
+                self.failures += 1
+                log.info('stream {} is dead: {}'.format(url, error))
+            else:
+                health = Health(url, True, loop.time() - start, time.time(), None)
+
+            self.probes += 1
+            self._health[url] = health
+            return health
+
+    @asyncio.coroutine
+    def _main_circle(self):
+        while True:
+            try:
+                yield from self.probe_all()
+            except Exception:
+                log.exception('probe streams')
+
+            yield from asyncio.sleep(self.interval, loop=self._loop)
+
+    def _all_urls(self):
+        urls = self.urls()
+
+        if isinstance(urls, dict):
+            urls = [url for items in urls.values() for url in items]
+
+        return sorted(set(urls))
+
+    @asyncio.coroutine
+    def _first_byte(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            location = yield from self._request(url)
+
+            if location is None:
+                return
+
+            url = urljoin(url, location)
+
+        raise ProbeError('too many redirects')
+
+    @asyncio.coroutine
+    def _request(self, url):
+        """ Return redirect location or None when body started
+        """
+        try:
+            parts = urlsplit(url)
+            port = parts.port  # ValueError on 'host:abc'
+        except ValueError as exc:
+            raise ProbeError('bad url: {}'.format(exc)) from exc
+
+        if parts.scheme not in ('http', 'https'):
+            raise ProbeError('bad scheme: {}'.format(parts.scheme))
+        elif not parts.hostname:
+            raise ProbeError('bad url: no host')
+
+        https = parts.scheme == 'https'
+        port = port or (443 if https else 80)
+        path = parts.path or '/'
+
+        if parts.query:
+            path += '?' + parts.query
+
+        reader, writer = yield from asyncio.open_connection(
+            parts.hostname, port, ssl=https, loop=self._loop)
+
+        try:
+            writer.write('GET {} HTTP/1.0\r\n'
+                         'Host: {}\r\n'
+                         'User-Agent: zr\r\n'
+                         'Icy-MetaData: 0\r\n'
+                         '\r\n'.format(path, parts.netloc).encode('latin1'))
+
+            status_line = yield from reader.readline()
+            status = status_line.split(None, 2)
+
+            if len(status) < 2 or not status[1].isdigit():
+                raise ProbeError('bad response: {!r}'.format(status_line[:40]))
+
+            code = int(status[1])
+            location = None
+
+            while True:
+                line = yield from reader.readline()
+
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+                name, _, value = line.decode('latin1').partition(':')
+
+                if name.strip().lower() == 'location':
+                    location = value.strip()
+
+            if code in (301, 302, 303, 307, 308) and location:
+                return location
+            elif code != 200:
+                raise ProbeError('status {}'.format(code))
+
+            if not (yield from reader.read(1)):
+                raise ProbeError('empty body')
+        finally:
+            writer.close()
@@ -0,0 +1,207 @@
+""" Smooth volume fades
+
+    fader = Fader(mpd, cache)
+    yield from fader.fade(60, 1800, curve='exponential')
+
+A ramp sets absolute volume with `setvol`, at most `max_rate` times per
+second and only when the rounded level changes.  Levels follow the
+easing curve over the whole duration, the schedule is kept on the loop
+clock, so slow MPD answers do not stretch the fade.
+
+The number of steps comes from the steepest part of the curve: there
+the level moves by one point per step when `max_rate` allows it, flat
+parts simply skip the steps which do not change the rounded level.
+
+Before every step the current volume is read from `cache` (free while
+its idle watcher is running, one `status` otherwise).  A volume more than
+one point away from the last one the ramp has set means somebody changed
+it by hand: the ramp stops and leaves it alone.
+
+`Fader` runs one ramp at a time, a new fade supersedes the running one.
+"""
+import asyncio
+from datetime import timedelta
+from functools import lru_cache
+import logging
+import math
+
+log = logging.getLogger(__name__)
+
+
+def linear(x):
+    return x
+
+
+def logarithmic(x, k=9):
+    """ Fast start, slow end
+    """
+    return math.log1p(k * x) / math.log1p(k)
+
+
+def exponential(x, k=4):
+    """ Slow start, fast end: sounds even on a linear mixer
+    """
+    return math.expm1(k * x) / math.expm1(k)
+
+
+CURVES = {
+    'linear': linear,
+    'logarithmic': logarithmic,
+    'exponential': exponential,
+}
+
+
+@lru_cache()
+def max_slope(curve, samples=1000):
+    """ The largest change of `curve` per unit of x
+    """
+    values = [curve(n / samples) for n in range(samples + 1)]
+    return max(abs(b - a) for a, b in zip(values, values[1:])) * samples
+
+
+class Ramp:
+    """ One fade of volume from the current value to `target`
+
+    `state` is 'new', 'running', 'done', 'overridden' or 'cancelled'.
+    """
+    def __init__(self, mpd, target, duration, curve='linear', max_rate=2,
+                 cache=None, loop=None):
+        if curve not in CURVES:
+            raise ValueError('unknown curve: {!r}'.format(curve))
+
+        if isinstance(duration, timedelta):
+            duration = duration.total_seconds()
+
+        self.mpd = mpd
+        self.cache = cache if cache is not None else mpd
+        self.target = max(0, min(100, int(target)))
+        self.duration = max(0, duration)
+        self.curve = CURVES[curve]
+        self.max_rate = max_rate
+
+        self.state = 'new'
+        self.calls = 0
+
+        self._loop = loop
+
+    def levels(self, start):
+        """ List of `(offset in seconds, volume)` from `start` to target
+        """
+        delta = self.target - start
+
+        if delta == 0:
+            return []
+        elif self.duration == 0:
+            return [(0, self.target)]
+
+        # one volume point per step where the curve is the steepest,
+        # but not more often than max_rate
+        steps = int(math.ceil(abs(delta) * max_slope(self.curve)))
+        count = max(1, min(steps, int(self.duration * self.max_rate)))
+        levels = []
+        last = start
+
+        for n in range(1, count + 1):
+            level = start + int(round(delta * self.curve(n / count)))
+
+            if level != last:
+                levels.append((self.duration * n / count, level))
+                last = level
+
+        return levels
+
+    @asyncio.coroutine
+    def run(self):
+        """ Return final state
+        """
+        loop = self._loop or asyncio.get_event_loop()
+        self.state = 'running'
+
+        try:
+            start = yield from self._get_volume()
+
+            if start is None:
+                log.warning('volume ramp: MPD has no mixer')
+                self.state = 'done'
+                return self.state
+
+            last = start
+            begin = loop.time()
+
+            for offset, level in self.levels(start):
+                yield from asyncio.sleep(
+                    max(0, begin + offset - loop.time()), loop=loop)
+
+                current = yield from self._get_volume()
+
+                # mixers may round the volume by a point
+                if current is None or abs(current - last) > 1:
+                    log.info('volume ramp: changed by hand to {}, '
+                             'stopped'.format(current))
+                    self.state = 'overridden'
+                    return self.state
+
+                last = level
+                self.calls += 1
+                yield from self.mpd.set_volume(level)
+
+            self.state = 'done'
+            return self.state
+
+        except asyncio.CancelledError:
+            self.state = 'cancelled'
+            raise
+
+    @asyncio.coroutine
+    def _get_volume(self):
+        volume = (yield from self.cache.get_status()).get('volume')
+
+        if volume is None or int(volume) < 0:
+            return None
+
+        return int(volume)
+
+
+class Fader:
+    """ Runs one Ramp at a time
+    """
+    def __init__(self, mpd, cache=None, max_rate=2, loop=None):
+        self.mpd = mpd
+        self.cache = cache
+        self.max_rate = max_rate
+
+        self.ramp = None
+        self._task = None
+        self._loop = loop
+
+    def start(self, target, duration, curve='linear'):
+        """ Cancel running fade, start the new one, return its task
+        """
+        self.cancel()
+
+        self.ramp = Ramp(self.mpd, target, duration, curve=curve,
+                         max_rate=self.max_rate, cache=self.cache,
+                         loop=self._loop)
+        self._task = asyncio.async(self.ramp.run(), loop=self._loop)
+        return self._task
+
+    @asyncio.coroutine
+    def fade(self, target, duration, curve='linear'):
+        """ Fade and return final state of the ramp
+        """
+        task = self.start(target, duration, curve=curve)
+
+        try:
+            return (yield from asyncio.shield(task, loop=self._loop))
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return 'cancelled'  # superseded by another fade
+
+            task.cancel()
+            raise
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+        self._task = None
@@ -0,0 +1,160 @@
+""" Settings of zr (~/.zr.json) compiled once
+
+    settings = Settings.load(path)
+    settings.playlists['Morning']       # tuple of urls
+    settings.schedules['morning'].rule  # zr.lib.cron.Rule
+
+Everything is checked on load: a broken file raises SettingsError and
+the running settings stay in use.  Compiled settings are read-only,
+a reload builds a new object; `diff()` tells what to apply.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+import copy
+import json
+import os
+
+from zr.lib.cron import Rule
+from zr.mpd_ctrl.volume import CURVES
+
+
+DEFAULT_LEAD = 15
+
+RESTART_KEYS = ('host', 'port', 'mpd', 'radio', 'streams', 'loop')
+
+
+Schedule = namedtuple('Schedule', ('name', 'rule', 'lead', 'playlist', 'volume'))
+
+VolumeStep = namedtuple('VolumeStep', ('volume', 'duration', 'curve'))
+
+Changes = namedtuple('Changes', ('added', 'removed', 'changed', 'playlists',
+                                 'restart'))
+
+
+class SettingsError(ValueError):
+    pass
+
+
+class Settings:
+    def __init__(self, raw):
+        self.raw = copy.deepcopy(raw)
+
+        self.playlists = MappingProxyType({
+            name: _compile_playlist(name, urls)
+            for name, urls in _section(raw, 'playlists').items()})
+
+        self.schedules = MappingProxyType({
+            name: _compile_schedule(name, item, self.playlists)
+            for name, item in _section(raw, 'scheduler').items()})
+
+        for key in ('mpd', 'radio', 'streams', 'loop'):
+            setattr(self, key, MappingProxyType(dict(_section(raw, key))))
+
+    @classmethod
+    def load(cls, path, missing_ok=True):
+        """ Settings from JSON file
+
+        A file which does not exist gives empty settings with `missing_ok`
+        and SettingsError without it: on reload the file may be missing
+        for a moment while an editor replaces it.
+        """
+        if missing_ok and not os.path.exists(path):
+            return cls({})
+
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise SettingsError('{}: {}'.format(path, exc))
+
+        if not isinstance(raw, dict):
+            raise SettingsError('{}: must be object'.format(path))
+
+        return cls(raw)
+
+    def diff(self, new):
+        """ Changes from self to `new` settings
+        """
+        old_raw = self.raw.get('scheduler', {})
+        new_raw = new.raw.get('scheduler', {})
+
+        return Changes(
+            added=set(new_raw) - set(old_raw),
+            removed=set(old_raw) - set(new_raw),
+            changed={name for name in set(old_raw) & set(new_raw)
+                     if old_raw[name] != new_raw[name]},
+            playlists={name for name in set(self.playlists) | set(new.playlists)
+                       if self.playlists.get(name) != new.playlists.get(name)},
+            restart={key for key in RESTART_KEYS
+                     if self.raw.get(key) != new.raw.get(key)},
+        )
+
+
+def _section(raw, key):
+    value = raw.get(key, {})
+
+    if not isinstance(value, dict):
+        raise SettingsError('{}: must be object'.format(key))
+
+    return value
+
+
+def _compile_playlist(name, urls):
+    if not isinstance(urls, list) or \
+            not all(isinstance(url, str) for url in urls):
+        raise SettingsError('playlists.{}: must be list of urls'.format(name))
+
+    return tuple(urls)
+
+
+def _compile_schedule(name, item, playlists):
+    where = 'scheduler.{}'.format(name)
+
+    if not isinstance(item, dict) or 'start' not in item:
+        raise SettingsError('{}: must be object with "start"'.format(where))
+
+    if item.get('playlist') not in playlists:
+        raise SettingsError('{}: unknown playlist {!r}'.format(
+            where, item.get('playlist')))
+
+    try:
+        rule = Rule.from_settings(item)
+    except (ValueError, TypeError, AttributeError) as exc:
+        raise SettingsError('{}: {}'.format(where, exc))
+
+    lead = item.get('lead', DEFAULT_LEAD)
+
+    if not isinstance(lead, (int, float)) or lead < 0:
+        raise SettingsError('{}.lead: must be seconds'.format(where))
+
+    return Schedule(
+        name=name,
+        rule=rule,
+        lead=lead,
+        playlist=item['playlist'],
+        volume=tuple(_compile_volume(where, step)
+                     for step in item.get('volume', [])),
+    )
+
+
+def _compile_volume(where, step):
+    """ volume, [volume, seconds] or [volume, seconds, curve] -> VolumeStep
+    """
+    step = [step] if isinstance(step, int) else step
+
+    if not isinstance(step, list) or not 1 <= len(step) <= 3:
+        raise SettingsError('{}.volume: bad step {!r}'.format(where, step))
+
+    volume, duration, curve = step + [None, 'linear'][len(step) - 1:]
+
+    if not isinstance(volume, int) or not 0 <= volume <= 100:
+        raise SettingsError('{}.volume: bad volume {!r}'.format(where, volume))
+    elif duration is not None and \
+            (not isinstance(duration, (int, float)) or duration < 0):
+        raise SettingsError('{}.volume: bad duration {!r}'.format(
+            where, duration))
+    elif curve not in CURVES:
+        raise SettingsError('{}.volume: unknown curve {!r}'.format(
+            where, curve))
+
+    return VolumeStep(volume, duration, curve)
@@ -1,37 +1,63 @@
 import os
 import asyncio
 
-from aiohttp.web import Response
-from aiotraversal.resources import Root
+from aiohttp.web import HTTPNotFound
+from aiotraversal.resources import Root, Resource
 from aiotraversal.views import MethodsView
 
+from .assets import AssetCache
+from .metrics import TimedView
 
-class RootView(MethodsView):
+
+STATIC = 'zr/web/static/'
+
+
+class Static(Resource):
+    @asyncio.coroutine
+    def __getchild__(self, name):
+        return None
+
+
+class RootView(TimedView, MethodsView):
     methods = {'get'}
 
     @asyncio.coroutine
     def get(self):
-        static = yield from self.resource['static']
+        assets = self.resource.app['assets']
 
         if not self.request.tail:
-            info = static.get('index.html')
+            return (yield from assets.response(self.request, 'index.html'))
         else:
-            info = static.get(os.path.join(*self.request.tail))
+            return (yield from assets.response(
+                self.request, os.path.join(*self.request.tail)))
+
 
-        return Response(
-            body=info.data,
-            headers={'Content-Type': info.content_type},
-        )
+class StaticView(TimedView, MethodsView):
+    methods = {'get'}
+
+    @asyncio.coroutine
+    def get(self):
+        if not self.request.tail:
+            raise HTTPNotFound()
+
+        assets = self.resource.app['assets']
+        return (yield from assets.response(
+            self.request, os.path.join(*self.request.tail)))
 
 
 def includeme(app):
     app.include('aiotraversal.resources')
-    app.include('aiotraversal.static')
+
+    app['assets'] = AssetCache(STATIC)  # scans the directory
+    app['assets'].preload()
 
     app.bind_view(Root, RootView)
     app.bind_view(Root, RootView, tail='favicon.ico')
 
-    app.add_static(Root, 'static', 'zr/web/static/')
+    app.add_child(Root, 'static', Static)
+    app.bind_view(Static, StaticView, tail='*')
 
     app.include('.mpd')
     app.include('.settings')
+    app.include('.metrics')
+    app.include('.debug')
@@ -0,0 +1,385 @@
+""" Static files served from memory or with sendfile
+
+At startup the root directory is scanned into a manifest (path -> size,
+mtime, hash, content type), requests never touch the filesystem except
+for sending large files.  Restart or `rebuild()` to pick up changes.
+
+Small files are read once, compressed once (gzip, and brotli when the
+module is installed) and kept in a size-bounded LRU.  Files larger than
+`sendfile_threshold` are not kept in memory: they go to the socket with
+os.sendfile (or in chunks through the transport when it still holds
+data), only their compressed variants are cached.  Large files whose
+variants do not fit the cache are sent uncompressed, so they are not
+compressed again on every request.  Responses carry strong ETags,
+Last-Modified and Cache-Control, matching If-None-Match gets 304,
+single byte ranges get 206.
+"""
+from collections import OrderedDict, namedtuple
+from email.utils import formatdate
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from aiohttp.web import Response, StreamResponse, HTTPNotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+
+ENCODERS = OrderedDict()
+
+if brotli is not None:
+    ENCODERS['br'] = brotli.compress
+
+ENCODERS['gzip'] = lambda data: gzip.compress(data, 9)
+
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml)|image/svg)')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+ManifestEntry = namedtuple('ManifestEntry', (
+    'path', 'full_path', 'size', 'mtime', 'etag', 'content_type'))
+
+
+def etag_matches(header, etag):
+    """ True when If-None-Match `header` lists `etag` or is "*"
+    """
+    for item in header.split(','):
+        item = item.strip()
+
+        if item.startswith('W/'):
+            item = item[2:]  # weak comparison is enough for GET
+
+        if item == '*' or item == etag:
+            return True
+
+    return False
+
+
+def build_manifest(root):
+    """ Scan directory, return {relative path: ManifestEntry}
+    """
+    manifest = {}
+
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            path = os.path.relpath(full_path, root)
+            stat = os.stat(full_path)
+
+            digest = hashlib.md5()
+            with open(full_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+
+            ext = os.path.splitext(filename)[1]
+
+            manifest[path] = ManifestEntry(
+                path=path,
+                full_path=full_path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                etag='"{}"'.format(digest.hexdigest()[:16]),
+                content_type=mimetypes.types_map.get(
+                    ext, 'application/octet-stream'),
+            )
+
+    return manifest
+
+
+class Asset:
+    """ Pre-encoded variants of a file: {encoding: (data, etag)}
+
+    Large files have no identity variant, it is sent from the disk.
+    Without `data` there are no variants at all.
+    """
+    def __init__(self, entry, data, large=False, min_ratio=0.9):
+        self.entry = entry
+        self.variants = {}
+
+        if not large:
+            self.variants[None] = (data, entry.etag)
+
+        if data is not None and COMPRESSIBLE.match(entry.content_type):
+            for encoding, encode in ENCODERS.items():
+                encoded = encode(data)
+
+                if len(encoded) < len(data) * min_ratio:
+                    self.variants[encoding] = (
+                        encoded, '{}-{}"'.format(entry.etag[:-1], encoding))
+
+        self.size = sum(len(d) for d, _ in self.variants.values())
+
+    def select(self, accept_encoding):
+        """ Return (encoding, data, etag) for Accept-Encoding header
+
+        Data is None for large files sent from the disk.
+        """
+        accepted = _parse_accept_encoding(accept_encoding)
+
+        for encoding in ENCODERS:
+            if encoding in accepted and encoding in self.variants:
+                return (encoding,) + self.variants[encoding]
+
+        if None in self.variants:
+            return (None,) + self.variants[None]
+        else:
+            return None, None, self.entry.etag
+
+
+class AssetCache:
+    """ Static files of the `root` directory
+
+    Small files and compressed variants are kept in LRU bounded by
+    `max_size` bytes.
+    """
+    def __init__(self, root, max_size=4 * 1024 * 1024, max_age=3600,
+                 sendfile_threshold=64 * 1024):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.sendfile_threshold = sendfile_threshold
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.sendfile_bytes = 0
+
+        self._assets = OrderedDict()
+        self.rebuild()
+
+    def rebuild(self):
+        """ Scan root directory again and drop cached files
+        """
+        self.manifest = build_manifest(self.root)
+        self._assets.clear()
+        self.size = 0
+
+    def preload(self):
+        """ Load all files while they fit
+        """
+        for path in sorted(self.manifest):
+            self.get(path)
+
+            if self.size >= self.max_size:
+                return
+
+    def get(self, path):
+        """ Return Asset or raise HTTPNotFound
+        """
+        path = os.path.normpath(path)
+        asset = self._assets.get(path)
+
+        if asset is not None:
+            self.hits += 1
+            self._assets.move_to_end(path)
+            return asset
+
+        entry = self.manifest.get(path)
+
+        if entry is None:
+            raise HTTPNotFound()
+
+        large = entry.size > self.sendfile_threshold
+
+        if large and (entry.size > self.max_size or
+                      not COMPRESSIBLE.match(entry.content_type)):
+            asset = Asset(entry, None, large=True)
+        else:
+            with open(entry.full_path, 'rb') as f:
+                asset = Asset(entry, f.read(), large=large)
+
+            if large and asset.size > self.max_size:
+                # keep the uncompressed one: it takes no memory
+                asset = Asset(entry, None, large=True)
+
+        self.misses += 1
+
+        if asset.size <= self.max_size:
+            self._assets[path] = asset
+            self.size += asset.size
+
+            while self.size > self.max_size:
+                _, old = self._assets.popitem(last=False)
+                self.size -= old.size
+
+        return asset
+
+    @asyncio.coroutine
+    def response(self, request, path):
+        asset = self.get(path)
+        entry = asset.entry
+        encoding, data, etag = asset.select(
+            request.headers.get('Accept-Encoding', ''))
+
+        headers = {
+            'Content-Type': entry.content_type,
+            'ETag': etag,
+            'Last-Modified': formatdate(entry.mtime, usegmt=True),
+            'Cache-Control': self._cache_control(entry),
+            'Vary': 'Accept-Encoding',
+        }
+
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            self.not_modified += 1
+            return Response(status=304, headers=headers)
+
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            return Response(body=data, headers=headers)
+
+        headers['Accept-Ranges'] = 'bytes'
+        size = entry.size if data is None else len(data)
+        status, start, end = 200, 0, size
+
+        if 'Range' in request.headers and \
+                request.headers.get('If-Range', etag) == etag:
+            byte_range = _parse_range(request.headers['Range'], size)
+
+            if byte_range is None:
+                headers['Content-Range'] = 'bytes */{}'.format(size)
+                return Response(status=416, headers=headers)
+            elif byte_range is not Ellipsis:
+                status, (start, end) = 206, byte_range
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                    start, end - 1, size)
+
+        if data is not None:
+            return Response(status=status, body=data[start:end],
+                            headers=headers)
+        else:
+            return (yield from self._sendfile(
+                request, entry, status, headers, start, end - start))
+
+    @asyncio.coroutine
+    def _sendfile(self, request, entry, status, headers, offset, count):
+        response = StreamResponse(status=status)
+
+        for name, value in headers.items():
+            response.headers[name] = value
+
+        response.content_length = count
+        response.start(request)
+        yield from response.drain()  # headers go first
+
+        with open(entry.full_path, 'rb') as f:
+            sock = _sendfile_socket(request.transport)
+
+            if sock is not None:
+                yield from _sendfile(sock, f, offset, count)
+            else:
+                f.seek(offset)
+
+                while count > 0:
+                    chunk = f.read(min(CHUNK_SIZE, count))
+                    if not chunk:
+                        break
+
+                    response.write(chunk)
+                    yield from response.drain()
+                    count -= len(chunk)
+
+        self.sendfile_bytes += response.content_length
+        return response
+
+    def _cache_control(self, entry):
+        # pages are not versioned by url, make browsers revalidate them
+        if entry.content_type == 'text/html':
+            return 'no-cache'
+        else:
+            return 'public, max-age={}'.format(self.max_age)
+
+
+def _sendfile_socket(transport):
+    """ Socket for os.sendfile or None when the transport must be used
+
+    sendfile writes past the transport, so its buffer must be empty
+    (drain() only waits for the low-water mark), or the body overtakes
+    the headers still waiting there.  TLS needs the transport anyway.
+    """
+    if not hasattr(os, 'sendfile') or \
+            transport.get_extra_info('sslcontext') is not None or \
+            transport.get_write_buffer_size():
+        return None
+
+    return transport.get_extra_info('socket')
+
+
+@asyncio.coroutine
+def _sendfile(sock, f, offset, count):
+    # os.sendfile to non-blocking socket, waiting while it is full
+    loop = asyncio.get_event_loop()
+    fd = sock.fileno()
+
+    while count > 0:
+        try:
+            sent = os.sendfile(fd, f.fileno(), offset, count)
+        except (BlockingIOError, InterruptedError):
+            sent = None
+
+        if sent == 0:
+            break  # file is shorter than in the manifest
+        elif sent is None:
+            writable = asyncio.Future(loop=loop)
+            loop.add_writer(
+                fd, lambda: writable.done() or writable.set_result(None))
+
+            try:
+                yield from writable
+            finally:
+                loop.remove_writer(fd)
+        else:
+            offset += sent
+            count -= sent
+
+
+def _parse_range(header, size):
+    """ Return (start, end) for single byte range, None when it is not
+    satisfiable, Ellipsis when the header is ignored (bad or multiple ranges)
+    """
+    match = RANGE_RE.match(header.strip())
+
+    if match is None:
+        return Ellipsis
+
+    first, last = match.groups()
+
+    if not first and not last:
+        return Ellipsis
+    elif not first:
+        start, end = max(0, size - int(last)), size  # suffix: last N bytes
+    else:
+        start = int(first)
+        end = min(size, int(last) + 1) if last else size
+
+    if start >= end:
+        return None
+
+    return start, end
+
+
+def _parse_accept_encoding(header):
+    accepted = set()
+
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+
+        if params in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+
+        accepted.add(encoding.strip().lower())
+
+    return accepted
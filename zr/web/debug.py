@@ -0,0 +1,34 @@
+import asyncio
+
+from aiohttp.web import HTTPNotFound
+from aiotraversal.resources import Root, Resource
+from aiotraversal.views import RESTView
+
+
+class Debug(Resource):
+    pass
+
+
+class LoopDebug(Resource):
+    @asyncio.coroutine
+    def get(self):
+        monitor = self.app.get('loop_monitor')
+
+        if monitor is None:
+            raise HTTPNotFound()
+
+        return monitor.stats()
+
+
+class LoopDebugView(RESTView):
+    methods = {'get'}
+
+    @asyncio.coroutine
+    def get(self):
+        return (yield from self.resource.get())
+
+
+def includeme(app):
+    app.add_child(Root, 'debug', Debug)
+    app.add_child(Debug, 'loop', LoopDebug)
+    app.bind_view(LoopDebug, LoopDebugView)
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from aiohttp.web import Response
+from aiotraversal.resources import Root, Resource
+from aiotraversal.views import MethodsView
+
+from zr.lib import metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    'zr_web_request_seconds', 'Time spent in the view', ['view'])
+
+
+class TimedView:
+    """ Mixin for views, observes REQUEST_SECONDS by the view class
+    """
+    @asyncio.coroutine
+    def __call__(self):
+        start = time.perf_counter()
+
+        try:
+            return (yield from super().__call__())
+        finally:
+            REQUEST_SECONDS.labels(self.__class__.__name__).observe(
+                time.perf_counter() - start)
+
+
+class Metrics(Resource):
+    def exposition(self):
+        return metrics.REGISTRY.exposition()
+
+
+class MetricsView(MethodsView):
+    methods = {'get'}
+
+    @asyncio.coroutine
+    def get(self):
+        return Response(
+            body=self.resource.exposition().encode('utf8'),
+            headers={'Content-Type': metrics.CONTENT_TYPE},
+        )
+
+
+def includeme(app):
+    app.add_child(Root, 'metrics', Metrics)
+    app.bind_view(Metrics, MetricsView)
@@ -1,21 +1,73 @@
+import json
 import asyncio
+import logging
 
+from aiohttp.web import Response, StreamResponse
 from aiohttp.web import HTTPNotFound, HTTPBadRequest
 
 from aiotraversal.resources import Resource, DispatchMixin, InitCoroMixin
-from aiotraversal.views import RESTView
+from aiotraversal.views import MethodsView, RESTView
+
+from zr.mpd_ctrl.commands import add_many
+
+from .assets import etag_matches
+from .metrics import TimedView
+
+log = logging.getLogger(__name__)
 
 
 class MPDBase(Resource):
     def __init__(self, parent, name):
         super().__init__(parent, name)
         self.mpd = self.app['mpd']
+        self.cache = self.app['mpd_cache']
+
+
+class CachedView(RESTView):
+    """ View answering 304 to GET when client has the current version
+    """
+    def cached(self, etag, data):
+        if self.request.method == 'GET' and etag_matches(
+                self.request.headers.get('If-None-Match', ''), etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        return Response(
+            body=json.dumps(data).encode('utf8'),
+            headers={
+                'Content-Type': 'application/json; charset=utf-8',
+                'ETag': etag,
+            },
+        )
 
 
 class MPD(DispatchMixin, MPDBase):
     @asyncio.coroutine
     def get(self):
-        return (yield from self.mpd.get_status())
+        return (yield from self.cache.get_status())
+
+    @property
+    def etag(self):
+        return self.cache.status_etag
+
+    @property
+    def version(self):
+        return self.cache.status_version
+
+    @asyncio.coroutine
+    def wait(self, version):
+        """ Status after a command
+
+        The cache gets a change with the next idle event; a command
+        changing nothing (clear of an empty playlist) sends no event,
+        so the cache is compared with a fresh status first.
+        """
+        if self.cache.live and self.cache.status_version == version:
+            status = yield from self.mpd.get_status()
+
+            if self.cache.is_current(status):
+                return self.cache.status
+
+        return (yield from self.cache.wait_status(version))
 
     @asyncio.coroutine
     def toggle(self):
@@ -34,16 +86,18 @@ class MPD(DispatchMixin, MPDBase):
             return (yield from self.mpd.clear())
 
 
-class MPDView(RESTView):
+class MPDView(TimedView, CachedView):
     methods = {'get', 'post'}
 
     @asyncio.coroutine
     def get(self):
-        return (yield from self.resource.get())
+        data = yield from self.resource.get()
+        return self.cached(self.resource.etag, data)
 
     @asyncio.coroutine
     def post(self):
         action = (yield from self.request.json()).get('action')
+        version = self.resource.version
 
         if action == 'toggle':
             yield from self.resource.toggle()
@@ -56,45 +110,77 @@ class MPDView(RESTView):
         else:
             raise HTTPBadRequest(reason="invalid action")
 
-        return (yield from self.resource.get())
+        data = yield from self.resource.wait(version)
+        return self.cached(self.resource.etag, data)
 
 
 class MPDPlaylist(MPDBase):
     @asyncio.coroutine
     def list(self):
-        return (yield from self.mpd.playlist())
+        return (yield from self.cache.get_playlist())
+
+    @property
+    def etag(self):
+        return self.cache.playlist_etag
 
     @asyncio.coroutine
-    def add(self, url):
-        return (yield from self.mpd.add(url))
+    def add(self, *urls):
+        return (yield from self.mpd.run(add_many, urls))
+
+    @asyncio.coroutine
+    def replace(self, urls):
+        streams = self.app.get('streams')
+
+        if streams is not None:
+            urls = streams.rank(urls, skip_dead=True)
+
+        return (yield from self.mpd.run(add_many, urls, before=[('clear',)]))
 
     @asyncio.coroutine
     def __getchild__(self, name):
         return (yield from MPDSong(self, name))
 
 
-class MPDPlaylistView(RESTView):
-    methods = {'get', 'post'}
+class MPDPlaylistView(TimedView, CachedView):
+    methods = {'get', 'post', 'put'}
 
     @asyncio.coroutine
     def get(self):
-        return (yield from self.resource.list())
+        data = yield from self.resource.list()
+        return self.cached(self.resource.etag, data)
 
     @asyncio.coroutine
     def post(self):
         data = yield from self.request.json()
 
-        if 'file' not in data:
+        if 'file' in data:
+            results = yield from self.resource.add(self._check_url(data['file']))
+            return results[0]
+        elif 'files' in data:
+            return (yield from self.resource.add(*self._get_files(data)))
+        else:
             raise HTTPBadRequest(reason="file not exist in request")
 
-        file = data['file']
+    @asyncio.coroutine
+    def put(self):
+        data = yield from self.request.json()
+        return (yield from self.resource.replace(self._get_files(data)))
+
+    def _get_files(self, data):
+        files = data.get('files')
+
+        if not isinstance(files, list):
+            raise HTTPBadRequest(reason="'files' must be list")
+
+        return [self._check_url(file) for file in files]
 
+    def _check_url(self, file):
         if not isinstance(file, str):
             raise HTTPBadRequest(reason="bad file field type")
         elif not (file.startswith('http://') or file.startswith('https://')):
             raise HTTPBadRequest(reason="'file' must be url")
 
-        return (yield from self.resource.add(file))
+        return file
 
 
 class MPDSong(InitCoroMixin, MPDBase):
@@ -108,28 +194,21 @@ class MPDSong(InitCoroMixin, MPDBase):
 
     @asyncio.coroutine
     def __init_coro__(self):
-        for item in (yield from self.mpd.playlist()):
-            if item['id'] == self.id:
-                break
-        else:
+        self.song = yield from self.cache.get_song(self.id)
+
+        if self.song is None:
             raise HTTPNotFound
 
     @asyncio.coroutine
     def get(self):
-        playlist = yield from self.mpd.playlist()
-
-        for song in playlist:
-            if song['id'] == self.id:
-                return song
-        else:
-            return None
+        return self.song
 
     @asyncio.coroutine
     def play(self):
         return (yield from self.mpd.play(id=self.id))
 
 
-class MPDSongView(RESTView):
+class MPDSongView(TimedView, RESTView):
     methods = {'get', 'put'}
 
     @asyncio.coroutine
@@ -141,10 +220,96 @@ class MPDSongView(RESTView):
         return (yield from self.resource.play())
 
 
+class MPDStreams(MPDBase):
+    @asyncio.coroutine
+    def get(self):
+        streams = self.app.get('streams')
+
+        if streams is None:
+            return []
+
+        return [health._asdict() for health in streams.stats()]
+
+
+class MPDStreamsView(TimedView, RESTView):
+    methods = {'get'}
+
+    @asyncio.coroutine
+    def get(self):
+        return (yield from self.resource.get())
+
+
+class MPDEvents(MPDBase):
+    def subscribe(self):
+        return self.cache.subscribe()
+
+    @asyncio.coroutine
+    def snapshot(self):
+        return [
+            ('status', (yield from self.cache.get_status())),
+            ('playlist', (yield from self.cache.get_playlist())),
+        ]
+
+
+class MPDEventsView(MethodsView):
+    """ Server-Sent Events with changes of status and playlist
+
+    Starts with full `status` and `playlist`, then sends `status_diff`,
+    `volume` and `playlist_diff` from the shared MPDCache watcher.
+    """
+    methods = {'get'}
+    keepalive = 15
+
+    @asyncio.coroutine
+    def get(self):
+        response = StreamResponse()
+        response.headers['Content-Type'] = 'text/event-stream'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.start(self.request)
+
+        # subscribe before the snapshot, so no change is missed
+        subscription = self.resource.subscribe()
+
+        try:
+            events = yield from self.resource.snapshot()
+
+            while True:
+                for name, data in events:
+                    response.write('event: {}\ndata: {}\n\n'.format(
+                        name, json.dumps(data)).encode('utf8'))
+
+                yield from response.drain()
+
+                try:
+                    name, data = yield from asyncio.wait_for(
+                        subscription.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    response.write(b': keepalive\n\n')
+                    events = []
+                    continue
+
+                if name == 'close':
+                    break
+                elif name == 'reset':
+                    events = yield from self.resource.snapshot()
+                else:
+                    events = [(name, data)]
+        except (ConnectionError, RuntimeError) as exc:
+            log.debug('events client gone: {!r}'.format(exc))
+        finally:
+            subscription.close()
+
+        return response
+
+
 def includeme(app):
     app.add_child(app._root_class, 'mpd', MPD)
     app.add_child(MPD, 'playlist', MPDPlaylist)
+    app.add_child(MPD, 'events', MPDEvents)
+    app.add_child(MPD, 'streams', MPDStreams)
 
     app.bind_view(MPD, MPDView)
     app.bind_view(MPDPlaylist, MPDPlaylistView)
     app.bind_view(MPDSong, MPDSongView)
+    app.bind_view(MPDEvents, MPDEventsView)
+    app.bind_view(MPDStreams, MPDStreamsView)
@@ -19,7 +19,7 @@ class SettingsView(RESTView):
     def get(self):
         data = (yield from self.resource.get())
         return {
-            'playlists': data['playlists'],
+            'playlists': data.get('playlists', {}),
         }
 
 
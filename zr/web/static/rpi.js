@@ -16,9 +16,12 @@ rpiApp.controller('MPDCtrl', function ($scope, $resource, $timeout) {
 
     var mpdPlaylist = $resource('/mpd/playlist', {}, {
         list: {isArray: true},
-        add: {method: 'POST', isArray: true}
+        add: {method: 'POST'},
+        replace: {method: 'PUT', isArray: true}
     });
 
+    var events = null;
+
     $scope.statusRefresh = function () {
         var mpdStatus = $resource('/mpd');
         mpdStatus.get(function (res) {
@@ -43,13 +46,65 @@ rpiApp.controller('MPDCtrl', function ($scope, $resource, $timeout) {
         $timeout(function () {$scope.refreshCycle(interval)}, interval);
     }
 
+    $scope.refreshLater = function () {
+        if (events === null) {
+            $timeout($scope.refresh, 1000);
+            $timeout($scope.refresh, 2000);
+            $timeout($scope.refresh, 5000);
+        }
+    }
+
+    $scope.subscribe = function () {
+        events = new EventSource('/mpd/events');
+
+        var on = function (name, callback) {
+            events.addEventListener(name, function (e) {
+                var data = JSON.parse(e.data);
+                $scope.$apply(function () {callback(data)});
+            });
+        }
+
+        on('status', function (data) {
+            $scope.status = data;
+        });
+
+        on('status_diff', function (data) {
+            angular.forEach(data, function (value, key) {
+                if (value === null) {
+                    delete $scope.status[key];
+                } else {
+                    $scope.status[key] = value;
+                }
+            });
+        });
+
+        on('playlist', function (data) {
+            $scope.playlist = data;
+        });
+
+        on('playlist_diff', function (data) {
+            var songs = {};
+
+            $scope.playlist.forEach(function (song) {songs[song.id] = song});
+            data.removed.forEach(function (id) {delete songs[id]});
+            data.changed.forEach(function (song) {songs[song.id] = song});
+
+            $scope.playlist = Object.keys(songs).map(function (id) {
+                return songs[id];
+            }).sort(function (a, b) {return a.pos - b.pos});
+        });
+    }
+
     $scope.sendAction = function (action, callback) {
         if (callback) {
             mpdResource.send({'action': action}, callback);
         } else {
             mpdResource.send({'action': action});
         }
-        $scope.statusRefresh();
+
+        if (events === null) {
+            $scope.statusRefresh();
+        }
     }
 
     $scope.play = function (id) {
@@ -60,31 +115,28 @@ rpiApp.controller('MPDCtrl', function ($scope, $resource, $timeout) {
 
         mpdPlaylistSong.play({action: 'play'}, function () {
             $scope.refresh()
-            $timeout($scope.refresh, 1000);
-            $timeout($scope.refresh, 2000);
-            $timeout($scope.refresh, 5000);
+            $scope.refreshLater();
         });
     }
 
     $scope.add = function(url) {
         mpdPlaylist.add({file: url}, $scope.refresh);
-        $scope.refresh();
         $scope.addNewUrl = '';
     }
 
     $scope.addPlaylist = function(urls) {
-        $scope.sendAction('clear', function () {
-            urls.forEach(function (url) {
-                mpdPlaylist.add({file: url});
-            })
-            $timeout($scope.refresh, 1000);
-            $timeout($scope.refresh, 2000);
-            $timeout($scope.refresh, 5000);
-        })
+        mpdPlaylist.replace({files: urls}, function () {
+            $scope.refresh();
+            $scope.refreshLater();
+        });
+    }
 
+    if (window.EventSource) {
+        $scope.subscribe();
+    } else {
+        $scope.refreshCycle(10000);
     }
 
-    $scope.refreshCycle(10000);
     mpdSettings.get(function (res) {
         $scope.settings = res;
     })